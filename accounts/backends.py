@@ -0,0 +1,27 @@
+from django.conf import settings
+from django.contrib.auth.backends import ModelBackend
+from django.core.cache import cache
+
+from recipes.cache import get_versions
+
+
+class CachedModelBackend(ModelBackend):
+    """
+    ModelBackend that keeps the logged-in user in the cache instead of reading
+    accounts.User on every request. The key carries the user's cache version,
+    bumped by recipes.signals on every save but a last_login update, so profile
+    edits, password changes and deactivations are seen on the next request.
+    """
+
+    def get_user(self, user_id):
+        timeout = settings.AUTH_USER_CACHE_TIMEOUT
+        if not timeout:
+            return super().get_user(user_id)
+
+        key = f'auth:user:{user_id}:{get_versions(("user", user_id))[0]}'
+        user = cache.get(key)
+        if user is None:
+            user = super().get_user(user_id)
+            if user is not None:
+                cache.set(key, user, timeout)
+        return user
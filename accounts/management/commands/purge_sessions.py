@@ -0,0 +1,28 @@
+from django.conf import settings
+from django.contrib.sessions.models import Session
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+
+class Command(BaseCommand):
+    help = 'Delete expired sessions from the database in small batches. Run it daily.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type = int, default = 5000)
+
+    def handle(self, *args, **options):
+        if not settings.SESSION_ENGINE.endswith('db'):
+            # cache and cookie sessions expire on their own
+            self.stdout.write(f'{settings.SESSION_ENGINE} keeps no sessions in the database, nothing to purge.')
+            return
+
+        # clearsessions deletes every expired row in one statement, locking the table for as long;
+        # batches on the expire_date index keep each transaction short
+        now = timezone.now()
+        purged = 0
+        while True:
+            keys = list(Session.objects.filter(expire_date__lt = now).values_list('session_key', flat = True)[:options['batch_size']])
+            if not keys:
+                break
+            purged += Session.objects.filter(session_key__in = keys).delete()[0]
+        self.stdout.write(self.style.SUCCESS(f'Purged {purged} expired sessions.'))
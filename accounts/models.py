@@ -4,6 +4,7 @@ from django.db import models
 class User(AbstractUser):
     bio = models.TextField(blank = True, max_length = 300)
     profile_pic = models.ImageField(upload_to = 'profiles/', blank = True, null = True)
+    profile_pic_variants = models.JSONField(default = dict, blank = True, editable = False)
     is_verified = models.BooleanField(default = False)
     created_at = models.DateTimeField(auto_now_add = True)
 
@@ -1,3 +1,58 @@
-from django.test import TestCase
+from datetime import timedelta
+from io import StringIO
 
-# Create your tests here.
+from django.contrib.sessions.models import Session
+from django.core.cache import cache
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from accounts.models import User
+from recipes.tests import make_recipe
+
+
+@override_settings(
+    SECURE_SSL_REDIRECT = False, SESSION_ENGINE = 'django.contrib.sessions.backends.cached_db', AUTH_USER_CACHE_TIMEOUT = 300,
+)
+class SessionAuthTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username = 'reader', password = 'correct horse')
+        make_recipe(cls.user)
+
+    def setUp(self):
+        cache.clear()
+        self.client.force_login(self.user)
+
+    def test_logged_in_feed_reads_neither_session_nor_user_table(self):
+        self.client.get(reverse('home_page'))
+
+        # before: the feed query plus a session SELECT and a user SELECT
+        with self.assertNumQueries(1):
+            response = self.client.get(reverse('home_page'))
+        self.assertEqual(response.context['user'], self.user)
+
+    def test_profile_edits_and_deactivation_are_seen_on_the_next_request(self):
+        self.client.get(reverse('home_page'))
+        self.client.post(reverse('edit_profile'), {'email': 'reader@example.com', 'bio': 'Cooks on weekends'})
+
+        self.assertEqual(self.client.get(reverse('home_page')).context['user'].bio, 'Cooks on weekends')
+
+        self.user.is_active = False
+        self.user.save()
+        self.assertFalse(self.client.get(reverse('home_page')).context['user'].is_authenticated)
+
+    @override_settings(SESSION_ENGINE = 'django.contrib.sessions.backends.db')
+    def test_purge_sessions_deletes_expired_sessions_in_batches(self):
+        now = timezone.now()
+        Session.objects.bulk_create([
+            Session(session_key = f'expired{i}', session_data = '', expire_date = now - timedelta(days = 1)) for i in range(5)
+        ] + [Session(session_key = 'current', session_data = '', expire_date = now + timedelta(days = 1))])
+        out = StringIO()
+
+        call_command('purge_sessions', batch_size = 2, stdout = out)
+
+        self.assertIn('Purged 5 expired sessions', out.getvalue())
+        self.assertEqual(Session.objects.filter(expire_date__lt = now).count(), 0)
+        self.assertTrue(Session.objects.filter(session_key = 'current').exists())
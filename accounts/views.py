@@ -2,9 +2,18 @@ from django.shortcuts import render,redirect, get_object_or_404
 from django.contrib.auth import login, authenticate, logout
 from django.contrib.auth.decorators import login_required
 from django.contrib import messages
+from django.db import transaction
 
 from accounts.models import User
 from accounts.forms import ProfileForm
+from recipes.cache import cache_page_for_anonymous, conditional_page, get_versions
+from recipes.models import Recipe
+from recipes.pagination import CursorPaginator, capped_count
+from recipes.tasks import stage_upload
+from recipeshare.routers import read_from_replica
+
+# recipe counts in profile headings stop here, "100+" instead of counting a prolific author's every recipe
+PROFILE_COUNT_LIMIT = 100
 
 def registerView(request):
     if request.user.is_authenticated:
@@ -72,15 +81,20 @@ def logoutView(request):
     return redirect('home_page')
 
 
+@read_from_replica
 @login_required
 def profileView(request):
     user = request.user
-    recipes = user.recipes.all()
+    recipes = Recipe.objects.feed().filter(author = user)
+    page_obj = CursorPaginator(recipes, 9).get_page(request.GET.get('cursor'))
+    total_recipes, more_recipes = capped_count(recipes, PROFILE_COUNT_LIMIT, page_obj)
 
     context = {
         'user': user,
-        'recipes': recipes,
-        'total_recipes': recipes.count(),
+        'recipes': page_obj,
+        'page_obj': page_obj,
+        'total_recipes': total_recipes,
+        'more_recipes': more_recipes,
     }
 
     return render(request, 'accounts/profile.html', context)
@@ -90,10 +104,20 @@ def profileView(request):
 def editProfileView(request):
     
     if request.method == 'POST':
+        current_pic = request.user.profile_pic.name
         profile_form = ProfileForm(request.POST, request.FILES, instance = request.user)
 
         if profile_form.is_valid():
-            profile_form.save()
+            user = profile_form.save(commit = False)
+            upload = profile_form.cleaned_data['profile_pic'] if 'profile_pic' in profile_form.changed_data else None
+            with transaction.atomic():
+                if upload:
+                    # stored by the background worker, the current picture stays until then
+                    user.profile_pic = current_pic
+                    user.save()
+                    stage_upload(user, 'profile_pic', upload)
+                else:
+                    user.save()
             messages.success(request, 'Profile Successfully Updated')
             return redirect('profile')
     else:
@@ -101,14 +125,26 @@ def editProfileView(request):
     
     return render(request, 'accounts/edit_profile.html', {'form' : profile_form})
 
+def publicProfileState(request, username):
+    # the recipe, review and user signals bump the profile's version on every change it shows
+    pk = User.objects.filter(username = username).values_list('pk', flat = True).first()
+    return pk and (pk, get_versions(('profile', username)))
+
+@read_from_replica
+@conditional_page(publicProfileState)
+@cache_page_for_anonymous(lambda request, username: [('profile', username)])
 def publicProfileView(request, username):
     user = get_object_or_404(User, username = username)
-    user_recipes = user.recipes.all()
+    user_recipes = Recipe.objects.feed().filter(author = user)
+    page_obj = CursorPaginator(user_recipes, 9).get_page(request.GET.get('cursor'))
+    total_recipes, more_recipes = capped_count(user_recipes, PROFILE_COUNT_LIMIT, page_obj)
 
     context = {
         'profile_user': user,
-        'recipes': user_recipes,
-        'total_recipes': user_recipes.count(),
+        'recipes': page_obj,
+        'page_obj': page_obj,
+        'total_recipes': total_recipes,
+        'more_recipes': more_recipes,
         'is_own_profile': request.user == user,
     }
     
@@ -0,0 +1,89 @@
+"""
+Cost of 100 recipes as JSON from the API vs the same recipes as HTML feed
+pages, plus the serialization step alone: .values() rows vs model instances.
+
+    python -m benchmarks.api --recipes 5000 --repeat 30
+"""
+import argparse
+import json
+import math
+
+from benchmarks.common import setup_django, summarize, timed
+
+PER_PAGE = 9
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--recipes', type = int, default = 5000)
+    parser.add_argument('--repeat', type = int, default = 30)
+    parser.add_argument('--database-url')
+    args = parser.parse_args()
+
+    connection = setup_django(args.database_url)
+
+    from django.core.serializers.json import DjangoJSONEncoder
+    from django.test import Client
+    from django.test.utils import setup_test_environment
+    from django.urls import reverse
+
+    from benchmarks.datagen import seed_recipes, seed_reviews, seed_users
+    from recipes.api import RECIPE_DEFAULT_FIELDS, RECIPE_FIELDS, fetch
+    from recipes.models import Recipe
+
+    setup_test_environment()
+    users = seed_users(200)
+    seed_recipes(args.recipes, users)
+    seed_reviews(args.recipes * 2, users)
+
+    # logged in, so neither side is answered from the page cache
+    client = Client()
+    client.force_login(users[0])
+    results = {'vendor': connection.vendor, 'recipes_per_sample': 100, 'http': {}, 'serialization': {}}
+
+    def http(fetch_pages):
+        sizes = []
+        def run():
+            sizes.append(fetch_pages())
+        samples = timed(run, args.repeat)
+        return {**summarize(samples), 'bytes': sizes[-1]}
+
+    def api_pages():
+        return len(client.get(reverse('api_recipes'), {'limit': 100}, secure = True).content)
+
+    def api_sparse():
+        return len(client.get(reverse('api_recipes'), {'limit': 100, 'fields': 'id,title,rating_avg'}, secure = True).content)
+
+    def html_pages():
+        # 100 recipes is 12 feed pages of 9, followed by their Next cursors
+        total, cursor = 0, None
+        for _ in range(math.ceil(100 / PER_PAGE)):
+            response = client.get(reverse('home_page'), {'cursor': cursor} if cursor else {}, secure = True)
+            total += len(response.content)
+            cursor = response.context['page_obj'].next_cursor
+        return total
+
+    results['http']['api_default_fields'] = http(api_pages)
+    results['http']['api_sparse_fields'] = http(api_sparse)
+    results['http']['html_feed'] = http(html_pages)
+
+    def values_path():
+        rows, shape = fetch(Recipe.objects.order_by('-created_at', '-id')[:100], RECIPE_FIELDS, RECIPE_DEFAULT_FIELDS)
+        return json.dumps([shape(row) for row in rows], cls = DjangoJSONEncoder)
+
+    def instance_path():
+        recipes = Recipe.objects.select_related('author').order_by('-created_at', '-id')[:100]
+        return json.dumps([
+            {name: (recipe.author.username if name == 'author' else getattr(recipe, name)) for name in RECIPE_DEFAULT_FIELDS if name != 'image'}
+            | {'image': recipe.image.url if recipe.image else None}
+            for recipe in recipes
+        ], cls = DjangoJSONEncoder)
+
+    results['serialization']['values'] = summarize(timed(values_path, args.repeat))
+    results['serialization']['model_instances'] = summarize(timed(instance_path, args.repeat))
+
+    print(json.dumps(results, indent = 2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,155 @@
+"""
+Throughput of the same app under gunicorn's sync WSGI workers and under
+uvicorn ASGI workers, with the same number of workers and the same
+concurrent load over real HTTP: the feed, recipe pages and the JSON API.
+
+    python -m benchmarks.asgi --workers 2 --concurrency 32 --duration 15
+    python -m benchmarks.asgi --cache-latency 3 --database-url postgres://localhost/recipeshare
+
+--cache-latency adds a sleep to every cache call, standing in for a cache
+server across the network, which is where async views stop pinning a worker.
+"""
+import argparse
+import json
+import os
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+from benchmarks.common import BASE_DIR, setup_django, summarize
+
+SERVERS = {
+    'wsgi': ['recipeshare.wsgi:application', '-k', 'sync'],
+    'asgi': ['recipeshare.asgi:application', '-k', 'uvicorn_worker.UvicornWorker'],
+}
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def start_server(mode, workers, env):
+    port = free_port()
+    process = subprocess.Popen(
+        [sys.executable, '-m', 'gunicorn', *SERVERS[mode], '--workers', str(workers), '--bind', f'127.0.0.1:{port}', '--log-level', 'warning'],
+        cwd = BASE_DIR,
+        env = env,
+    )
+    deadline = time.monotonic() + 30
+    while time.monotonic() < deadline:
+        try:
+            socket.create_connection(('127.0.0.1', port), timeout = 1).close()
+            return process, f'http://127.0.0.1:{port}'
+        except OSError:
+            time.sleep(0.2)
+    process.kill()
+    raise RuntimeError(f'{mode} server did not start')
+
+
+def load(base_url, paths, concurrency, duration, seed):
+    import requests
+
+    samples, errors = [], []
+    deadline = time.monotonic() + duration
+
+    def client(index):
+        rng = random.Random(seed + index)
+        session = requests.Session()
+        while time.monotonic() < deadline:
+            path = rng.choice(paths)
+            start = time.perf_counter()
+            try:
+                response = session.get(base_url + path, timeout = 30)
+                ok = response.status_code == 200
+            except requests.RequestException:
+                ok = False
+            elapsed = (time.perf_counter() - start) * 1000
+            # list.append is atomic, no lock needed
+            (samples if ok else errors).append(elapsed)
+
+    threads = [threading.Thread(target = client, args = (index,)) for index in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return samples, errors
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--workers', type = int, default = 2)
+    parser.add_argument('--concurrency', type = int, default = 32)
+    parser.add_argument('--duration', type = float, default = 10, help = 'seconds of load per server')
+    parser.add_argument('--warmup', type = float, default = 2)
+    parser.add_argument('--recipes', type = int, default = 2000)
+    parser.add_argument('--cache-latency', type = float, default = 0, help = 'ms added to every cache call')
+    parser.add_argument('--only', nargs = '*', choices = list(SERVERS))
+    parser.add_argument('--seed', type = int, default = 0)
+    parser.add_argument('--database-url')
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix = 'recipeshare-asgi-')
+    connection = setup_django(args.database_url, test_name = os.path.join(workdir, 'benchmark.sqlite3'))
+
+    from django.urls import reverse
+
+    from benchmarks.datagen import seed_recipes, seed_reviews, seed_users
+    from recipes.models import Recipe
+
+    users = seed_users(200)
+    seed_recipes(args.recipes, users)
+    seed_reviews(args.recipes * 2, users)
+
+    ids = list(Recipe.objects.order_by('pk').values_list('pk', flat = True))
+    sample = random.Random(args.seed).sample(ids, min(50, len(ids)))
+    paths = [reverse('home_page'), reverse('api_recipes')]
+    paths += [reverse('recipe_detail', args = [pk]) for pk in sample]
+    paths += [reverse('api_recipe', args = [pk]) for pk in sample]
+
+    database = {key: connection.settings_dict[key] for key in ('ENGINE', 'NAME', 'USER', 'PASSWORD', 'HOST', 'PORT')}
+    database['CONN_MAX_AGE'] = 600
+    connection.close()
+    env = {
+        **os.environ,
+        'DJANGO_SETTINGS_MODULE': 'benchmarks.server_settings',
+        'BENCHMARK_DATABASE': json.dumps(database, default = str),
+        'BENCHMARK_CACHE_LATENCY': str(args.cache_latency),
+        # gunicorn.conf.py would otherwise restart workers partway through a run
+        'GUNICORN_MAX_REQUESTS': '0',
+    }
+
+    results = {
+        'vendor': connection.vendor,
+        'workers': args.workers,
+        'concurrency': args.concurrency,
+        'cache_latency_ms': args.cache_latency,
+        'servers': {},
+    }
+    try:
+        for mode in args.only or SERVERS:
+            process, base_url = start_server(mode, args.workers, env)
+            try:
+                load(base_url, paths, args.concurrency, args.warmup, args.seed)
+                samples, errors = load(base_url, paths, args.concurrency, args.duration, args.seed)
+            finally:
+                process.terminate()
+                process.wait()
+            results['servers'][mode] = {
+                'requests_per_second': round(len(samples) / args.duration, 1),
+                'errors': len(errors),
+                **(summarize(samples) if samples else {}),
+            }
+    finally:
+        connection.creation.destroy_test_db(verbosity = 0)
+
+    print(json.dumps(results, indent = 2))
+
+
+if __name__ == '__main__':
+    main()
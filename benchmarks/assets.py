@@ -0,0 +1,122 @@
+"""
+Page weight and a modelled first render of a page's render-blocking assets:
+the old runtime CDN setup (Tailwind's browser build from jsDelivr, Font
+Awesome 4.7 from cdnjs) vs the self-hosted build from `build_assets`, as
+collectstatic precompresses and WhiteNoise serves it.
+
+    python -m benchmarks.assets
+    python -m benchmarks.assets --skip-build
+
+First render is modelled, not measured: the longest chain of round trips (a
+new origin costs DNS + TCP + TLS, three of them) plus every byte over the
+link. The CDN numbers leave out compiling the stylesheet in the browser, so
+they are a lower bound.
+"""
+import argparse
+import gzip
+import json
+import tempfile
+import time
+import urllib.request
+from pathlib import Path
+
+import brotli
+
+from benchmarks.common import setup_django
+
+TAILWIND_CDN = 'https://cdn.jsdelivr.net/npm/@tailwindcss/browser@4'
+
+# (round trip ms, Mbit/s), slow 4G as Lighthouse throttles it
+PROFILES = {'slow_4g': (150, 1.6), 'broadband': (20, 50)}
+NEW_ORIGIN_RTTS = 3
+
+
+def sizes(raw):
+    compressed = len(brotli.compress(raw, quality = 11))
+    return {'raw': len(raw), 'gzip': len(gzip.compress(raw, 9)), 'brotli': compressed, 'wire': compressed}
+
+
+def font_sizes(path):
+    # woff2 is brotli inside already, it goes over the wire as is
+    return {'raw': path.stat().st_size, 'wire': path.stat().st_size}
+
+
+def fetch(url):
+    request = urllib.request.Request(url, headers = {'User-Agent': 'benchmarks.assets'})
+    try:
+        with urllib.request.urlopen(request, timeout = 10) as response:
+            return response.read()
+    except OSError as error:
+        return error
+
+
+def first_render_ms(chains, wire_bytes, profile):
+    rtt, mbps = PROFILES[profile]
+    return round(max(chains) * rtt + wire_bytes * 8 / (mbps * 1000), 1)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--skip-build', action = 'store_true', help = 'Measure the committed static/ files without rebuilding them.')
+    args = parser.parse_args()
+
+    setup_django()
+
+    from django.conf import settings
+    from django.core.management import call_command
+    from xstatic.pkg import font_awesome
+
+    from recipes.assets import ICON_FONT, STYLESHEET, build_assets
+
+    results = {}
+    if not args.skip_build:
+        start = time.perf_counter()
+        build_assets()
+        results['build_s'] = round(time.perf_counter() - start, 2)
+
+    with tempfile.TemporaryDirectory() as static_root:
+        settings.STATIC_ROOT = static_root
+        settings.STORAGES = {**settings.STORAGES, 'staticfiles': {'BACKEND': 'whitenoise.storage.CompressedManifestStaticFilesStorage'}}
+        call_command('collectstatic', '--no-input', verbosity = 0)
+        manifest = json.loads((Path(static_root) / 'staticfiles.json').read_text())['paths']
+        stylesheet = Path(static_root) / manifest[str(STYLESHEET)]
+        # the precompressed copies WhiteNoise serves
+        served = {encoding: Path(f'{stylesheet}.{suffix}').stat().st_size for encoding, suffix in (('gzip', 'gz'), ('brotli', 'br'))}
+        self_hosted = {
+            manifest[str(STYLESHEET)]: {'raw': stylesheet.stat().st_size, **served, 'wire': served['brotli']},
+            manifest[f'{ICON_FONT}.woff2']: font_sizes(Path(static_root) / manifest[f'{ICON_FONT}.woff2']),
+        }
+
+    # cdnjs serves the same files XStatic ships
+    font_awesome_dir = Path(font_awesome.BASE_DIR)
+    cdn = {
+        'cdnjs: font-awesome.min.css': sizes((font_awesome_dir / 'css' / 'font-awesome.min.css').read_bytes()),
+        'cdnjs: fontawesome-webfont.woff2': font_sizes(font_awesome_dir / 'fonts' / 'fontawesome-webfont.woff2'),
+    }
+    tailwind = fetch(TAILWIND_CDN)
+    if isinstance(tailwind, bytes):
+        cdn['jsdelivr: @tailwindcss/browser@4'] = sizes(tailwind)
+    else:
+        results['tailwind_cdn_error'] = str(tailwind)
+
+    cdn_wire = sum(asset['wire'] for asset in cdn.values())
+    self_wire = sum(asset['wire'] for asset in self_hosted.values())
+    # CDN: script and stylesheet each open an origin, the font waits for the stylesheet.
+    # Self-hosted: the HTML's connection is reused, the font is preloaded next to the stylesheet
+    cdn_chains = [NEW_ORIGIN_RTTS + 1, NEW_ORIGIN_RTTS + 1 + 1]
+    self_chains = [1, 1]
+
+    results['cdn'] = {'assets': cdn, 'requests': len(cdn), 'third_party_origins': 2, 'wire_bytes': cdn_wire}
+    results['self_hosted'] = {'assets': self_hosted, 'requests': len(self_hosted), 'third_party_origins': 0, 'wire_bytes': self_wire}
+    results['modelled_first_render_ms'] = {
+        profile: {'cdn': first_render_ms(cdn_chains, cdn_wire, profile), 'self_hosted': first_render_ms(self_chains, self_wire, profile)}
+        for profile in PROFILES
+    }
+    if 'tailwind_cdn_error' in results:
+        results['note'] = 'CDN totals leave out the unreachable Tailwind browser build'
+
+    print(json.dumps(results, indent = 2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,65 @@
+"""
+Typeahead lookups from the in-process prefix index vs the cold-path
+database query, plus the index's build time and memory at each size.
+
+    python -m benchmarks.autocomplete --sizes 10000 100000
+    python -m benchmarks.autocomplete --database-url postgres://localhost/recipeshare
+"""
+import argparse
+import json
+
+from benchmarks.common import setup_django, summarize, timed
+
+# what a user types, one keystroke at a time
+PREFIXES = ['p', 'pa', 'pan', 'pane', 'm', 'ma', 'mas', 'spicy c', 'g', 'ga', 'gar', 'cr', 'crea', 'q', 'qui']
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--sizes', type = int, nargs = '+', default = [10000, 100000])
+    parser.add_argument('--repeat', type = int, default = 50)
+    parser.add_argument('--limit', type = int, default = 8)
+    parser.add_argument('--database-url')
+    args = parser.parse_args()
+
+    connection = setup_django(args.database_url)
+
+    from benchmarks.datagen import seed_recipes, seed_users
+    from recipes.autocomplete import PrefixIndex, database_suggestions
+    from recipes.ingredients import sync_ingredients
+    from recipes.models import Recipe
+
+    authors = seed_users(200)
+    results = {'vendor': connection.vendor, 'prefixes': len(PREFIXES), 'sizes': {}}
+
+    for size in sorted(args.sizes):
+        seed_recipes(size, authors)
+        # bulk_create skipped the ingredient parsing, the index reads Ingredient names
+        sync_ingredients(Recipe.objects.filter(recipe_ingredients__isnull = True).only('ingredients_list'))
+
+        index = PrefixIndex()
+        builds = timed(index.build, 3)
+
+        def from_index():
+            for prefix in PREFIXES:
+                index.suggest(prefix, args.limit)
+
+        def from_database():
+            for prefix in PREFIXES:
+                recipes, ingredients = database_suggestions(prefix, args.limit)
+                list(recipes), list(ingredients)
+
+        per_lookup = lambda samples: [sample / len(PREFIXES) for sample in samples]
+        results['sizes'][size] = {
+            'index': {**index.stats, 'build_ms': summarize(builds)['p50_ms']},
+            'lookup_ms': {
+                'index': summarize(per_lookup(timed(from_index, args.repeat))),
+                'database': summarize(per_lookup(timed(from_database, args.repeat))),
+            },
+        }
+
+    print(json.dumps(results, indent = 2))
+
+
+if __name__ == '__main__':
+    main()
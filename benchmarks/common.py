@@ -0,0 +1,54 @@
+import os
+import statistics
+import sys
+import time
+from pathlib import Path
+
+BASE_DIR = Path(__file__).resolve().parent.parent
+
+
+def setup_django(database_url = None, test_name = None):
+    # benchmarks always run against a throwaway test database, never db.sqlite3.
+    # test_name gives SQLite a file other processes can open instead of :memory:
+    sys.path.insert(0, str(BASE_DIR))
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'recipeshare.settings')
+    os.environ.setdefault('SECRET_KEY', 'benchmark-only-secret-key')
+
+    import django
+    import dj_database_url
+    from django.conf import settings
+
+    if database_url:
+        settings.DATABASES = {'default': dj_database_url.parse(database_url)}
+    if test_name:
+        settings.DATABASES['default']['TEST'] = {'NAME': test_name}
+    django.setup()
+
+    from django.db import connection
+
+    connection.creation.create_test_db(verbosity = 0, autoclobber = True)
+    return connection
+
+
+def timed(func, repeat):
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        samples.append((time.perf_counter() - start) * 1000)
+    return samples
+
+
+def percentile(samples, pct):
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, round(pct / 100 * (len(ordered) - 1)))
+    return ordered[index]
+
+
+def summarize(samples):
+    return {
+        'p50_ms': round(statistics.median(samples), 3),
+        'p95_ms': round(percentile(samples, 95), 3),
+        'p99_ms': round(percentile(samples, 99), 3),
+        'runs': len(samples),
+    }
@@ -0,0 +1,109 @@
+import random
+from io import StringIO
+
+INGREDIENTS = [
+    'Rice', 'Paneer', 'Peas', 'Onion', 'Tomato', 'Garlic', 'Ginger', 'Green Chilli', 'Potato', 'Cauliflower',
+    'Spinach', 'Chickpeas', 'Lentils', 'Basmati Rice', 'Curd', 'Butter', 'Ghee', 'Cream', 'Milk', 'Sugar',
+    'Salt', 'Turmeric', 'Cumin Seeds', 'Coriander Powder', 'Garam Masala', 'Red Chilli Powder', 'Mustard Seeds',
+    'Curry Leaves', 'Coconut', 'Cashews', 'Flour', 'Semolina', 'Chicken', 'Eggs', 'Mushroom', 'Capsicum',
+    'Carrot', 'Beans', 'Lemon', 'Coriander Leaves', 'Mint', 'Cardamom', 'Cinnamon', 'Bay Leaf', 'Oil',
+]
+UNITS = ['gm', 'kg', 'ml', 'cup', 'cups', 'tbsp', 'tsp', 'pinch', 'medium', 'large']
+DISHES = ['Curry', 'Masala', 'Biryani', 'Pulao', 'Tikka', 'Korma', 'Sabzi', 'Dal', 'Paratha', 'Soup', 'Salad', 'Halwa']
+ADJECTIVES = ['Spicy', 'Creamy', 'Classic', 'Quick', 'Homestyle', 'Smoky', 'Tangy', 'Crispy', 'Royal', 'Simple']
+STEPS = [
+    'Wash and soak the {0} for twenty minutes.',
+    'Heat oil in a pan and add the {0}.',
+    'Saute the {0} until golden brown.',
+    'Add the {0} and cook on a low flame.',
+    'Mix in the {0} and simmer for ten minutes.',
+    'Garnish with {0} and serve hot.',
+]
+
+
+def recipe_fields(rng):
+    ingredients = rng.sample(INGREDIENTS, rng.randint(4, 10))
+    lines = [f'{name} - {rng.randint(1, 500)}{rng.choice(UNITS)}' for name in ingredients]
+    title = f'{rng.choice(ADJECTIVES)} {ingredients[0]} {rng.choice(DISHES)}'
+    return {
+        'title': title[:100],
+        'image': 'recipe_images/placeholder.jpg',
+        'small_description': f'A {title.lower()} made with {", ".join(ingredients[1:4]).lower()}.',
+        'estimated_prep_time': f'{rng.randint(10, 90)} Minutes',
+        'ingredients_list': '\n'.join(lines),
+        'process': '\n'.join(rng.choice(STEPS).format(name.lower()) for name in ingredients),
+    }
+
+
+def seed_users(count, prefix = 'user', seed = 0):
+    from accounts.models import User
+
+    existing = User.objects.filter(username__startswith = prefix).count()
+    User.objects.bulk_create(
+        [User(username = f'{prefix}{i:07d}', email = f'{prefix}{i}@example.com') for i in range(existing, count)],
+        batch_size = 1000,
+    )
+    return list(User.objects.filter(username__startswith = prefix).order_by('pk'))
+
+
+def seed_recipes(count, authors, seed = 0, batch_size = 2000):
+    # bulk_create skips signals, so the search index is rebuilt once at the end
+    from recipes.models import Recipe
+    from recipes.search import rebuild_index
+
+    rng = random.Random(seed)
+    existing = Recipe.objects.count()
+    batch = []
+    for i in range(existing, count):
+        batch.append(Recipe(author = authors[i % len(authors)], **recipe_fields(rng)))
+        if len(batch) >= batch_size:
+            Recipe.objects.bulk_create(batch)
+            batch = []
+    if batch:
+        Recipe.objects.bulk_create(batch)
+    rebuild_index()
+
+
+REVIEWS = [
+    'Turned out great, the whole family loved it.',
+    'A little too spicy for us, will use less chilli next time.',
+    'Easy to follow and ready in no time.',
+    'Needed more salt but otherwise perfect.',
+    'My go-to recipe for weekend lunches now.',
+    'The {0} really makes this dish.',
+    'Tried it twice, second time even better with extra {0}.',
+]
+
+
+def seed_reviews(count, users, seed = 0, batch_size = 2000):
+    # bulk_create skips the rating signals, so the stored aggregates and rankings are recomputed at the end
+    from django.core.management import call_command
+    from recipes.models import Recipe, Review
+
+    rng = random.Random(seed)
+    recipes = list(Recipe.objects.values_list('pk', 'author_id'))
+    existing = Review.objects.count()
+    seen = set(Review.objects.values_list('recipe_id', 'reviewer_id'))
+    batch = []
+    attempts = 0
+    while existing + len(batch) < count and attempts < count * 5:
+        attempts += 1
+        recipe_id, author_id = rng.choice(recipes)
+        reviewer = rng.choice(users)
+        if reviewer.pk == author_id or (recipe_id, reviewer.pk) in seen:
+            continue
+        seen.add((recipe_id, reviewer.pk))
+        batch.append(Review(
+            recipe_id = recipe_id,
+            reviewer = reviewer,
+            rating = rng.choices([1, 2, 3, 4, 5], weights = [1, 2, 4, 8, 6])[0],
+            review = rng.choice(REVIEWS).format(rng.choice(INGREDIENTS).lower()),
+        ))
+        if len(batch) >= batch_size:
+            Review.objects.bulk_create(batch)
+            existing += len(batch)
+            batch = []
+    if batch:
+        Review.objects.bulk_create(batch)
+    call_command('recompute_ratings', verbosity = 0, stdout = StringIO())
+    call_command('refresh_rankings', verbosity = 0, stdout = StringIO())
@@ -0,0 +1,67 @@
+"""
+Overhead of RequestMetricsMiddleware: the same pages with REQUEST_METRICS on
+and off, requests interleaved so both sides see the same machine noise.
+
+    python -m benchmarks.instrumentation --repeat 300
+"""
+import argparse
+import json
+import time
+
+from benchmarks.common import setup_django, summarize
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--recipes', type = int, default = 2000)
+    parser.add_argument('--repeat', type = int, default = 200)
+    parser.add_argument('--database-url')
+    args = parser.parse_args()
+
+    connection = setup_django(args.database_url)
+
+    from django.conf import settings
+    from django.test import Client
+    from django.test.utils import setup_test_environment
+    from django.urls import reverse
+
+    from benchmarks.datagen import seed_recipes, seed_reviews, seed_users
+    from recipes.models import Recipe
+
+    setup_test_environment()
+    users = seed_users(100)
+    seed_recipes(args.recipes, users)
+    seed_reviews(args.recipes * 3, users)
+    recipe_id = Recipe.objects.order_by('-rating_count').values_list('pk', flat = True).first()
+
+    # logged in, so the page cache is bypassed and every request does the full work
+    clients = {}
+    for enabled in (False, True):
+        settings.REQUEST_METRICS = enabled
+        clients[enabled] = Client()
+        # the handler builds its middleware chain lazily, build it while the setting applies
+        clients[enabled].handler.load_middleware()
+        clients[enabled].force_login(users[0])
+
+    results = {'vendor': connection.vendor, 'pages': {}}
+    for name, path in (('home', reverse('home_page')), ('recipe_detail', reverse('recipe_detail', args = [recipe_id]))):
+        samples = {False: [], True: []}
+        for _ in range(args.repeat):
+            for enabled, client in clients.items():
+                start = time.perf_counter()
+                client.get(path, secure = True)
+                samples[enabled].append((time.perf_counter() - start) * 1000)
+
+        off, on = summarize(samples[False]), summarize(samples[True])
+        results['pages'][name] = {
+            'disabled': off,
+            'enabled': on,
+            'overhead_p50_ms': round(on['p50_ms'] - off['p50_ms'], 3),
+            'overhead_p50_pct': round((on['p50_ms'] - off['p50_ms']) / off['p50_ms'] * 100, 1),
+        }
+
+    print(json.dumps(results, indent = 2))
+
+
+if __name__ == '__main__':
+    main()
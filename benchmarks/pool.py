@@ -0,0 +1,159 @@
+"""
+Throughput and PostgreSQL connection counts under concurrent load over real
+HTTP, for the same gunicorn server with a persistent connection per thread
+(CONN_MAX_AGE=600, production without DATABASE_POOL), a new connection per
+request (CONN_MAX_AGE=0) and a psycopg 3 pool per worker (DATABASE_POOL).
+
+    python -m benchmarks.pool --database-url postgres://localhost/recipeshare
+    python -m benchmarks.pool --database-url postgres://localhost/recipeshare --workers 4 --concurrency 64 --pool-max-size 4
+
+Connections are sampled from pg_stat_activity while the load runs;
+connections_opened comes from pg_stat_database.sessions (PostgreSQL 14+).
+"""
+import argparse
+import json
+import os
+import random
+import threading
+import time
+
+from benchmarks.asgi import SERVERS, load, start_server
+from benchmarks.common import setup_django, summarize
+
+
+def modes(args):
+    return {
+        'persistent': {'CONN_MAX_AGE': 600, 'CONN_HEALTH_CHECKS': True},
+        'per_request': {'CONN_MAX_AGE': 0, 'CONN_HEALTH_CHECKS': False},
+        'pool': {
+            'CONN_MAX_AGE': 0,
+            'CONN_HEALTH_CHECKS': True,
+            'OPTIONS': {'pool': {'min_size': args.pool_min_size, 'max_size': args.pool_max_size, 'timeout': 30}},
+        },
+    }
+
+
+class ConnectionSampler:
+    """Counts the benchmark database's server connections every `interval` seconds on its own thread."""
+
+    def __init__(self, database, interval = 0.05):
+        import psycopg
+
+        self.connection = psycopg.connect(
+            dbname = database['NAME'], user = database['USER'] or None, password = database['PASSWORD'] or None,
+            host = database['HOST'] or None, port = database['PORT'] or None, autocommit = True,
+        )
+        self.name = database['NAME']
+        self.interval = interval
+        self.samples = []
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target = self.run, daemon = True)
+
+    def count(self):
+        return self.connection.execute(
+            'SELECT count(*) FROM pg_stat_activity WHERE datname = %s AND pid <> pg_backend_pid()', [self.name],
+        ).fetchone()[0]
+
+    def sessions(self):
+        try:
+            return self.connection.execute('SELECT sessions FROM pg_stat_database WHERE datname = %s', [self.name]).fetchone()[0]
+        except Exception:
+            return None
+
+    def run(self):
+        while not self.stopped.wait(self.interval):
+            self.samples.append(self.count())
+
+    def __enter__(self):
+        self.sessions_before = self.sessions()
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.stopped.set()
+        self.thread.join()
+        after = self.sessions()
+        self.opened = None if after is None or self.sessions_before is None else after - self.sessions_before
+        self.connection.close()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--database-url', required = True, help = 'a PostgreSQL server, the benchmark creates and drops its own database')
+    parser.add_argument('--server', choices = list(SERVERS), default = 'asgi')
+    parser.add_argument('--workers', type = int, default = 2)
+    parser.add_argument('--concurrency', type = int, default = 32)
+    parser.add_argument('--duration', type = float, default = 10, help = 'seconds of load per mode')
+    parser.add_argument('--warmup', type = float, default = 2)
+    parser.add_argument('--recipes', type = int, default = 2000)
+    parser.add_argument('--pool-min-size', type = int, default = 2)
+    parser.add_argument('--pool-max-size', type = int, default = 8)
+    parser.add_argument('--only', nargs = '*', choices = ['persistent', 'per_request', 'pool'])
+    parser.add_argument('--seed', type = int, default = 0)
+    args = parser.parse_args()
+
+    connection = setup_django(args.database_url)
+    if connection.vendor != 'postgresql':
+        raise SystemExit('benchmarks.pool needs a PostgreSQL --database-url')
+
+    from django.urls import reverse
+
+    from benchmarks.datagen import seed_recipes, seed_reviews, seed_users
+    from recipes.models import Recipe
+
+    users = seed_users(200)
+    seed_recipes(args.recipes, users)
+    seed_reviews(args.recipes * 2, users)
+
+    ids = list(Recipe.objects.order_by('pk').values_list('pk', flat = True))
+    sample = random.Random(args.seed).sample(ids, min(50, len(ids)))
+    paths = [reverse('home_page'), reverse('api_recipes')]
+    paths += [reverse('recipe_detail', args = [pk]) for pk in sample]
+    paths += [reverse('api_recipe', args = [pk]) for pk in sample]
+
+    database = {key: connection.settings_dict[key] for key in ('ENGINE', 'NAME', 'USER', 'PASSWORD', 'HOST', 'PORT')}
+    connection.close()
+
+    results = {
+        'server': args.server,
+        'workers': args.workers,
+        'concurrency': args.concurrency,
+        'pool_size': [args.pool_min_size, args.pool_max_size],
+        'modes': {},
+    }
+    try:
+        for name, overrides in modes(args).items():
+            if args.only and name not in args.only:
+                continue
+            env = {
+                **os.environ,
+                'DJANGO_SETTINGS_MODULE': 'benchmarks.server_settings',
+                'BENCHMARK_DATABASE': json.dumps({**database, **overrides}, default = str),
+                'GUNICORN_MAX_REQUESTS': '0',
+            }
+            process, base_url = start_server(args.server, args.workers, env)
+            try:
+                load(base_url, paths, args.concurrency, args.warmup, args.seed)
+                with ConnectionSampler(database) as sampler:
+                    samples, errors = load(base_url, paths, args.concurrency, args.duration, args.seed)
+            finally:
+                process.terminate()
+                process.wait()
+            results['modes'][name] = {
+                'requests_per_second': round(len(samples) / args.duration, 1),
+                'errors': len(errors),
+                **(summarize(samples) if samples else {}),
+                'peak_connections': max(sampler.samples, default = 0),
+                'avg_connections': round(sum(sampler.samples) / len(sampler.samples), 1) if sampler.samples else 0,
+                'connections_opened': sampler.opened,
+            }
+            # let the server's connections go before the next mode counts its own
+            time.sleep(1)
+    finally:
+        connection.creation.destroy_test_db(verbosity = 0)
+
+    print(json.dumps(results, indent = 2))
+
+
+if __name__ == '__main__':
+    main()
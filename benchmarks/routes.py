@@ -0,0 +1,229 @@
+"""
+Hit every route in recipes/urls.py and accounts/urls.py, anonymous and logged
+in, and report latency percentiles, queries and bytes per request.
+
+    python -m benchmarks.routes --users 200 --recipes 10000 --reviews 30000 > before.json
+    python -m benchmarks.routes --database-url postgres://localhost/recipeshare --cold
+
+Pages are served through the test client, so there is no network in the
+numbers, only the Django stack and the database.
+"""
+import argparse
+import json
+import random
+import tempfile
+import time
+from io import BytesIO
+
+from benchmarks.common import setup_django, summarize
+
+PASSWORD = 'benchmark-password'
+
+
+def sample_image():
+    from django.core.files.uploadedfile import SimpleUploadedFile
+    from PIL import Image
+
+    buffer = BytesIO()
+    Image.new('RGB', (1200, 800), (200, 120, 40)).save(buffer, 'JPEG')
+    return SimpleUploadedFile('benchmark.jpg', buffer.getvalue(), content_type = 'image/jpeg')
+
+
+def recipe_form(rng):
+    from benchmarks.datagen import recipe_fields
+
+    fields = recipe_fields(rng)
+    fields['image'] = sample_image()
+    return fields
+
+
+class Route:
+    """
+    One timed request. prepare(i) runs untimed before each request and returns
+    (path, data), for the write routes it creates whatever the request consumes.
+    """
+
+    def __init__(self, name, method, prepare, auth):
+        self.name = name
+        self.method = method
+        self.prepare = prepare
+        self.auth = auth
+
+
+def build_routes(fixtures, rng):
+    from django.urls import reverse
+    from benchmarks.datagen import recipe_fields
+    from recipes.models import Recipe, Review
+
+    me, other = fixtures['me'], fixtures['other']
+    recipe_ids, usernames = fixtures['recipe_ids'], fixtures['usernames']
+
+    def pick(items, i):
+        return items[i % len(items)]
+
+    def get(name, *args):
+        return lambda i: (reverse(name, args = args), None)
+
+    def reviewed_recipe(i):
+        # a recipe by someone else that `me` has reviewed, so delete has work to do
+        recipe = Recipe.objects.create(author = other, **recipe_fields(rng))
+        Review.objects.create(recipe = recipe, reviewer = me, rating = 4, review = 'Benchmark review')
+        return recipe
+
+    def own_recipe(i):
+        return Recipe.objects.create(author = me, **recipe_fields(rng))
+
+    routes = []
+    for auth in (False, True):
+        routes += [
+            Route('home', 'get', get('home_page'), auth),
+            Route('home_page_2', 'get', lambda i: (reverse('home_page'), {'cursor': fixtures['feed_cursor']}), auth),
+            Route('home_top', 'get', lambda i: (reverse('home_page'), {'sort': 'top'}), auth),
+            Route('home_trending', 'get', lambda i: (reverse('home_page'), {'sort': 'trending'}), auth),
+            Route('home_search', 'get', lambda i: (reverse('home_page'), {'search': pick(['paneer', 'spicy curry', 'dal'], i)}), auth),
+            Route('recipe_detail', 'get', lambda i: (reverse('recipe_detail', args = [pick(recipe_ids, i)]), None), auth),
+            Route('public_profile', 'get', lambda i: (reverse('public_profile', args = [pick(usernames, i)]), None), auth),
+            Route('login_form', 'get', get('login'), auth),
+            Route('register_form', 'get', get('register'), auth),
+        ]
+
+    routes += [
+        Route('profile', 'get', get('profile'), True),
+        Route('edit_profile_form', 'get', get('edit_profile'), True),
+        Route('create_recipe_form', 'get', get('create_recipe'), True),
+        Route('edit_recipe_form', 'get', lambda i: (reverse('edit_recipe', args = [fixtures['own_recipe_id']]), None), True),
+        Route('delete_recipe_form', 'get', lambda i: (reverse('delete_recipe', args = [fixtures['own_recipe_id']]), None), True),
+
+        Route('add_review', 'post', lambda i: (
+            reverse('add_review', args = [Recipe.objects.create(author = other, **recipe_fields(rng)).pk]),
+            {'rating': str(i % 5 + 1), 'review': 'Lovely, would cook again.'},
+        ), True),
+        Route('delete_review', 'post', lambda i: (reverse('delete_review', args = [reviewed_recipe(i).pk]), {}), True),
+        Route('create_recipe', 'post', lambda i: (reverse('create_recipe'), recipe_form(rng)), True),
+        Route('edit_recipe', 'post', lambda i: (
+            reverse('edit_recipe', args = [fixtures['own_recipe_id']]),
+            {**recipe_fields(rng), 'image': ''},
+        ), True),
+        Route('delete_recipe', 'post', lambda i: (reverse('delete_recipe', args = [own_recipe(i).pk]), {}), True),
+        Route('edit_profile', 'post', lambda i: (reverse('edit_profile'), {'email': me.email, 'bio': f'Bio revision {i}'}), True),
+
+        Route('register', 'post', lambda i: (reverse('register'), {
+            'username': f'newcomer{time.time_ns()}',
+            'email': f'newcomer{time.time_ns()}@example.com',
+            'password1': PASSWORD,
+            'password2': PASSWORD,
+        }), False),
+        Route('login', 'post', lambda i: (reverse('login'), {'username': me.username, 'password': PASSWORD}), False),
+        Route('logout', 'get', get('logout'), True),
+    ]
+    return routes
+
+
+def seed(args):
+    from benchmarks.datagen import seed_recipes, seed_reviews, seed_users
+    from recipes.models import Recipe
+    from recipes.pagination import CursorPaginator
+
+    users = seed_users(args.users)
+    seed_recipes(args.recipes, users)
+    seed_reviews(args.reviews, users)
+
+    me, other = users[0], users[1]
+    me.set_password(PASSWORD)
+    me.save()
+
+    # the same 50 recipes on every run, so two JSON reports compare like for like
+    all_ids = list(Recipe.objects.order_by('pk').values_list('pk', flat = True))
+    recipe_ids = random.Random(args.seed).sample(all_ids, min(50, len(all_ids)))
+    return {
+        'me': me,
+        'other': other,
+        'recipe_ids': recipe_ids,
+        'usernames': [user.username for user in users[:50]],
+        'own_recipe_id': Recipe.objects.filter(author = me).values_list('pk', flat = True).first(),
+        'feed_cursor': CursorPaginator(Recipe.objects.feed(), 9).page().next_cursor,
+    }
+
+
+def measure(route, fixtures, repeat, warmup, cold):
+    from django.core.cache import cache
+    from django.db import connection
+    from django.test import Client
+    from django.test.utils import CaptureQueriesContext
+
+    samples, queries, sizes, statuses = [], [], [], set()
+    for i in range(warmup + repeat):
+        # a fresh client per request, login and logout change the session
+        client = Client()
+        if route.auth:
+            client.force_login(fixtures['me'])
+        path, data = route.prepare(i)
+        if cold:
+            cache.clear()
+
+        with CaptureQueriesContext(connection) as captured:
+            start = time.perf_counter()
+            response = getattr(client, route.method)(path, data, secure = True)
+            elapsed = (time.perf_counter() - start) * 1000
+        if i < warmup:
+            continue
+
+        samples.append(elapsed)
+        queries.append(len(captured))
+        sizes.append(0 if response.streaming else len(response.content))
+        statuses.add(response.status_code)
+
+    result = summarize(samples)
+    result.update({
+        'queries': round(sum(queries) / len(queries), 2),
+        'max_queries': max(queries),
+        'bytes': round(sum(sizes) / len(sizes)),
+        'status': sorted(statuses),
+    })
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--users', type = int, default = 200)
+    parser.add_argument('--recipes', type = int, default = 5000)
+    parser.add_argument('--reviews', type = int, default = 15000)
+    parser.add_argument('--repeat', type = int, default = 30)
+    parser.add_argument('--warmup', type = int, default = 3)
+    parser.add_argument('--only', nargs = '+', help = 'Route names to run, e.g. home recipe_detail.')
+    parser.add_argument('--cold', action = 'store_true', help = 'Clear the cache before every request.')
+    parser.add_argument('--seed', type = int, default = 0)
+    parser.add_argument('--database-url')
+    args = parser.parse_args()
+
+    connection = setup_django(args.database_url)
+
+    from django.conf import settings
+    from django.test.utils import setup_test_environment
+
+    setup_test_environment()
+    # uploads and their derivatives go to a scratch directory, never to media/
+    settings.MEDIA_ROOT = tempfile.mkdtemp(prefix = 'recipeshare-bench-')
+
+    fixtures = seed(args)
+    rng = random.Random(args.seed)
+    results = {
+        'vendor': connection.vendor,
+        'users': args.users,
+        'recipes': args.recipes,
+        'reviews': args.reviews,
+        'repeat': args.repeat,
+        'cold_cache': args.cold,
+        'routes': {},
+    }
+    for route in build_routes(fixtures, rng):
+        if args.only and route.name not in args.only:
+            continue
+        key = f'{route.method.upper()} {route.name} ({"user" if route.auth else "anonymous"})'
+        results['routes'][key] = measure(route, fixtures, args.repeat, args.warmup, args.cold)
+
+    print(json.dumps(results, indent = 2, sort_keys = True))
+
+
+if __name__ == '__main__':
+    main()
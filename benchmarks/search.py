@@ -0,0 +1,50 @@
+"""
+Compare the full-text search path against the old icontains scan.
+
+    python -m benchmarks.search --sizes 10000 100000
+    python -m benchmarks.search --database-url postgres://localhost/recipeshare
+"""
+import argparse
+import json
+
+from benchmarks.common import setup_django, summarize, timed
+
+QUERIES = ['paneer', 'spicy curry', 'basmati', 'garam masala', 'mushroom soup', 'cardamom halwa']
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--sizes', type = int, nargs = '+', default = [10000, 100000])
+    parser.add_argument('--repeat', type = int, default = 20)
+    parser.add_argument('--database-url')
+    args = parser.parse_args()
+
+    connection = setup_django(args.database_url)
+
+    from benchmarks.datagen import seed_recipes, seed_users
+    from recipes.models import Recipe
+    from recipes.search import SimpleSearchBackend, get_backend
+
+    backends = {'icontains': SimpleSearchBackend(), 'fulltext': get_backend()}
+    authors = seed_users(200)
+    results = {'vendor': connection.vendor, 'fulltext_backend': type(backends['fulltext']).__name__, 'sizes': {}}
+
+    for size in sorted(args.sizes):
+        seed_recipes(size, authors)
+        results['sizes'][size] = {}
+        for name, backend in backends.items():
+            def run():
+                # what the feed does per search: a COUNT plus the first page of cards
+                for query in QUERIES:
+                    matches = backend.search(Recipe.objects.feed(), query)
+                    matches.count()
+                    list(matches[:9])
+
+            results['sizes'][size][name] = summarize(timed(run, args.repeat))
+            results['sizes'][size][name]['queries'] = len(QUERIES)
+
+    print(json.dumps(results, indent = 2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,45 @@
+"""
+Settings for the gunicorn servers started by benchmarks.asgi: the project
+settings pointed at the benchmark's throwaway database, reachable over plain
+HTTP on localhost.
+"""
+import json
+import os
+import time
+
+from django.core.cache.backends.locmem import LocMemCache
+
+from recipeshare.settings import *  # noqa: F401,F403
+
+DEBUG = False
+ALLOWED_HOSTS = ['127.0.0.1', 'localhost']
+SECURE_SSL_REDIRECT = False
+SESSION_COOKIE_SECURE = False
+CSRF_COOKIE_SECURE = False
+
+DATABASES = {'default': json.loads(os.environ['BENCHMARK_DATABASE'])}
+DATABASE_REPLICAS = []
+
+# simulated network latency on every cache call, like a Redis a few ms away
+CACHE_LATENCY = float(os.environ.get('BENCHMARK_CACHE_LATENCY', 0)) / 1000
+if CACHE_LATENCY:
+    CACHES = {
+        'default': {
+            'BACKEND': 'benchmarks.server_settings.SlowCache',
+            'LOCATION': 'benchmark',
+        }
+    }
+
+
+class SlowCache(LocMemCache):
+    def get(self, *args, **kwargs):
+        time.sleep(CACHE_LATENCY)
+        return super().get(*args, **kwargs)
+
+    def get_many(self, *args, **kwargs):
+        time.sleep(CACHE_LATENCY)
+        return super().get_many(*args, **kwargs)
+
+    def set(self, *args, **kwargs):
+        time.sleep(CACHE_LATENCY)
+        return super().set(*args, **kwargs)
@@ -0,0 +1,77 @@
+"""
+Queries and latency per logged-in home page request for each session engine,
+with and without the cached user loader. Requests are interleaved so every
+configuration sees the same machine noise.
+
+    python -m benchmarks.sessions --repeat 300
+"""
+import argparse
+import json
+import time
+
+from benchmarks.common import setup_django, summarize
+
+CONFIGS = {
+    'db': ('db', 0),
+    'db+user_cache': ('db', 300),
+    'cached_db+user_cache': ('cached_db', 300),
+    'signed_cookies+user_cache': ('signed_cookies', 300),
+}
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--recipes', type = int, default = 2000)
+    parser.add_argument('--repeat', type = int, default = 200)
+    parser.add_argument('--database-url')
+    args = parser.parse_args()
+
+    connection = setup_django(args.database_url)
+
+    from django.conf import settings
+    from django.test import Client
+    from django.test.utils import CaptureQueriesContext, setup_test_environment
+    from django.urls import reverse
+
+    from benchmarks.datagen import seed_recipes, seed_users
+
+    setup_test_environment()
+    users = seed_users(100)
+    seed_recipes(args.recipes, users)
+    path = reverse('home_page')
+
+    clients = {}
+    for name, (engine, timeout) in CONFIGS.items():
+        settings.SESSION_ENGINE = settings.SESSION_ENGINES[engine]
+        clients[name] = Client()
+        # SessionMiddleware picks its engine when the chain is built
+        clients[name].handler.load_middleware()
+        clients[name].force_login(users[0])
+
+    def get(name):
+        settings.SESSION_ENGINE = settings.SESSION_ENGINES[CONFIGS[name][0]]
+        settings.AUTH_USER_CACHE_TIMEOUT = CONFIGS[name][1]
+        return clients[name].get(path, secure = True)
+
+    results = {'vendor': connection.vendor, 'configs': {}}
+    for name in CONFIGS:
+        get(name)
+        with CaptureQueriesContext(connection) as queries:
+            get(name)
+        tables = {query['sql'].split('FROM "')[1].split('"')[0] for query in queries if 'FROM "' in query['sql']}
+        results['configs'][name] = {'queries': len(queries), 'tables': sorted(tables)}
+
+    samples = {name: [] for name in CONFIGS}
+    for _ in range(args.repeat):
+        for name in CONFIGS:
+            start = time.perf_counter()
+            get(name)
+            samples[name].append((time.perf_counter() - start) * 1000)
+    for name in CONFIGS:
+        results['configs'][name].update(summarize(samples[name]))
+
+    print(json.dumps(results, indent = 2))
+
+
+if __name__ == '__main__':
+    main()
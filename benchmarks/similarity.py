@@ -0,0 +1,60 @@
+"""
+The similar recipes batch job and its per-edit update at growing sizes, and
+what the detail page pays to read the result.
+
+    python -m benchmarks.similarity --sizes 10000 100000
+    python -m benchmarks.similarity --chunk-size 128 --database-url postgres://localhost/recipeshare
+"""
+import argparse
+import json
+import time
+
+from benchmarks.common import setup_django, summarize, timed
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--sizes', type = int, nargs = '+', default = [10000, 100000])
+    parser.add_argument('--chunk-size', type = int, default = 256)
+    parser.add_argument('--repeat', type = int, default = 5)
+    parser.add_argument('--database-url')
+    args = parser.parse_args()
+
+    connection = setup_django(args.database_url)
+
+    from django.conf import settings
+    from benchmarks.datagen import seed_recipes, seed_users
+    from recipes.ingredients import sync_ingredients
+    from recipes.models import Recipe, SimilarRecipe
+    from recipes.similarity import ingredient_matrix, refresh_similar_recipes, update_similar_recipes
+
+    authors = seed_users(200)
+    results = {'vendor': connection.vendor, 'chunk_size': args.chunk_size, 'count': settings.SIMILAR_RECIPES_COUNT, 'sizes': {}}
+
+    for size in sorted(args.sizes):
+        seed_recipes(size, authors)
+        # bulk_create skipped the ingredient parsing the vectors are built from
+        sync_ingredients(Recipe.objects.filter(recipe_ingredients__isnull = True).only('ingredients_list'))
+
+        start = time.perf_counter()
+        refresh_similar_recipes(args.chunk_size)
+        refresh_s = time.perf_counter() - start
+
+        recipe_id = Recipe.objects.order_by('pk').values_list('pk', flat = True)[size // 2]
+        panel = lambda: list(
+            SimilarRecipe.objects.filter(recipe_id = recipe_id).select_related('similar').order_by('-score')[:settings.SIMILAR_RECIPES_COUNT]
+        )
+        results['sizes'][size] = {
+            'refresh_s': round(refresh_s, 2),
+            # the dense scores block each chunk holds, what bounds memory
+            'chunk_block_mb': round(args.chunk_size * size * 4 / 2 ** 20, 1),
+            'matrix_ms': summarize(timed(ingredient_matrix, args.repeat)),
+            'update_one_ms': summarize(timed(lambda: update_similar_recipes(recipe_id), args.repeat)),
+            'detail_panel_ms': summarize(timed(panel, 200)),
+        }
+
+    print(json.dumps(results, indent = 2))
+
+
+if __name__ == '__main__':
+    main()
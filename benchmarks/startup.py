@@ -0,0 +1,170 @@
+"""
+How long the web app takes to come up: where `import recipeshare.asgi` spends
+its time according to `python -X importtime`, and the time from launching
+gunicorn with gunicorn.conf.py to the first 200 from the feed, per worker
+class with preload_app on and off.
+
+    python -m benchmarks.startup
+    python -m benchmarks.startup --repeat 5 --workers 4 --only asgi
+    python -m benchmarks.startup --history benchmarks/startup_history.jsonl
+
+gunicorn binds its socket before it loads the app, so the first request
+connects early and waits: first_request_ms is how long that request took,
+most of it the worker still starting when the app isn't preloaded.
+--history appends the results as one JSON line with the commit and the
+machine, so runs can be compared across changes.
+"""
+import argparse
+import json
+import os
+import platform
+import re
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.error
+import urllib.request
+from collections import defaultdict
+from datetime import datetime, timezone
+
+from benchmarks.asgi import free_port
+from benchmarks.common import BASE_DIR, setup_django
+
+IMPORT_LINE = re.compile(r'^import time:\s+(\d+) \|\s+(\d+) \|( *)(\S+)$')
+
+
+def import_times(env):
+    """
+    One `python -X importtime -c "import recipeshare.asgi"` run: wall time,
+    self time per top-level package and the slowest modules by cumulative time.
+    """
+    start = time.perf_counter()
+    result = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', 'import recipeshare.asgi'],
+        cwd = BASE_DIR, env = env, capture_output = True, text = True, check = True,
+    )
+    wall_ms = (time.perf_counter() - start) * 1000
+    packages, modules = defaultdict(int), []
+    for line in result.stderr.splitlines():
+        match = IMPORT_LINE.match(line)
+        if match:
+            self_us, cumulative_us, _, module = match.groups()
+            packages[module.split('.')[0]] += int(self_us)
+            modules.append((int(cumulative_us), module))
+    return wall_ms, packages, modules
+
+
+def import_breakdown(env, repeat, top):
+    # the first run compiles .pyc files, the one with the median wall time is reported
+    import_times(env)
+    runs = sorted((import_times(env) for _ in range(repeat)), key = lambda run: run[0])
+    wall_ms, packages, modules = runs[len(runs) // 2]
+    return {
+        'process_ms': round(wall_ms, 1),
+        'imports_ms': round(sum(packages.values()) / 1000, 1),
+        'modules': len(modules),
+        'packages_self_ms': {
+            name: round(us / 1000, 1) for name, us in sorted(packages.items(), key = lambda item: -item[1])[:top]
+        },
+        'slowest_cumulative_ms': {module: round(us / 1000, 1) for us, module in sorted(modules, reverse = True)[:top]},
+    }
+
+
+def first_response(worker_kind, preload, workers, env, url_path):
+    # ms from launching gunicorn to the first 200, and how long that request took
+    port = free_port()
+    env = {
+        **env,
+        'GUNICORN_WORKER_CLASS': worker_kind,
+        'GUNICORN_PRELOAD': str(preload),
+        'WEB_CONCURRENCY': str(workers),
+    }
+    url = f'http://127.0.0.1:{port}{url_path}'
+    start = time.perf_counter()
+    process = subprocess.Popen(
+        [sys.executable, '-m', 'gunicorn', '--bind', f'127.0.0.1:{port}', '--log-level', 'warning'],
+        cwd = BASE_DIR, env = env,
+    )
+    try:
+        while time.perf_counter() - start < 60:
+            request_start = time.perf_counter()
+            try:
+                with urllib.request.urlopen(url, timeout = 10) as response:
+                    if response.status == 200:
+                        now = time.perf_counter()
+                        return (now - start) * 1000, (now - request_start) * 1000
+            except (urllib.error.URLError, ConnectionError):
+                time.sleep(0.01)
+        raise RuntimeError(f'{worker_kind} server did not answer')
+    finally:
+        process.terminate()
+        process.wait()
+
+
+def git_commit():
+    result = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd = BASE_DIR, capture_output = True, text = True)
+    return result.stdout.strip() or None
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--repeat', type = int, default = 3)
+    parser.add_argument('--workers', type = int, default = 2)
+    parser.add_argument('--top', type = int, default = 15, help = 'packages and modules listed in the import breakdown')
+    parser.add_argument('--only', nargs = '*', choices = ['asgi', 'sync', 'gthread'])
+    parser.add_argument('--recipes', type = int, default = 500)
+    parser.add_argument('--history', help = 'append the results to this JSON lines file')
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix = 'recipeshare-startup-')
+    connection = setup_django(test_name = os.path.join(workdir, 'benchmark.sqlite3'))
+
+    from django.urls import reverse
+
+    from benchmarks.datagen import seed_recipes, seed_users
+
+    seed_recipes(args.recipes, seed_users(50))
+    path = reverse('home_page')
+
+    database = {key: connection.settings_dict[key] for key in ('ENGINE', 'NAME', 'USER', 'PASSWORD', 'HOST', 'PORT')}
+    connection.close()
+    env = {
+        **os.environ,
+        'DJANGO_SETTINGS_MODULE': 'benchmarks.server_settings',
+        'BENCHMARK_DATABASE': json.dumps(database, default = str),
+        'GUNICORN_MAX_REQUESTS': '0',
+    }
+
+    results = {'imports': import_breakdown({**env, 'AUTOCOMPLETE_WARM_ON_START': 'False'}, args.repeat, args.top)}
+    results['first_response'] = {}
+    try:
+        for worker_kind in args.only or ['asgi', 'sync']:
+            for preload in (True, False):
+                runs = [first_response(worker_kind, preload, args.workers, env, path) for _ in range(args.repeat)]
+                results['first_response'][f"{worker_kind}{'+preload' if preload else ''}"] = {
+                    'startup_ms': round(statistics.median(run[0] for run in runs), 1),
+                    'first_request_ms': round(statistics.median(run[1] for run in runs), 1),
+                    'runs': len(runs),
+                }
+    finally:
+        connection.creation.destroy_test_db(verbosity = 0)
+
+    print(json.dumps(results, indent = 2))
+    if args.history:
+        entry = {
+            'at': datetime.now(timezone.utc).isoformat(timespec = 'seconds'),
+            'commit': git_commit(),
+            'python': platform.python_version(),
+            'machine': platform.machine(),
+            'cpus': os.cpu_count(),
+            'workers': args.workers,
+            **results,
+        }
+        with open(args.history, 'a') as history:
+            history.write(json.dumps(entry) + '\n')
+
+
+if __name__ == '__main__':
+    main()
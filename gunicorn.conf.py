@@ -0,0 +1,83 @@
+"""
+Gunicorn settings, read from the working directory by a bare `gunicorn`
+(render.yaml's start command). Every value comes from an environment
+variable so a deploy can be tuned without a code change, and any of them can
+still be overridden on the command line.
+
+    GUNICORN_WORKER_CLASS         asgi (uvicorn workers, default), sync or gthread
+    WEB_CONCURRENCY               worker processes, derived from the CPUs otherwise
+    GUNICORN_THREADS              threads per gthread worker, default 4
+    GUNICORN_PRELOAD              import the app once in the master before forking, default True
+    GUNICORN_MAX_REQUESTS         restart a worker after this many requests, 0 never, default 1000
+    GUNICORN_MAX_REQUESTS_JITTER  up to this many more, so workers don't restart together, default 100
+    GUNICORN_TIMEOUT              seconds a worker may go silent before it is killed, default 30
+
+Database connections are sized per worker: DATABASE_POOL_MAX_SIZE (settings.py)
+times the workers is the most the site opens to PostgreSQL with pooling on.
+"""
+import math
+import os
+
+WORKER_CLASSES = {
+    'asgi': ('uvicorn_worker.UvicornWorker', 'recipeshare.asgi:application'),
+    'sync': ('sync', 'recipeshare.wsgi:application'),
+    'gthread': ('gthread', 'recipeshare.wsgi:application'),
+}
+
+
+def available_cpus():
+    # a container's CPU quota, os.cpu_count() would report every core of the host
+    try:
+        with open('/sys/fs/cgroup/cpu.max') as quota_file:
+            quota, period = quota_file.read().split()
+        if quota != 'max':
+            return max(1, math.ceil(int(quota) / int(period)))
+    except (OSError, ValueError):
+        pass
+    if hasattr(os, 'sched_getaffinity'):
+        return len(os.sched_getaffinity(0))
+    return os.cpu_count() or 1
+
+
+def default_workers(kind, cpus):
+    # an event loop or a pool of threads keeps a core busy on its own, a sync
+    # worker spends much of each request waiting on the database. Never fewer
+    # than two, one restarting worker must not take the site down
+    if kind == 'sync':
+        return cpus * 2 + 1
+    return max(2, cpus)
+
+
+worker_kind = os.environ.get('GUNICORN_WORKER_CLASS', 'asgi')
+if worker_kind not in WORKER_CLASSES:
+    raise ValueError(f"GUNICORN_WORKER_CLASS must be one of {', '.join(WORKER_CLASSES)}, not {worker_kind!r}")
+worker_class, wsgi_app = WORKER_CLASSES[worker_kind]
+
+workers = int(os.environ.get('WEB_CONCURRENCY') or default_workers(worker_kind, available_cpus()))
+threads = int(os.environ.get('GUNICORN_THREADS', 4)) if worker_kind == 'gthread' else 1
+
+# the app, Django and every view are imported once and shared copy-on-write,
+# workers fork ready to serve instead of each importing it all again
+preload_app = os.environ.get('GUNICORN_PRELOAD', 'True') == 'True'
+
+max_requests = int(os.environ.get('GUNICORN_MAX_REQUESTS', 1000))
+max_requests_jitter = int(os.environ.get('GUNICORN_MAX_REQUESTS_JITTER', 100))
+timeout = int(os.environ.get('GUNICORN_TIMEOUT', 30))
+
+
+def pre_fork(server, worker):
+    # a preloaded master has used the database (the autocomplete build). Its
+    # connections, and a psycopg pool with its background threads, would reach
+    # the worker half alive: close them, every worker opens its own
+    if not server.cfg.preload_app:
+        return
+    from django.db import connections
+
+    from recipes.autocomplete import finish_before_fork
+
+    finish_before_fork()
+    for alias in connections:
+        connection = connections[alias]
+        connection.close()
+        if connection.vendor == 'postgresql':
+            connection.close_pool()
@@ -0,0 +1,11 @@
+from django.contrib import admin
+from jobs.models import Job
+
+
+class JobAdmin(admin.ModelAdmin):
+    list_display = ['name', 'status', 'attempts', 'run_after', 'updated_at']
+    list_filter = ['status', 'name']
+    exclude = ['data']
+    readonly_fields = ['attempts', 'locked_until', 'last_error', 'created_at', 'updated_at']
+
+admin.site.register(Job, JobAdmin)
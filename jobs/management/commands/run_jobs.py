@@ -0,0 +1,22 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from jobs.queue import run_pending, work
+
+
+class Command(BaseCommand):
+    help = 'Run queued background jobs. Loops forever unless --burst is given.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--burst', action = 'store_true', help = 'Run every due job once and exit.')
+        parser.add_argument('--sleep', type = float, default = 2, help = 'Seconds to wait when the queue is empty.')
+        parser.add_argument('--visibility-timeout', type = int, default = settings.JOBS_VISIBILITY_TIMEOUT,
+                            help = 'Seconds before a running job is handed to another worker.')
+
+    def handle(self, *args, **options):
+        if options['burst']:
+            done = run_pending(visibility_timeout = options['visibility_timeout'])
+            self.stdout.write(self.style.SUCCESS(f'Ran {done} jobs.'))
+            return
+        self.stdout.write('Waiting for jobs...')
+        work(poll_interval = options['sleep'], visibility_timeout = options['visibility_timeout'])
@@ -0,0 +1,39 @@
+from django.db import models
+from django.utils import timezone
+
+
+class Job(models.Model):
+    QUEUED = 'queued'
+    RUNNING = 'running'
+    DONE = 'done'
+    FAILED = 'failed'
+    STATUS_CHOICES = [
+        (QUEUED, 'Queued'),
+        (RUNNING, 'Running'),
+        (DONE, 'Done'),
+        (FAILED, 'Failed'),
+    ]
+
+    name = models.CharField(max_length = 100)
+    payload = models.JSONField(default = dict, blank = True)
+    # raw bytes a job needs, e.g. an upload staged until the worker stores it
+    data = models.BinaryField(null = True, blank = True)
+
+    status = models.CharField(max_length = 10, choices = STATUS_CHOICES, default = QUEUED)
+    attempts = models.PositiveIntegerField(default = 0)
+    max_attempts = models.PositiveIntegerField(default = 5)
+    run_after = models.DateTimeField(default = timezone.now)
+    locked_until = models.DateTimeField(null = True, blank = True)
+    last_error = models.TextField(blank = True)
+
+    created_at = models.DateTimeField(auto_now_add = True)
+    updated_at = models.DateTimeField(auto_now = True)
+
+    def __str__(self):
+        return f"{self.name} #{self.pk} ({self.status})"
+
+    class Meta:
+        ordering = ['run_after']
+        indexes = [
+            models.Index(fields = ['status', 'run_after'], name = 'jobs_job_status_run_after'),
+        ]
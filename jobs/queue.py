@@ -0,0 +1,187 @@
+import logging
+import random
+import threading
+import time
+import traceback
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import F, Q
+from django.utils import timezone
+
+from jobs.models import Job
+
+logger = logging.getLogger(__name__)
+
+HANDLERS = {}
+# how often an idle worker deletes old DONE rows, in seconds
+PURGE_INTERVAL = 3600
+
+
+def job(name):
+    """
+    Register a handler, it receives the Job row and can read job.payload and job.data.
+
+        @job('store_upload')
+        def storeUpload(job): ...
+    """
+    def decorator(func):
+        HANDLERS[name] = func
+        return func
+    return decorator
+
+
+def enqueue(name, payload = None, data = None, delay = 0, max_attempts = None):
+    queued = Job.objects.create(
+        name = name,
+        payload = payload or {},
+        data = data,
+        run_after = timezone.now() + timedelta(seconds = delay),
+        max_attempts = max_attempts or settings.JOBS_MAX_ATTEMPTS,
+    )
+    if settings.JOBS_RUN_INLINE:
+        # no worker in this environment, run it once the request's writes are visible
+        transaction.on_commit(lambda: run_pending())
+    return queued
+
+
+def claimable(now):
+    # queued and due, or running but its worker stopped renewing the lock
+    return Q(status = Job.QUEUED, run_after__lte = now) | Q(status = Job.RUNNING, locked_until__lt = now)
+
+
+def claim(visibility_timeout = None):
+    """
+    Take the next due job. The conditional UPDATE is the lock: when two workers
+    race for a row only one of them updates it, on any database.
+    """
+    timeout = visibility_timeout or settings.JOBS_VISIBILITY_TIMEOUT
+    now = timezone.now()
+    candidates = Job.objects.filter(claimable(now)).order_by('run_after').values_list('pk', flat = True)[:10]
+    for pk in candidates:
+        claimed = Job.objects.filter(claimable(now), pk = pk).update(
+            status = Job.RUNNING,
+            locked_until = now + timedelta(seconds = timeout),
+            attempts = F('attempts') + 1,
+        )
+        if not claimed:
+            continue
+        claimed_job = Job.objects.get(pk = pk)
+        if claimed_job.attempts > claimed_job.max_attempts:
+            # its last worker died mid-run one time too many
+            owned(claimed_job).update(status = Job.FAILED, locked_until = None, last_error = 'Visibility timeout expired on the final attempt.')
+            continue
+        return claimed_job
+    return None
+
+
+def backoff(attempts):
+    base = settings.JOBS_RETRY_BACKOFF * 2 ** (attempts - 1)
+    return min(base, 3600) * random.uniform(0.8, 1.2)
+
+
+def owned(claimed):
+    # the claim's attempt number is its token: once the lock expired and
+    # another worker took the job, attempts moved on and this worker's updates match nothing
+    return Job.objects.filter(pk = claimed.pk, status = Job.RUNNING, attempts = claimed.attempts)
+
+
+def renew(claimed, visibility_timeout = None):
+    """
+    Push the lock of a job this worker is running forward, False when it
+    was lost. run_job does it on its own while a handler runs.
+    """
+    timeout = visibility_timeout or settings.JOBS_VISIBILITY_TIMEOUT
+    return bool(owned(claimed).update(locked_until = timezone.now() + timedelta(seconds = timeout)))
+
+
+class Heartbeat(threading.Thread):
+    """Renews a running job's lock every third of the visibility timeout, so a long handler is not run twice."""
+
+    def __init__(self, claimed, visibility_timeout):
+        super().__init__(daemon = True)
+        self.claimed = claimed
+        self.timeout = visibility_timeout or settings.JOBS_VISIBILITY_TIMEOUT
+        self.stopped = threading.Event()
+
+    def run(self):
+        try:
+            while not self.stopped.wait(self.timeout / 3):
+                if not renew(self.claimed, self.timeout):
+                    logger.warning('Job %s lost its lock while running', self.claimed)
+                    break
+        finally:
+            # this thread's own connection
+            connection.close()
+
+    def stop(self):
+        self.stopped.set()
+        self.join()
+
+
+def finish(claimed, **fields):
+    if not owned(claimed).update(locked_until = None, updated_at = timezone.now(), **fields):
+        logger.warning('Job %s was taken over by another worker, leaving its row alone', claimed)
+
+
+def run_job(claimed, visibility_timeout = None):
+    handler = HANDLERS.get(claimed.name)
+    heartbeat = Heartbeat(claimed, visibility_timeout)
+    heartbeat.start()
+    try:
+        if handler is None:
+            raise LookupError(f'No handler registered for job {claimed.name!r}')
+        handler(claimed)
+    except Exception:
+        error = traceback.format_exc()
+        heartbeat.stop()
+        if claimed.attempts >= claimed.max_attempts:
+            logger.error('Job %s failed for good after %s attempts', claimed, claimed.attempts)
+            finish(claimed, status = Job.FAILED, last_error = error)
+        else:
+            delay = backoff(claimed.attempts)
+            logger.warning('Job %s failed, retrying in %.0fs', claimed, delay)
+            finish(claimed, status = Job.QUEUED, last_error = error, run_after = timezone.now() + timedelta(seconds = delay))
+        return False
+
+    heartbeat.stop()
+    # the staged bytes are not needed any more once the job succeeded
+    finish(claimed, status = Job.DONE, data = None)
+    return True
+
+
+def purge_jobs(older_than = None, batch_size = 1000):
+    """
+    Delete DONE jobs finished more than older_than seconds ago
+    (JOBS_KEEP_DONE), in batches. Failed jobs stay for inspection.
+    """
+    cutoff = timezone.now() - timedelta(seconds = settings.JOBS_KEEP_DONE if older_than is None else older_than)
+    purged = 0
+    while True:
+        pks = list(Job.objects.filter(status = Job.DONE, updated_at__lt = cutoff).values_list('pk', flat = True)[:batch_size])
+        if not pks:
+            return purged
+        purged += Job.objects.filter(pk__in = pks).delete()[0]
+
+
+def run_pending(limit = None, visibility_timeout = None):
+    done = 0
+    while limit is None or done < limit:
+        claimed = claim(visibility_timeout)
+        if claimed is None:
+            break
+        run_job(claimed, visibility_timeout)
+        done += 1
+    return done
+
+
+def work(poll_interval = 2, visibility_timeout = None):
+    last_purge = 0.0
+    while True:
+        if run_pending(visibility_timeout = visibility_timeout):
+            continue
+        if time.monotonic() - last_purge >= PURGE_INTERVAL:
+            purge_jobs()
+            last_purge = time.monotonic()
+        time.sleep(poll_interval)
@@ -0,0 +1,98 @@
+import time
+from datetime import timedelta
+from unittest import mock
+
+from django.test import TestCase, TransactionTestCase
+from django.utils import timezone
+
+from jobs.models import Job
+from jobs.queue import HANDLERS, claim, enqueue, purge_jobs, renew, run_job, run_pending
+
+
+class JobQueueTests(TestCase):
+    def setUp(self):
+        handlers = mock.patch.dict(HANDLERS, {'flaky': self.fail_job, 'noop': lambda queued: None})
+        handlers.start()
+        self.addCleanup(handlers.stop)
+
+    def fail_job(self, queued):
+        raise ValueError('storage is down')
+
+    def test_failed_job_retries_with_backoff_then_fails_for_good(self):
+        queued = enqueue('flaky', max_attempts = 2)
+
+        with self.assertLogs('jobs.queue', 'WARNING'):
+            self.assertFalse(run_job(claim()))
+        queued.refresh_from_db()
+        delay = (queued.run_after - timezone.now()).total_seconds()
+        self.assertEqual((queued.status, queued.attempts, queued.locked_until), (Job.QUEUED, 1, None))
+        self.assertIn('storage is down', queued.last_error)
+        # JOBS_RETRY_BACKOFF (10s) with up to 20% jitter either way
+        self.assertTrue(7 < delay <= 12, delay)
+        self.assertIsNone(claim())
+
+        Job.objects.filter(pk = queued.pk).update(run_after = timezone.now())
+        with self.assertLogs('jobs.queue', 'ERROR'):
+            self.assertFalse(run_job(claim()))
+        queued.refresh_from_db()
+        self.assertEqual((queued.status, queued.attempts), (Job.FAILED, 2))
+        self.assertEqual(run_pending(), 0)
+
+    def test_expired_lock_is_reclaimed_and_the_first_worker_loses_the_job(self):
+        queued = enqueue('noop')
+        first = claim()
+        self.assertIsNone(claim())
+        self.assertTrue(renew(first))
+
+        # the first worker stalled past its visibility timeout
+        Job.objects.filter(pk = queued.pk).update(locked_until = timezone.now() - timedelta(seconds = 1))
+        second = claim()
+        self.assertEqual((second.pk, second.attempts), (queued.pk, 2))
+
+        self.assertFalse(renew(first))
+        with self.assertLogs('jobs.queue', 'WARNING'):
+            run_job(first)
+        queued.refresh_from_db()
+        self.assertEqual((queued.status, queued.attempts), (Job.RUNNING, 2))
+
+        self.assertTrue(run_job(second))
+        queued.refresh_from_db()
+        self.assertEqual((queued.status, queued.locked_until), (Job.DONE, None))
+
+    def test_expired_lock_on_the_final_attempt_fails_the_job(self):
+        queued = enqueue('noop', max_attempts = 1)
+        claim()
+        Job.objects.filter(pk = queued.pk).update(locked_until = timezone.now() - timedelta(seconds = 1))
+
+        self.assertIsNone(claim())
+        queued.refresh_from_db()
+        self.assertEqual(queued.status, Job.FAILED)
+        self.assertIn('Visibility timeout', queued.last_error)
+
+    def test_purge_deletes_old_finished_jobs_only(self):
+        old, recent = enqueue('noop'), enqueue('noop')
+        failed = enqueue('flaky', max_attempts = 1)
+        with self.assertLogs('jobs.queue', 'ERROR'):
+            run_pending()
+        Job.objects.filter(pk__in = [old.pk, failed.pk]).update(updated_at = timezone.now() - timedelta(days = 8))
+
+        self.assertEqual(purge_jobs(batch_size = 1), 1)
+        self.assertEqual(set(Job.objects.values_list('pk', flat = True)), {recent.pk, failed.pk})
+
+
+class JobHeartbeatTests(TransactionTestCase):
+    def test_long_running_job_keeps_its_lock(self):
+        reclaimed = []
+
+        def slow(queued):
+            # longer than the visibility timeout, the heartbeat renews the lock every 0.1s
+            time.sleep(0.5)
+            reclaimed.append(claim(visibility_timeout = 0.3))
+
+        with mock.patch.dict(HANDLERS, {'slow': slow}):
+            queued = enqueue('slow')
+            self.assertTrue(run_job(claim(visibility_timeout = 0.3), visibility_timeout = 0.3))
+
+        self.assertEqual(reclaimed, [None])
+        queued.refresh_from_db()
+        self.assertEqual((queued.status, queued.attempts), (Job.DONE, 1))
@@ -0,0 +1,408 @@
+import json
+from functools import wraps
+
+from asgiref.sync import sync_to_async
+from django.core.files.storage import default_storage
+from django.db import IntegrityError, transaction
+from django.db.models import Count
+from django.forms.models import model_to_dict
+from django.http import HttpResponse, JsonResponse
+from django.http.multipartparser import MultiPartParserError
+
+from accounts.forms import ProfileForm
+from accounts.models import User
+from recipes.autocomplete import database_suggestions, index as autocomplete_index, normalize
+from recipes.forms import RecipeForm
+from recipes.models import Recipe, Review
+from recipes.pagination import CursorPaginator, InvalidCursor
+from recipes.rankings import sort_recipes
+from recipes.reviews import delete_review, save_review
+from recipes.search import search_recipes
+from recipes.tasks import stage_upload
+from recipeshare.routers import read_from_replica
+
+# public name -> ORM path, rows are read with .values() so no model instances are built
+RECIPE_FIELDS = {
+    'id': 'id',
+    'title': 'title',
+    'small_description': 'small_description',
+    'estimated_prep_time': 'estimated_prep_time',
+    'ingredients_list': 'ingredients_list',
+    'process': 'process',
+    'image': 'image',
+    'author': 'author__username',
+    'rating_avg': 'rating_avg',
+    'rating_count': 'rating_count',
+    'created_at': 'created_at',
+    'updated_at': 'updated_at',
+}
+RECIPE_DEFAULT_FIELDS = ['id', 'title', 'small_description', 'estimated_prep_time', 'image', 'author', 'rating_avg', 'rating_count', 'created_at']
+
+REVIEW_FIELDS = {
+    'id': 'id',
+    'rating': 'rating',
+    'review': 'review',
+    'reviewer': 'reviewer__username',
+    'recipe': 'recipe_id',
+    'created_at': 'created_at',
+    'updated_at': 'updated_at',
+}
+
+PROFILE_FIELDS = {
+    'username': 'username',
+    'bio': 'bio',
+    'profile_pic': 'profile_pic',
+    'date_joined': 'date_joined',
+    'recipe_count': 'recipe_count',
+}
+
+# stored file names become URLs on the way out
+FILE_FIELDS = {'image', 'profile_pic'}
+
+MAX_LIMIT = 100
+MAX_IDS = 100
+
+
+class ApiError(Exception):
+    def __init__(self, message, status = 400):
+        super().__init__(message)
+        self.status = status
+
+
+def api_view(methods, login = False):
+    """
+    JSON in and out: allowed methods, 401 instead of the login redirect, and
+    ApiError turned into {"error": ...} with its status. Views are async, the
+    reads run on the async ORM and writes go through `in_thread`.
+    """
+    def decorator(view):
+        @wraps(view)
+        async def wrapper(request, *args, **kwargs):
+            try:
+                if request.method not in methods:
+                    raise ApiError(f'Method {request.method} not allowed.', 405)
+                user = await request.auser()
+                if (login or request.method not in ('GET', 'HEAD')) and not user.is_authenticated:
+                    raise ApiError('Authentication required.', 401)
+                return await view(request, *args, **kwargs)
+            except ApiError as error:
+                return JsonResponse({'error': str(error)}, status = error.status)
+        return wrapper
+    return decorator
+
+
+async def in_thread(handler, request, *args):
+    # forms, file uploads and transactions stay sync, in Django's single sync thread
+    return await sync_to_async(handler)(request, *args)
+
+
+def respond(data, status = 200):
+    return JsonResponse(data, status = status, json_dumps_params = {'separators': (',', ':')})
+
+
+def get_or_404(queryset, message, **lookup):
+    instance = queryset.filter(**lookup).first()
+    if instance is None:
+        raise ApiError(message, 404)
+    return instance
+
+
+def read_body(request):
+    # multipart for uploads, JSON for everything else
+    if request.content_type == 'multipart/form-data':
+        if request.method == 'POST':
+            return request.POST.dict(), request.FILES
+        # Django only parses the body of a POST, a multipart PATCH or PUT is read here
+        try:
+            data, files = request.parse_file_upload(request.META, request)
+        except MultiPartParserError as error:
+            raise ApiError(f'Malformed multipart body: {error}')
+        return data.dict(), files
+    try:
+        body = json.loads(request.body or b'{}')
+    except ValueError:
+        raise ApiError('Request body is not valid JSON.')
+    if not isinstance(body, dict):
+        raise ApiError('Request body must be a JSON object.')
+    return body, None
+
+
+def selected_fields(request, available, default):
+    requested = request.GET.get('fields')
+    if not requested:
+        return list(default)
+    fields = [name.strip() for name in requested.split(',') if name.strip()]
+    unknown = [name for name in fields if name not in available]
+    if unknown:
+        raise ApiError(f'Unknown fields: {", ".join(unknown)}. Available: {", ".join(available)}.')
+    return fields
+
+
+def parse_limit(request, default = 20):
+    try:
+        return max(1, min(MAX_LIMIT, int(request.GET.get('limit', default))))
+    except ValueError:
+        raise ApiError('limit must be a number.')
+
+
+def parse_ids(request):
+    try:
+        ids = [int(value) for value in request.GET['ids'].split(',') if value.strip()]
+    except ValueError:
+        raise ApiError('ids must be a comma separated list of numbers.')
+    if len(ids) > MAX_IDS:
+        raise ApiError(f'At most {MAX_IDS} ids per request.')
+    return ids
+
+
+def fetch(queryset, mapping, fields, extra = ()):
+    """
+    .values() over the ORM paths of the requested fields plus any extra paths
+    (the pagination keys). Returns the raw rows and a function that shapes a
+    row into the public payload.
+    """
+    paths = list(dict.fromkeys([mapping[name] for name in fields] + list(extra)))
+    rows = queryset.values(*paths)
+
+    def shape(row):
+        item = {}
+        for name in fields:
+            value = row[mapping[name]]
+            if name in FILE_FIELDS:
+                value = default_storage.url(value) if value else None
+            item[name] = value
+        return item
+    return rows, shape
+
+
+async def paginated(request, queryset, mapping, fields):
+    paginator = CursorPaginator(queryset, parse_limit(request))
+    keys = [key.lstrip('-') for key in paginator.ordering]
+    rows, shape = fetch(paginator.queryset, mapping, fields, extra = keys)
+    paginator.queryset = rows
+    try:
+        page = await paginator.apage(request.GET.get('cursor'))
+    except InvalidCursor:
+        raise ApiError('Invalid cursor.')
+    return respond({
+        'results': [shape(row) for row in page],
+        'next': page.next_cursor,
+        'previous': page.previous_cursor,
+    })
+
+
+def form_errors(form):
+    return {field: [error['message'] for error in errors] for field, errors in form.errors.get_json_data().items()}
+
+
+def recipe_payload(request, recipe_id, status = 200):
+    fields = selected_fields(request, RECIPE_FIELDS, RECIPE_DEFAULT_FIELDS)
+    rows, shape = fetch(Recipe.objects.filter(pk = recipe_id), RECIPE_FIELDS, fields)
+    row = rows.first()
+    if row is None:
+        raise ApiError('Recipe not found.', 404)
+    return respond(shape(row), status)
+
+
+async def arecipe_payload(request, recipe_id):
+    fields = selected_fields(request, RECIPE_FIELDS, RECIPE_DEFAULT_FIELDS)
+    rows, shape = fetch(Recipe.objects.filter(pk = recipe_id), RECIPE_FIELDS, fields)
+    row = await rows.afirst()
+    if row is None:
+        raise ApiError('Recipe not found.', 404)
+    return respond(shape(row))
+
+
+@read_from_replica
+@api_view(['GET', 'POST'])
+async def recipesApi(request):
+    if request.method == 'POST':
+        return await in_thread(createRecipe, request)
+
+    fields = selected_fields(request, RECIPE_FIELDS, RECIPE_DEFAULT_FIELDS)
+    if 'ids' in request.GET:
+        # bulk fetch in one query, returned in the order asked for
+        ids = parse_ids(request)
+        rows, shape = fetch(Recipe.objects.filter(pk__in = ids), RECIPE_FIELDS, fields, extra = ['id'])
+        by_id = {row['id']: shape(row) async for row in rows}
+        return respond({'results': [by_id[pk] for pk in ids if pk in by_id]})
+
+    recipes = Recipe.objects.order_by('-created_at', '-id')
+    if request.GET.get('author'):
+        recipes = recipes.filter(author__username = request.GET['author'])
+    if request.GET.get('search', '').strip():
+        recipes = search_recipes(recipes, request.GET['search'].strip())
+    else:
+        recipes = sort_recipes(recipes, request.GET.get('sort'))
+    return await paginated(request, recipes, RECIPE_FIELDS, fields)
+
+
+def createRecipe(request):
+    data, files = read_body(request)
+    form = RecipeForm(data, files)
+    # JSON clients can create a recipe first and upload the photo later
+    form.fields['image'].required = False
+    if not form.is_valid():
+        return respond({'errors': form_errors(form)}, 400)
+
+    recipe = form.save(commit = False)
+    recipe.author = request.user
+    upload = form.cleaned_data.get('image')
+    recipe.image = ''
+    with transaction.atomic():
+        recipe.save()
+        if upload:
+            stage_upload(recipe, 'image', upload)
+    return recipe_payload(request, recipe.pk, 201)
+
+
+@read_from_replica
+@api_view(['GET', 'PATCH', 'POST', 'DELETE'])
+async def recipeApi(request, recipe_id):
+    if request.method == 'GET':
+        return await arecipe_payload(request, recipe_id)
+    return await in_thread(changeRecipe, request, recipe_id)
+
+
+def changeRecipe(request, recipe_id):
+    recipe = get_or_404(Recipe.objects, 'Recipe not found.', pk = recipe_id)
+    if recipe.author_id != request.user.pk:
+        raise ApiError('Only the author can change this recipe.', 403)
+
+    if request.method == 'DELETE':
+        recipe.delete()
+        return HttpResponse(status = 204)
+
+    # PATCH (or a multipart POST carrying a new photo): anything left out keeps its value
+    data, files = read_body(request)
+    current = model_to_dict(recipe, fields = RecipeForm._meta.fields)
+    form = RecipeForm({**current, **data}, files, instance = recipe)
+    form.fields['image'].required = False
+    if not form.is_valid():
+        return respond({'errors': form_errors(form)}, 400)
+
+    current_image = recipe.image.name
+    recipe = form.save(commit = False)
+    with transaction.atomic():
+        if 'image' in form.changed_data and form.cleaned_data.get('image'):
+            upload = form.cleaned_data['image']
+            recipe.image = current_image
+            recipe.save()
+            stage_upload(recipe, 'image', upload)
+        else:
+            recipe.save()
+    return recipe_payload(request, recipe.pk)
+
+
+@read_from_replica
+@api_view(['GET', 'POST', 'PUT', 'DELETE'])
+async def recipeReviewsApi(request, recipe_id):
+    if request.method == 'GET':
+        if not await Recipe.objects.filter(pk = recipe_id).aexists():
+            raise ApiError('Recipe not found.', 404)
+        fields = selected_fields(request, REVIEW_FIELDS, REVIEW_FIELDS)
+        reviews = Review.objects.filter(recipe_id = recipe_id).order_by('-created_at', '-id')
+        return await paginated(request, reviews, REVIEW_FIELDS, fields)
+    return await in_thread(changeReview, request, recipe_id)
+
+
+def changeReview(request, recipe_id):
+    if request.method == 'DELETE':
+        try:
+            deleted = delete_review(recipe_id, request.user)
+        except Recipe.DoesNotExist:
+            raise ApiError('Recipe not found.', 404)
+        if not deleted:
+            raise ApiError('Review not found.', 404)
+        return HttpResponse(status = 204)
+
+    recipe = get_or_404(Recipe.objects, 'Recipe not found.', pk = recipe_id)
+
+    if recipe.author_id == request.user.pk:
+        raise ApiError('You can not review your own recipe.', 403)
+    data, _ = read_body(request)
+    try:
+        rating = int(data.get('rating'))
+    except (TypeError, ValueError):
+        raise ApiError('rating must be a number from 1 to 5.')
+    if not 1 <= rating <= 5:
+        raise ApiError('rating must be a number from 1 to 5.')
+
+    text = str(data.get('review', '')).strip()[:500]
+    if request.method == 'PUT':
+        # create or update, one upsert on the (recipe, reviewer) unique index
+        created = save_review(recipe.pk, request.user, rating, text)
+    else:
+        try:
+            with transaction.atomic():
+                Review.objects.create(recipe = recipe, reviewer = request.user, rating = rating, review = text)
+        except IntegrityError:
+            raise ApiError('You have already reviewed this recipe.', 409)
+        created = True
+    rows, shape = fetch(Review.objects.filter(recipe = recipe, reviewer = request.user), REVIEW_FIELDS, list(REVIEW_FIELDS))
+    return respond(shape(rows.get()), 201 if created else 200)
+
+
+async def profile_payload(request, queryset):
+    fields = selected_fields(request, PROFILE_FIELDS, PROFILE_FIELDS)
+    if 'recipe_count' in fields:
+        queryset = queryset.annotate(recipe_count = Count('recipes'))
+    rows, shape = fetch(queryset, PROFILE_FIELDS, fields)
+    row = await rows.afirst()
+    if row is None:
+        raise ApiError('User not found.', 404)
+    return respond(shape(row))
+
+
+@read_from_replica
+@api_view(['GET'])
+async def profileApi(request, username):
+    return await profile_payload(request, User.objects.filter(username = username))
+
+
+@api_view(['GET', 'PATCH', 'POST'], login = True)
+async def ownProfileApi(request):
+    user = await request.auser()
+    if request.method != 'GET':
+        response = await in_thread(changeProfile, request)
+        if response is not None:
+            return response
+    return await profile_payload(request, User.objects.filter(pk = user.pk))
+
+
+def changeProfile(request):
+    # the error response, or None once saved
+    data, files = read_body(request)
+    current = model_to_dict(request.user, fields = ProfileForm._meta.fields)
+    form = ProfileForm({**current, **data}, files, instance = request.user)
+    if not form.is_valid():
+        return respond({'errors': form_errors(form)}, 400)
+
+    current_pic = request.user.profile_pic.name
+    user = form.save(commit = False)
+    with transaction.atomic():
+        if 'profile_pic' in form.changed_data and form.cleaned_data.get('profile_pic'):
+            upload = form.cleaned_data['profile_pic']
+            user.profile_pic = current_pic
+            user.save()
+            stage_upload(user, 'profile_pic', upload)
+        else:
+            user.save()
+
+
+@read_from_replica
+@api_view(['GET'])
+async def autocompleteApi(request):
+    query = request.GET.get('q', '')
+    limit = min(parse_limit(request, 8), 20)
+    if not normalize(query):
+        return respond({'query': query, 'source': None, 'recipes': [], 'ingredients': []})
+
+    if autocomplete_index.needs_check():
+        await sync_to_async(autocomplete_index.check)()
+    suggestions, source = autocomplete_index.suggest(query, limit), 'index'
+    if suggestions is None:
+        recipes, ingredients = database_suggestions(query, limit)
+        suggestions = {'recipes': [row async for row in recipes], 'ingredients': [name async for name in ingredients]}
+        source = 'database'
+    return respond({'query': query, 'source': source, **suggestions})
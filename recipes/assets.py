@@ -0,0 +1,129 @@
+import re
+import subprocess
+import tempfile
+from pathlib import Path
+
+from django.conf import settings
+from fontTools import subset
+from tailwindcss_bin import find_tailwindcss_bin
+from xstatic.pkg import font_awesome
+
+# everything that can hold a Tailwind class or an icon name, read by both builds
+SOURCES = ['templates/**/*.html', 'static/js/**/*.js', '*/forms.py', '*/templatetags/*.py']
+
+STYLESHEET = Path('css/app.css')
+ICON_FONT = Path('fonts/fontawesome-subset')
+
+ICON_CLASS = re.compile(r'(?<![\w-])fa(?:-[a-z0-9]+)*(?![\w-])')
+CODEPOINT = re.compile(r'content:\s*"\\(f[0-9a-f]{3})"')
+
+
+def source_files():
+    base = Path(settings.BASE_DIR)
+    return sorted({path for pattern in SOURCES for path in base.glob(pattern)})
+
+
+def used_icon_classes():
+    return {name for path in source_files() for name in ICON_CLASS.findall(path.read_text(encoding = 'utf-8'))}
+
+
+def css_blocks(css):
+    # top level (prelude, body) pairs, @keyframes bodies keep their nested rules
+    css = re.sub(r'/\*.*?\*/', '', css, flags = re.S)
+    blocks, depth, start = [], 0, 0
+    for position, char in enumerate(css):
+        if char == '{':
+            if depth == 0:
+                prelude, start = css[start:position].strip(), position + 1
+            depth += 1
+        elif char == '}':
+            depth -= 1
+            if depth == 0:
+                blocks.append((prelude, css[start:position].strip()))
+                start = position + 1
+    return blocks
+
+
+def minify(css):
+    css = re.sub(r'\s+', ' ', css)
+    return re.sub(r'\s*([{};:,>])\s*', r'\1', css).replace(';}', '}')
+
+
+def icon_css(used):
+    """
+    (css, codepoints) of Font Awesome 4.7 cut down to the classes in use:
+    icons nobody references and aliases of the ones kept are dropped, the
+    spin animation only stays when fa-spin or fa-pulse does.
+    """
+    source = (Path(font_awesome.BASE_DIR) / 'css' / 'font-awesome.css').read_text(encoding = 'utf-8')
+    # relative to STYLESHEET, the manifest storage rewrites it to the hashed name
+    font_url = f'../{ICON_FONT}'
+    rules = [
+        "@font-face{font-family:'FontAwesome';"
+        f"src:url('{font_url}.woff2') format('woff2'),url('{font_url}.woff') format('woff');"
+        # private use codepoints, better invisible for a moment than a box
+        'font-weight:normal;font-style:normal;font-display:block}'
+    ]
+    for prelude, body in css_blocks(source):
+        if prelude.startswith('@font-face'):
+            continue
+        if 'keyframes' in prelude:
+            if used & {'fa-spin', 'fa-pulse'}:
+                rules.append(f'{prelude}{{{body}}}')
+            continue
+        # a selector stays when every class it names is in use
+        selectors = [
+            selector.strip() for selector in prelude.split(',')
+            if (classes := set(re.findall(r'\.([\w-]+)', selector))) and classes <= used
+        ]
+        if selectors:
+            rules.append(f"{','.join(selectors)}{{{body}}}")
+
+    css = minify(''.join(rules))
+    return css, sorted({int(codepoint, 16) for codepoint in CODEPOINT.findall(css)})
+
+
+def subset_icon_font(codepoints, output):
+    ttf = Path(font_awesome.BASE_DIR) / 'fonts' / 'fontawesome-webfont.ttf'
+    for flavor in ('woff2', 'woff'):
+        options = subset.Options(flavor = flavor, layout_features = [], name_IDs = [], notdef_outline = True, drop_tables = ['FFTM'])
+        font = subset.load_font(str(ttf), options)
+        subsetter = subset.Subsetter(options)
+        subsetter.populate(unicodes = codepoints)
+        subsetter.subset(font)
+        subset.save_font(font, f'{output}.{flavor}', options)
+
+
+def tailwind_css():
+    # automatic source detection off, only what SOURCES lists ends up in the build
+    base = Path(settings.BASE_DIR)
+    lines = ['@import "tailwindcss" source(none);'] + [f'@source "{base / pattern}";' for pattern in SOURCES]
+    with tempfile.TemporaryDirectory() as directory:
+        entry, output = Path(directory) / 'input.css', Path(directory) / 'output.css'
+        entry.write_text('\n'.join(lines) + '\n')
+        subprocess.run(
+            [find_tailwindcss_bin(), '--input', str(entry), '--output', str(output), '--minify'],
+            check = True, capture_output = True, cwd = base,
+        )
+        return output.read_text(encoding = 'utf-8')
+
+
+def build_assets(static_dir = None):
+    """
+    Write the site's stylesheet, Tailwind utilities found in SOURCES plus
+    the Font Awesome rules in use, and the matching icon font subset into
+    static_dir (the first STATICFILES_DIRS entry). Returns {path: bytes}.
+    """
+    static_dir = Path(static_dir or settings.STATICFILES_DIRS[0])
+    icons, codepoints = icon_css(used_icon_classes())
+
+    stylesheet = static_dir / STYLESHEET
+    stylesheet.parent.mkdir(parents = True, exist_ok = True)
+    stylesheet.write_text(tailwind_css().rstrip() + '\n' + icons + '\n', encoding = 'utf-8')
+
+    font = static_dir / ICON_FONT
+    font.parent.mkdir(parents = True, exist_ok = True)
+    subset_icon_font(codepoints, font)
+
+    written = [stylesheet, font.with_suffix('.woff2'), font.with_suffix('.woff')]
+    return {str(path.relative_to(static_dir)): path.stat().st_size for path in written}
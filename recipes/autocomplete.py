@@ -0,0 +1,212 @@
+import logging
+import os
+import sys
+import threading
+import time
+from bisect import bisect_left, insort
+
+from django.conf import settings
+from django.db import connection
+from django.db.models.functions import Lower
+
+from recipes.cache import bump_version, get_versions
+from recipes.ingredients import parse_ingredients
+from recipes.models import Ingredient, Recipe
+
+logger = logging.getLogger(__name__)
+
+VERSION = ('autocomplete', 'all')
+
+
+def normalize(text):
+    return ' '.join(text.lower().split())
+
+
+def title_keys(title):
+    # every word start, so "pan" finds "Matar Paneer" as well as "Paneer Tikka"
+    words = normalize(title).split(' ')
+    return [' '.join(words[start:]) for start in range(len(words)) if words[start]]
+
+
+def prefix_range(entries, prefix):
+    # the (key, ...) tuples whose key starts with prefix sit in one run of a sorted list
+    position = bisect_left(entries, (prefix,))
+    while position < len(entries) and entries[position][0].startswith(prefix):
+        yield entries[position]
+        position += 1
+
+
+class PrefixIndex:
+    """
+    Recipe titles and ingredient names held as sorted lists in this process,
+    answered with bisect in O(log n + limit). Recipe signals apply their
+    own changes directly; a write made by another process moves the shared
+    cache version and this copy is rebuilt in the background, still answering
+    from the old lists meanwhile. Until the first build finishes, suggest()
+    returns None and callers go to the database.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.entries = None
+        self.titles = {}
+        self.ingredients = []
+        self.version = None
+        self.checked_at = 0.0
+        self.building = False
+        self.last_build = 0.0
+        self.thread = None
+        self.stats = {}
+
+    @property
+    def ready(self):
+        return self.entries is not None
+
+    def build(self):
+        start = time.perf_counter()
+        version = get_versions(VERSION)[0]
+        titles = dict(Recipe.objects.values_list('pk', 'title').iterator(chunk_size = 5000))
+        entries = sorted((key, pk) for pk, title in titles.items() for key in title_keys(title))
+        ingredients = list(Ingredient.objects.order_by('name').values_list('name', flat = True).iterator(chunk_size = 5000))
+
+        with self.lock:
+            self.entries, self.titles, self.ingredients, self.version = entries, titles, ingredients, version
+            self.checked_at = time.monotonic()
+            self.stats = {
+                'recipes': len(titles),
+                'title_keys': len(entries),
+                'ingredients': len(ingredients),
+                'build_ms': round((time.perf_counter() - start) * 1000, 1),
+                'memory_bytes': self.memory_bytes(),
+            }
+        return self.stats
+
+    def memory_bytes(self):
+        # the lists, their tuples and strings, the id -> title dict; ints are small and shared
+        size = sys.getsizeof(self.entries) + sum(sys.getsizeof(entry) + sys.getsizeof(entry[0]) for entry in self.entries)
+        size += sys.getsizeof(self.titles) + sum(sys.getsizeof(title) for title in self.titles.values())
+        size += sys.getsizeof(self.ingredients) + sum(sys.getsizeof(name) for name in self.ingredients)
+        return size
+
+    def build_in_background(self):
+        with self.lock:
+            if self.building or (self.ready and time.monotonic() - self.last_build < settings.AUTOCOMPLETE_REBUILD_INTERVAL):
+                return
+            self.building = True
+            self.last_build = time.monotonic()
+
+        def run(threaded):
+            try:
+                self.build()
+            except Exception:
+                logger.exception('Building the autocomplete index failed')
+            finally:
+                self.building = False
+                if threaded:
+                    # a thread of its own, its connection would otherwise stay open forever
+                    connection.close()
+
+        if settings.AUTOCOMPLETE_BACKGROUND_BUILD:
+            self.thread = threading.Thread(target = run, args = (True,), name = 'autocomplete-index', daemon = True)
+            self.thread.start()
+        else:
+            run(False)
+
+    def needs_check(self):
+        return not self.ready or time.monotonic() - self.checked_at >= settings.AUTOCOMPLETE_CHECK_INTERVAL
+
+    def check(self):
+        """
+        Start a build when the index is cold or another process changed recipes
+        since it was built. At most one cache read every AUTOCOMPLETE_CHECK_INTERVAL.
+        """
+        if self.ready:
+            self.checked_at = time.monotonic()
+            if get_versions(VERSION)[0] == self.version:
+                return
+        self.build_in_background()
+
+    def suggest(self, query, limit):
+        prefix = normalize(query)
+        if not self.ready:
+            return None
+        with self.lock:
+            recipes, seen = [], set()
+            for _, pk in prefix_range(self.entries, prefix):
+                if pk not in seen:
+                    seen.add(pk)
+                    recipes.append({'id': pk, 'title': self.titles[pk]})
+                    if len(recipes) == limit:
+                        break
+            start = bisect_left(self.ingredients, prefix)
+            ingredients = [name for name in self.ingredients[start:start + limit] if name.startswith(prefix)]
+        return {'recipes': recipes, 'ingredients': ingredients}
+
+    def changed(self, update):
+        # apply a local write, and keep our version only if nobody else wrote in between
+        with self.lock:
+            if self.ready:
+                update()
+            expected = self.version
+        version = bump_version(*VERSION)
+        with self.lock:
+            if expected is not None and version == expected + 1:
+                self.version = version
+
+    def add_recipe(self, pk, title, ingredients_list = ''):
+        def update():
+            self.remove_entries(pk)
+            self.titles[pk] = title
+            for key in title_keys(title):
+                insort(self.entries, (key, pk))
+            for name, _, _ in parse_ingredients(ingredients_list):
+                position = bisect_left(self.ingredients, name)
+                if position == len(self.ingredients) or self.ingredients[position] != name:
+                    self.ingredients.insert(position, name)
+        self.changed(update)
+
+    def remove_recipe(self, pk):
+        self.changed(lambda: self.remove_entries(pk))
+
+    def remove_entries(self, pk):
+        title = self.titles.pop(pk, None)
+        for key in title_keys(title) if title else ():
+            position = bisect_left(self.entries, (key, pk))
+            if position < len(self.entries) and self.entries[position] == (key, pk):
+                del self.entries[position]
+
+
+index = PrefixIndex()
+
+
+def database_suggestions(query, limit):
+    """
+    The cold path: a range on the lower(title) and ingredient name indexes.
+    Matches whole-title prefixes only, not every word like the index does.
+    """
+    prefix = normalize(query)
+    upper = prefix[:-1] + chr(ord(prefix[-1]) + 1)
+    recipes = Recipe.objects.annotate(title_lower = Lower('title')).filter(
+        title_lower__gte = prefix, title_lower__lt = upper, title_lower__startswith = prefix,
+    ).order_by('title_lower', 'pk').values('id', 'title')[:limit]
+    ingredients = Ingredient.objects.filter(
+        name__gte = prefix, name__lt = upper, name__startswith = prefix,
+    ).order_by('name').values_list('name', flat = True)[:limit]
+    return recipes, ingredients
+
+
+def warm():
+    # called once per worker at startup, the first keystrokes go to the database until it is done
+    if settings.AUTOCOMPLETE_WARM_ON_START:
+        index.build_in_background()
+
+
+def finish_before_fork():
+    # the child of a fork has only the thread that forked: a build left running
+    # would be copied mid-import or holding the lock. A gunicorn master that
+    # preloads the app waits for it, and every worker starts with the index
+    if index.thread is not None and index.thread is not threading.current_thread():
+        index.thread.join()
+
+
+os.register_at_fork(before = finish_before_fork)
@@ -0,0 +1,217 @@
+import hashlib
+import time
+from functools import wraps
+
+from asgiref.sync import iscoroutinefunction, sync_to_async
+from django.conf import settings
+from django.core.cache import cache
+from django.utils.cache import get_conditional_response, patch_cache_control, patch_vary_headers
+from django.utils.http import quote_etag
+
+
+# Every cached page / fragment key embeds the current version of the objects it
+# shows. Signals bump those versions, so stale entries are never read again and
+# simply expire. Versions start from a timestamp, so an evicted version can't
+# collide with an older one that still has entries cached.
+
+def version_key(kind, pk):
+    return f'version:{kind}:{pk}'
+
+
+def get_versions(*objects):
+    keys = [version_key(kind, pk) for kind, pk in objects]
+    versions = cache.get_many(keys)
+    for key in keys:
+        if key not in versions:
+            cache.add(key, time.time_ns(), None)
+            versions[key] = cache.get(key)
+    return [versions[key] for key in keys]
+
+
+def bump_version(kind, pk):
+    key = version_key(kind, pk)
+    try:
+        return cache.incr(key)
+    except ValueError:
+        version = time.time_ns()
+        cache.set(key, version, None)
+        return version
+
+
+def count(name, hit, amount = 1):
+    if not amount:
+        return
+    key = f'stats:{name}:{"hits" if hit else "misses"}'
+    try:
+        cache.incr(key, amount)
+    except ValueError:
+        if not cache.add(key, amount, None):
+            cache.incr(key, amount)
+
+
+def cache_stats():
+    names = ('page', 'fragment')
+    keys = [f'stats:{name}:{outcome}' for name in names for outcome in ('hits', 'misses')]
+    values = cache.get_many(keys)
+    stats = {}
+    for name in names:
+        hits = values.get(f'stats:{name}:hits', 0)
+        misses = values.get(f'stats:{name}:misses', 0)
+        total = hits + misses
+        stats[name] = {'hits': hits, 'misses': misses, 'hit_rate': round(hits / total, 3) if total else 0}
+    return stats
+
+
+def reset_cache_stats():
+    cache.delete_many([f'stats:{name}:{outcome}' for name in ('page', 'fragment') for outcome in ('hits', 'misses')])
+
+
+def fragment_key(name, objects, versions):
+    return f'fragment:{name}:' + ':'.join(f'{kind}{pk}.{version}' for (kind, pk), version in zip(objects, versions))
+
+
+def get_fragment(name, objects):
+    key = fragment_key(name, objects, get_versions(*objects))
+    return key, cache.get(key)
+
+
+def get_fragments(name, objects_list):
+    """
+    get_fragment for every fragment of a page at once, [(key, content or
+    None)] in the order of objects_list: one get_many for all the versions,
+    one for the fragments, and the hits and misses counted once each.
+    """
+    shown = list(dict.fromkeys(obj for objects in objects_list for obj in objects))
+    versions = dict(zip(shown, get_versions(*shown)))
+    keys = [fragment_key(name, objects, [versions[obj] for obj in objects]) for objects in objects_list]
+    found = cache.get_many(keys)
+    hits = sum(key in found for key in keys)
+    count('fragment', True, hits)
+    count('fragment', False, len(keys) - hits)
+    return [(key, found.get(key)) for key in keys]
+
+
+def set_fragment(key, content):
+    cache.set(key, content, settings.CACHE_FRAGMENT_TIMEOUT)
+
+
+def set_fragments(contents):
+    cache.set_many(contents, settings.CACHE_FRAGMENT_TIMEOUT)
+
+
+def is_cacheable_request(request):
+    # only anonymous visitors with no session and no pending flash messages
+    # see the same page as everyone else
+    return (
+        request.method in ('GET', 'HEAD')
+        and settings.SESSION_COOKIE_NAME not in request.COOKIES
+        and 'messages' not in request.COOKIES
+        and not request.user.is_authenticated
+    )
+
+
+def cached_page(request, objects):
+    """
+    (key, cached response or None) for a cacheable request, (None, None)
+    when the page has to be rendered for this visitor.
+    """
+    if not is_cacheable_request(request):
+        return None, None
+    versions = get_versions(*objects)
+    path = hashlib.md5(request.get_full_path().encode()).hexdigest()
+    key = f'page:{path}:' + '.'.join(str(version) for version in versions)
+    response = cache.get(key)
+    count('page', response is not None)
+    return key, response
+
+
+def store_page(key, response):
+    if key and response.status_code == 200 and not response.cookies and not response.streaming:
+        cache.set(key, response, settings.CACHE_PAGE_TIMEOUT)
+
+
+def cache_page_for_anonymous(versions_for):
+    """
+    Cache the whole rendered response for anonymous visitors. versions_for
+    receives the view arguments and returns the (kind, pk) objects the page
+    shows, e.g. [('recipe', recipe_id)]. Works on sync and async views.
+    """
+    def decorator(view):
+        if iscoroutinefunction(view):
+            @wraps(view)
+            async def asyncWrapper(request, *args, **kwargs):
+                # cache clients are thread safe, so lookups don't queue behind the ORM's thread
+                key, response = await sync_to_async(cached_page, thread_sensitive = False)(request, versions_for(request, *args, **kwargs))
+                if response is not None:
+                    return response
+                response = await view(request, *args, **kwargs)
+                await sync_to_async(store_page, thread_sensitive = False)(key, response)
+                return response
+            return asyncWrapper
+
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            key, response = cached_page(request, versions_for(request, *args, **kwargs))
+            if response is not None:
+                return response
+            response = view(request, *args, **kwargs)
+            store_page(key, response)
+            return response
+        return wrapper
+    return decorator
+
+
+def page_etag(request, user, state):
+    # logged-in pages show who is viewing and embed the CSRF token, so both go in the tag
+    viewer = (user.pk, request.COOKIES.get(settings.CSRF_COOKIE_NAME)) if user.is_authenticated else None
+    return quote_etag(hashlib.md5(repr((state, viewer)).encode()).hexdigest())
+
+
+def revalidated(response, etag, user):
+    if response.status_code in (200, 304):
+        response['ETag'] = etag
+        patch_cache_control(response, no_cache = True, private = user.is_authenticated)
+    patch_vary_headers(response, ['Cookie'])
+    return response
+
+
+def conditional_page(state_for):
+    """
+    ETag revalidation before the view runs. state_for receives the view
+    arguments and returns whatever the rendered page depends on, read in one
+    small query, or None to skip the check (the view then 404s as usual). A
+    matching If-None-Match gets a 304 without rendering anything.
+    """
+    def skip(request):
+        # pending flash messages are shown once, the page must be rendered for them
+        return request.method not in ('GET', 'HEAD') or 'messages' in request.COOKIES
+
+    def decorator(view):
+        if iscoroutinefunction(view):
+            @wraps(view)
+            async def asyncWrapper(request, *args, **kwargs):
+                if skip(request):
+                    return await view(request, *args, **kwargs)
+                state = await sync_to_async(state_for)(request, *args, **kwargs)
+                if state is None:
+                    return await view(request, *args, **kwargs)
+
+                user = await request.auser()
+                etag = page_etag(request, user, state)
+                response = get_conditional_response(request, etag = etag) or await view(request, *args, **kwargs)
+                return revalidated(response, etag, user)
+            return asyncWrapper
+
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            if skip(request):
+                return view(request, *args, **kwargs)
+            state = state_for(request, *args, **kwargs)
+            if state is None:
+                return view(request, *args, **kwargs)
+
+            etag = page_etag(request, request.user, state)
+            response = get_conditional_response(request, etag = etag) or view(request, *args, **kwargs)
+            return revalidated(response, etag, request.user)
+        return wrapper
+    return decorator
@@ -0,0 +1,89 @@
+import os
+from io import BytesIO
+
+from django.core.files.base import ContentFile
+
+RECIPE_IMAGE_WIDTHS = (320, 640, 960)
+PROFILE_PIC_WIDTHS = (96, 192)
+
+FORMATS = {
+    'webp': ('WEBP', {'quality': 80, 'method': 4}),
+    'jpeg': ('JPEG', {'quality': 82, 'optimize': True, 'progressive': True}),
+}
+
+
+def derivative_name(name, width, extension):
+    base, _ = os.path.splitext(name)
+    return f'{base}_w{width}.{extension}'
+
+
+def load_image(fieldfile):
+    # imported here, web workers that never resize an upload don't pay for Pillow at startup
+    from PIL import Image, ImageOps
+
+    with fieldfile.storage.open(fieldfile.name, 'rb') as source:
+        image = Image.open(source)
+        image.load()
+    image = ImageOps.exif_transpose(image)
+    if image.mode in ('RGBA', 'LA', 'P'):
+        # JPEG has no alpha, flatten transparent PNGs onto white
+        image = image.convert('RGBA')
+        background = Image.new('RGB', image.size, 'white')
+        background.paste(image, mask = image.getchannel('A'))
+        return background
+    return image.convert('RGB')
+
+
+def generate_derivatives(fieldfile, widths):
+    """
+    Save resized WebP and JPEG copies of an uploaded image next to the original
+    through the field's own storage. Returns the variants mapping stored on the
+    model, e.g. {'source': name, 'webp': {'320': name, ...}, 'jpeg': {...}}.
+    """
+    from PIL import Image
+
+    image = load_image(fieldfile)
+    storage = fieldfile.storage
+
+    # never upscale, an image narrower than every width gets one copy at its own size
+    targets = [width for width in widths if width < image.width] or [image.width]
+    variants = {'source': fieldfile.name, 'width': image.width}
+    for extension, (pil_format, options) in FORMATS.items():
+        variants[extension] = {}
+        for width in targets:
+            resized = image.copy()
+            resized.thumbnail((width, image.height), Image.LANCZOS)
+            buffer = BytesIO()
+            resized.save(buffer, pil_format, **options)
+            name = storage.save(derivative_name(fieldfile.name, width, extension), ContentFile(buffer.getvalue()))
+            variants[extension][str(width)] = name
+    return variants
+
+
+def delete_derivatives(storage, variants):
+    for extension in FORMATS:
+        for name in (variants or {}).get(extension, {}).values():
+            storage.delete(name)
+
+
+def with_auto_now(instance, fields):
+    # update_fields skips auto_now columns unless listed, and updated_at is what ETags read
+    return list(fields) + [field.name for field in instance._meta.concrete_fields if getattr(field, 'auto_now', False)]
+
+
+def refresh_derivatives(instance, field_name, variants_field, widths, force = False):
+    """
+    Bring instance.<variants_field> in line with instance.<field_name>. Only the
+    variants field is saved, so the save signals refresh cached pages and see
+    the derivatives as up to date.
+    """
+    fieldfile = getattr(instance, field_name)
+    variants = getattr(instance, variants_field) or {}
+    if not force and variants.get('source') == (fieldfile.name or None):
+        return variants
+
+    delete_derivatives(fieldfile.storage, variants)
+    variants = generate_derivatives(fieldfile, widths) if fieldfile else {}
+    setattr(instance, variants_field, variants)
+    instance.save(update_fields = with_auto_now(instance, [variants_field]))
+    return variants
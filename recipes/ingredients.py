@@ -0,0 +1,81 @@
+import re
+
+from recipes.models import Ingredient, RecipeIngredient
+
+# "Rice - 150gm", "Paneer: 500 g", "Onions - 2 medium", "Salt to taste"
+LINE_SPLIT = re.compile(r'\s+[-–]\s*|\s*[-–]\s+|[-–](?=\d)|\s*:\s*')
+QUANTITY = r'(?P<quantity>\d+(?:[.,/]\d+)?(?:\s*-\s*\d+(?:[.,/]\d+)?)?|[½¼¾⅓⅔])'
+AMOUNT = re.compile(rf'^{QUANTITY}\s*(?P<unit>.*)$')
+UNITS = (
+    r'(?:g|gms?|grams?|kgs?|kilos?|kilograms?|mg|ml|l|litres?|liters?|oz|ounces?|lbs?|pounds?|'
+    r'cups?|tbsps?|tablespoons?|tsps?|teaspoons?|pinch(?:es)?|dash(?:es)?|cloves?|bunch(?:es)?|'
+    r'pieces?|pcs|cans?|slices?|sticks?|sprigs?|handfuls?|inch(?:es)?|cm)'
+)
+# "2 cups flour", "200gm paneer", "1/2 tsp of salt"
+LEADING_AMOUNT = re.compile(rf'^{QUANTITY}\s*(?:(?P<unit>{UNITS})\.?\s+(?:of\s+)?)?(?P<name>[^\d\s].*)$', re.IGNORECASE)
+# "Rice 150gm", "Eggs 2"
+TRAILING_AMOUNT = re.compile(rf'^(?P<name>.*?[^\d\s])\s+{QUANTITY}\s*(?P<unit>[^\d\s].*)?$')
+
+
+def normalize_name(name):
+    return ' '.join(name.lower().split())[:100]
+
+
+def parse_line(line):
+    """
+    (name, quantity, unit) of one line of an ingredients list, the amount
+    before the name, after it or after a separator. The name is what is
+    left once the amount is taken out: "2 cups flour" and "Flour - 2 cups"
+    are both flour.
+    """
+    line = line.strip().lstrip('•*').strip()
+    if not line:
+        return None
+
+    # before splitting, "3-4 green chillies" would split on its range
+    match = LEADING_AMOUNT.match(line)
+    if match:
+        name, quantity, unit = match.group('name'), match.group('quantity'), match.group('unit') or ''
+    else:
+        parts = LINE_SPLIT.split(line, maxsplit = 1)
+        match = None if len(parts) > 1 else TRAILING_AMOUNT.match(line)
+        if match:
+            name, quantity, unit = match.group('name'), match.group('quantity'), match.group('unit') or ''
+        else:
+            name, quantity, unit = parts[0], '', ''
+            if len(parts) > 1:
+                amount = parts[1].strip()
+                match = AMOUNT.match(amount)
+                if match:
+                    quantity, unit = match.group('quantity'), match.group('unit')
+                else:
+                    unit = amount
+
+    name = normalize_name(name)
+    if not name:
+        return None
+    return name, quantity.replace(' ', '')[:20], unit.strip()[:30]
+
+
+def parse_ingredients(text):
+    return [parsed for parsed in map(parse_line, (text or '').splitlines()) if parsed]
+
+
+def sync_ingredients(recipes):
+    """
+    Rewrite the RecipeIngredient rows of the given recipes from their
+    ingredients_list text. Works in a handful of queries however many recipes
+    are passed, so imports use it in batches.
+    """
+    parsed = {recipe.pk: parse_ingredients(recipe.ingredients_list) for recipe in recipes}
+    names = {name for lines in parsed.values() for name, _, _ in lines}
+
+    Ingredient.objects.bulk_create([Ingredient(name = name) for name in names], ignore_conflicts = True)
+    ingredient_ids = dict(Ingredient.objects.filter(name__in = names).values_list('name', 'pk'))
+
+    RecipeIngredient.objects.filter(recipe_id__in = parsed.keys()).delete()
+    RecipeIngredient.objects.bulk_create([
+        RecipeIngredient(recipe_id = recipe_id, ingredient_id = ingredient_ids[name], quantity = quantity, unit = unit, position = position)
+        for recipe_id, lines in parsed.items()
+        for position, (name, quantity, unit) in enumerate(lines)
+    ])
@@ -0,0 +1,22 @@
+import json
+
+from django.core.management.base import BaseCommand
+
+from recipes.autocomplete import PrefixIndex
+
+
+class Command(BaseCommand):
+    help = 'Build the autocomplete prefix index once and report its size, memory footprint and build time.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--json', action = 'store_true', help = 'Print the numbers as JSON.')
+
+    def handle(self, *args, **options):
+        stats = PrefixIndex().build()
+        if options['json']:
+            self.stdout.write(json.dumps(stats))
+            return
+        self.stdout.write(
+            f"{stats['recipes']} recipes ({stats['title_keys']} title keys) and {stats['ingredients']} ingredients, "
+            f"{stats['memory_bytes'] / 1024 / 1024:.1f} MB, built in {stats['build_ms']} ms"
+        )
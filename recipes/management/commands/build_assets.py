@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from recipes.assets import build_assets
+
+
+class Command(BaseCommand):
+    help = 'Build static/css/app.css (Tailwind + the Font Awesome icons in use) and the icon font subset from the templates.'
+
+    def handle(self, *args, **options):
+        for path, size in build_assets().items():
+            self.stdout.write(f'{path}: {size / 1024:.1f} KiB')
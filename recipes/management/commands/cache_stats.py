@@ -0,0 +1,17 @@
+import json
+
+from django.core.management.base import BaseCommand
+
+from recipes.cache import cache_stats, reset_cache_stats
+
+
+class Command(BaseCommand):
+    help = 'Show page and fragment cache hit/miss counters (shared when the cache backend is Redis or file based).'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--reset', action = 'store_true', help = 'Zero the counters after printing them.')
+
+    def handle(self, *args, **options):
+        self.stdout.write(json.dumps(cache_stats(), indent = 2))
+        if options['reset']:
+            reset_cache_stats()
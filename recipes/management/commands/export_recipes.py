@@ -0,0 +1,47 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from recipes.models import Recipe
+from recipes.transfer import FIELDS, FORMATS, RecordWriter, guess_format, open_text
+
+
+class Command(BaseCommand):
+    help = 'Stream every recipe to a JSONL or CSV file in constant memory.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('output', help = 'File to write, or - for stdout.')
+        parser.add_argument('--format', choices = FORMATS, help = 'Defaults to the file extension, then jsonl.')
+        parser.add_argument('--chunk-size', type = int, default = 2000)
+        parser.add_argument('--author', help = 'Only recipes by this username.')
+
+    def handle(self, *args, **options):
+        path = options['output']
+        format = options['format'] or guess_format(path)
+
+        recipes = Recipe.objects.order_by('pk')
+        if options['author']:
+            recipes = recipes.filter(author__username = options['author'])
+        columns = ['author__username' if field == 'author' else field for field in FIELDS]
+        created_at = FIELDS.index('created_at')
+
+        start = time.perf_counter()
+        exported = 0
+        try:
+            stream = open_text(path, 'w')
+        except OSError as error:
+            raise CommandError(error)
+        try:
+            writer = RecordWriter(stream, format)
+            # iterator() streams rows, a server-side cursor on PostgreSQL and chunked fetches elsewhere
+            for row in recipes.values_list(*columns).iterator(chunk_size = options['chunk_size']):
+                row = list(row)
+                row[created_at] = row[created_at].isoformat()
+                writer.write(row)
+                exported += 1
+        finally:
+            if path != '-':
+                stream.close()
+
+        elapsed = time.perf_counter() - start
+        self.stderr.write(f'Exported {exported} recipes in {elapsed:.1f}s ({exported / elapsed if elapsed else 0:.0f}/s).')
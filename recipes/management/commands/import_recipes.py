@@ -0,0 +1,157 @@
+import os
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from accounts.models import User
+from recipes.cache import bump_version
+from recipes.ingredients import sync_ingredients
+from recipes.models import Recipe
+from recipes.rankings import create_rankings
+from recipes.search import index_recipes
+from recipes.transfer import FORMATS, REQUIRED, delete_checkpoint, guess_format, open_text, read_checkpoint, read_records, write_checkpoint
+
+TEXT_FIELDS = ['title', 'small_description', 'estimated_prep_time', 'ingredients_list', 'process', 'image']
+MAX_LENGTHS = {field.name: field.max_length for field in Recipe._meta.concrete_fields if field.name in TEXT_FIELDS and field.max_length}
+
+
+class Command(BaseCommand):
+    help = 'Stream recipes from a JSONL or CSV file (see export_recipes) into the database in batches.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('input', help = 'File to read, or - for stdin.')
+        parser.add_argument('--format', choices = FORMATS, help = 'Defaults to the file extension, then jsonl.')
+        parser.add_argument('--batch-size', type = int, default = 1000)
+        parser.add_argument('--checkpoint', help = 'Name the progress is saved under, defaults to the absolute input path.')
+        parser.add_argument('--resume', action = 'store_true', help = 'Skip the records an interrupted run already imported.')
+        parser.add_argument('--restart', action = 'store_true', help = 'Forget the progress of an earlier run and start from the first record.')
+
+    def handle(self, *args, **options):
+        path = options['input']
+        format = options['format'] or guess_format(path)
+        # progress is an ImportCheckpoint row, committed with the batch it counts
+        checkpoint = options['checkpoint'] or (None if path == '-' else os.path.abspath(path))
+
+        if checkpoint and options['restart']:
+            delete_checkpoint(checkpoint)
+        state = read_checkpoint(checkpoint) if checkpoint else None
+        if state and not options['resume']:
+            raise CommandError(f'{checkpoint} was imported before, pass --resume to continue that import or --restart to start over.')
+        if state and state.get('complete'):
+            self.stdout.write(f'{path} was already imported completely.')
+            return
+        state = state or {'records': 0, 'imported': 0, 'skipped': 0}
+        already_done = state['records']
+
+        touched_authors = set()
+
+        start = time.perf_counter()
+        imported_now = 0
+        # (record number, recipe, author's username)
+        batch = []
+
+        def flush(records):
+            nonlocal batch, imported_now
+            # one query per batch for its authors, however many users the site has
+            usernames = {username for _, _, username in batch}
+            authors = dict(User.objects.filter(username__in = usernames).values_list('username', 'pk'))
+            recipes = []
+            for number, recipe, username in batch:
+                recipe.author_id = authors.get(username)
+                if recipe.author_id is None:
+                    self.skip(state, number, f'unknown author {username!r}')
+                else:
+                    recipes.append(recipe)
+
+            with transaction.atomic():
+                if recipes:
+                    # bulk_create stamps auto_now_add over the exported dates, they go back in afterwards
+                    created_at = [recipe.created_at for recipe in recipes]
+                    created = Recipe.objects.bulk_create(recipes)
+                    dated = []
+                    for recipe, value in zip(created, created_at):
+                        if value is not None:
+                            recipe.created_at = value
+                            dated.append(recipe)
+                    Recipe.objects.bulk_update(dated, ['created_at'])
+                    # bulk_create skips the post_save receivers, so index, parse ingredients and rank here
+                    index_recipes([recipe.pk for recipe in created])
+                    sync_ingredients(created)
+                    create_rankings(created)
+                state['imported'] += len(recipes)
+                state['records'] = records
+                if checkpoint:
+                    write_checkpoint(checkpoint, state)
+            imported_now += len(recipes)
+            touched_authors.update(recipe.author_id for recipe in recipes)
+            batch = []
+            elapsed = time.perf_counter() - start
+            self.stderr.write(f'{state["records"]} records read, {state["imported"]} imported, {state["skipped"]} skipped ({imported_now / elapsed if elapsed else 0:.0f} recipes/s)')
+
+        try:
+            stream = open_text(path, 'r')
+        except OSError as error:
+            raise CommandError(error)
+        try:
+            records = 0
+            for records, record in enumerate(read_records(stream, format), 1):
+                if records <= already_done:
+                    continue
+                recipe, author, problem = self.build(record)
+                if problem:
+                    self.skip(state, records, problem)
+                    continue
+                batch.append((records, recipe, author))
+                if len(batch) >= options['batch_size']:
+                    flush(records)
+            flush(max(records, already_done))
+        finally:
+            if path != '-':
+                stream.close()
+
+        state['complete'] = True
+        if checkpoint:
+            write_checkpoint(checkpoint, state)
+        bump_version('feed', 'all')
+        bump_version('autocomplete', 'all')
+        for username in User.objects.filter(pk__in = touched_authors).values_list('username', flat = True):
+            bump_version('profile', username)
+
+        elapsed = time.perf_counter() - start
+        self.stdout.write(self.style.SUCCESS(
+            f'Imported {imported_now} recipes in {elapsed:.1f}s ({imported_now / elapsed if elapsed else 0:.0f}/s), '
+            f'{state["skipped"]} records skipped in total.'
+        ))
+
+    def skip(self, state, number, problem):
+        state['skipped'] += 1
+        if state['skipped'] <= 20:
+            self.stderr.write(f'Record {number}: {problem}')
+
+    def build(self, record):
+        if isinstance(record, ValueError):
+            return None, None, f'invalid JSON ({record})'
+        record = {field: str(value).strip() for field, value in record.items() if field and value is not None}
+        missing = [field for field in REQUIRED if not record.get(field)]
+        if missing:
+            return None, None, f'missing {", ".join(missing)}'
+
+        values = {field: record.get(field, '') for field in TEXT_FIELDS}
+        too_long = [field for field, limit in MAX_LENGTHS.items() if len(values[field]) > limit]
+        if too_long:
+            return None, None, f'too long: {", ".join(too_long)}'
+
+        created_at = None
+        if record.get('created_at'):
+            try:
+                created_at = parse_datetime(record['created_at'])
+            except ValueError:
+                pass
+            if created_at is None:
+                return None, None, f'invalid created_at {record["created_at"]!r}'
+            if timezone.is_naive(created_at):
+                created_at = timezone.make_aware(created_at)
+        return Recipe(created_at = created_at, **values), record['author'], None
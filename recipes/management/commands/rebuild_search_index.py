@@ -0,0 +1,12 @@
+from django.core.management.base import BaseCommand
+
+from recipes.search import get_backend
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the full-text search index of all recipes.'
+
+    def handle(self, *args, **options):
+        backend = get_backend()
+        backend.rebuild()
+        self.stdout.write(self.style.SUCCESS(f'Rebuilt search index with {type(backend).__name__}.'))
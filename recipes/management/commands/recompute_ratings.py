@@ -0,0 +1,54 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Count, F, FloatField, IntegerField, OuterRef, Q, Subquery, Sum, Value
+from django.db.models.functions import Cast, Coalesce, NullIf, Round
+
+from recipes.models import Recipe, Review
+from recipes.signals import invalidateRecipePages
+
+
+class Command(BaseCommand):
+    help = 'Recompute the stored rating_sum / rating_count / rating_avg of recipes from their reviews.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type = int, default = 1000)
+        parser.add_argument('--dry-run', action = 'store_true', help = 'Only report recipes whose stored ratings drifted.')
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        reviews = Review.objects.filter(recipe = OuterRef('pk')).order_by().values('recipe')
+        actual_sum = Coalesce(Subquery(reviews.annotate(total = Sum('rating')).values('total')), Value(0), output_field = IntegerField())
+        actual_count = Coalesce(Subquery(reviews.annotate(total = Count('id')).values('total')), Value(0), output_field = IntegerField())
+
+        checked = drifted = 0
+        last_id = 0
+        while True:
+            ids = list(
+                Recipe.objects.filter(pk__gt = last_id).order_by('pk').values_list('pk', flat = True)[:batch_size]
+            )
+            if not ids:
+                break
+            last_id = ids[-1]
+            checked += len(ids)
+
+            with transaction.atomic():
+                stale = Recipe.objects.filter(pk__in = ids).annotate(
+                    actual_sum = actual_sum, actual_count = actual_count
+                ).filter(~Q(rating_sum = F('actual_sum')) | ~Q(rating_count = F('actual_count')))
+                stale_ids = list(stale.values_list('pk', flat = True))
+                drifted += len(stale_ids)
+
+                if stale_ids and not options['dry_run']:
+                    Recipe.objects.filter(pk__in = stale_ids).update(rating_sum = actual_sum, rating_count = actual_count)
+                    Recipe.objects.filter(pk__in = stale_ids).update(
+                        rating_avg = Coalesce(
+                            Round(Cast(F('rating_sum'), FloatField()) / NullIf(F('rating_count'), 0), 1),
+                            Value(0.0),
+                        )
+                    )
+                    # queryset updates send no signals, the pages and profile ETags showing these totals move here
+                    for recipe_id, author_username in Recipe.objects.filter(pk__in = stale_ids).values_list('pk', 'author__username'):
+                        invalidateRecipePages(recipe_id, author_username)
+
+        action = 'would be fixed' if options['dry_run'] else 'fixed'
+        self.stdout.write(self.style.SUCCESS(f'Checked {checked} recipes, {drifted} {action}.'))
@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+
+from recipes.cache import bump_version
+from recipes.rankings import refresh_rankings
+
+
+class Command(BaseCommand):
+    help = 'Recompute the top rated and trending leaderboards (RecipeRanking) of every recipe. Run it every few minutes.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type = int, default = 1000)
+
+    def handle(self, *args, **options):
+        refreshed = refresh_rankings(options['batch_size'])
+        # sorted feed pages are cached under the feed version
+        bump_version('feed', 'all')
+        self.stdout.write(self.style.SUCCESS(f'Refreshed the rankings of {refreshed} recipes.'))
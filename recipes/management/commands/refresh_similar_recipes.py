@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from recipes.similarity import refresh_similar_recipes
+
+
+class Command(BaseCommand):
+    help = 'Recompute the "You May Also Like" recipes (SimilarRecipe) of every recipe from ingredient TF-IDF vectors.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type = int, help = 'Recipes scored at a time, defaults to SIMILAR_RECIPES_CHUNK_SIZE.')
+
+    def handle(self, *args, **options):
+        refreshed = refresh_similar_recipes(options['chunk_size'])
+        self.stdout.write(self.style.SUCCESS(f'Refreshed the similar recipes of {refreshed} recipes.'))
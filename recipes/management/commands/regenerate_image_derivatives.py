@@ -0,0 +1,28 @@
+from django.core.management.base import BaseCommand
+
+from accounts.models import User
+from recipes.images import PROFILE_PIC_WIDTHS, RECIPE_IMAGE_WIDTHS, refresh_derivatives
+from recipes.models import Recipe
+
+
+class Command(BaseCommand):
+    help = 'Generate the resized WebP/JPEG copies of recipe images and profile pictures.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--force', action = 'store_true', help = 'Regenerate even when derivatives are up to date.')
+
+    def handle(self, *args, **options):
+        targets = [
+            (Recipe.objects.exclude(image = ''), 'image', 'image_variants', RECIPE_IMAGE_WIDTHS),
+            (User.objects.exclude(profile_pic = '').exclude(profile_pic = None), 'profile_pic', 'profile_pic_variants', PROFILE_PIC_WIDTHS),
+        ]
+        for queryset, field_name, variants_field, widths in targets:
+            done = failed = 0
+            for instance in queryset.only('pk', field_name, variants_field).iterator(chunk_size = 200):
+                try:
+                    refresh_derivatives(instance, field_name, variants_field, widths, force = options['force'])
+                    done += 1
+                except OSError as error:
+                    failed += 1
+                    self.stderr.write(f'{queryset.model.__name__} {instance.pk}: {error}')
+            self.stdout.write(f'{queryset.model.__name__}.{field_name}: {done} with derivatives, {failed} failed')
@@ -0,0 +1,18 @@
+import json
+
+from django.core.management.base import BaseCommand
+
+from recipeshare.instrumentation import request_stats, reset_request_stats
+
+
+class Command(BaseCommand):
+    help = 'Show per-view latency histograms, query counts and N+1 flags (shared across workers through the cache).'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--minutes', type = int, default = 15, help = 'How far back to look, at most REQUEST_METRICS_RETENTION.')
+        parser.add_argument('--reset', action = 'store_true', help = 'Clear the histograms after printing them.')
+
+    def handle(self, *args, **options):
+        self.stdout.write(json.dumps(request_stats(options['minutes']), indent = 2))
+        if options['reset']:
+            reset_request_stats()
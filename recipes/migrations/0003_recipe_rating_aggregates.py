@@ -0,0 +1,45 @@
+# Generated by Django 5.2.8 on 2026-10-18 19:30
+
+from django.db import migrations, models
+from django.db.models import Count, F, FloatField, IntegerField, OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Cast, Coalesce, NullIf, Round
+
+
+def backfill_ratings(apps, schema_editor):
+    Recipe = apps.get_model('recipes', 'Recipe')
+    Review = apps.get_model('recipes', 'Review')
+
+    reviews = Review.objects.filter(recipe=OuterRef('pk')).order_by().values('recipe')
+    Recipe.objects.update(
+        rating_sum=Coalesce(Subquery(reviews.annotate(total=Sum('rating')).values('total')), Value(0), output_field=IntegerField()),
+        rating_count=Coalesce(Subquery(reviews.annotate(total=Count('id')).values('total')), Value(0), output_field=IntegerField()),
+    )
+    Recipe.objects.update(
+        rating_avg=Coalesce(Round(Cast(F('rating_sum'), FloatField()) / NullIf(F('rating_count'), 0), 1), Value(0.0))
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0002_alter_recipe_options_alter_review_options_and_more'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='recipe',
+            name='rating_avg',
+            field=models.FloatField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='recipe',
+            name='rating_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='recipe',
+            name='rating_sum',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.RunPython(backfill_ratings, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,69 @@
+# Generated by Django 5.2.8 on 2026-10-18 19:32
+
+import django.contrib.postgres.search
+import django.db.models.deletion
+import recipes.models
+from django.db import migrations, models
+
+
+def create_search_index(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == 'postgresql':
+        schema_editor.execute(
+            "UPDATE recipes_recipe SET search_vector = "
+            "setweight(to_tsvector('english', coalesce(title, '')), 'A') || "
+            "setweight(to_tsvector('english', coalesce(ingredients_list, '')), 'B') || "
+            "setweight(to_tsvector('english', coalesce(small_description, '')), 'C')"
+        )
+        schema_editor.execute('CREATE INDEX recipes_recipe_search_gin ON recipes_recipe USING gin (search_vector)')
+    elif vendor == 'sqlite':
+        schema_editor.execute(
+            "CREATE VIRTUAL TABLE recipes_recipe_fts USING fts5("
+            "title, ingredients_list, small_description, tokenize = 'porter unicode61')"
+        )
+        schema_editor.execute(
+            "INSERT INTO recipes_recipe_fts (recipes_recipe_fts, rank) VALUES ('rank', 'bm25(10.0, 4.0, 1.0)')"
+        )
+        schema_editor.execute(
+            'INSERT INTO recipes_recipe_fts (rowid, title, ingredients_list, small_description) '
+            'SELECT id, title, ingredients_list, small_description FROM recipes_recipe'
+        )
+
+
+def drop_search_index(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == 'postgresql':
+        schema_editor.execute('DROP INDEX IF EXISTS recipes_recipe_search_gin')
+    elif vendor == 'sqlite':
+        schema_editor.execute('DROP TABLE IF EXISTS recipes_recipe_fts')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0003_recipe_rating_aggregates'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='recipe',
+            name='search_vector',
+            field=django.contrib.postgres.search.SearchVectorField(editable=False, null=True),
+        ),
+        migrations.CreateModel(
+            name='RecipeSearchIndex',
+            fields=[
+                ('recipe', models.OneToOneField(db_column='rowid', db_constraint=False, on_delete=django.db.models.deletion.DO_NOTHING, primary_key=True, related_name='search_index', serialize=False, to='recipes.recipe')),
+                ('title', models.TextField()),
+                ('ingredients_list', models.TextField()),
+                ('small_description', models.TextField()),
+                ('document', recipes.models.FullTextField(db_column='recipes_recipe_fts')),
+                ('rank', models.FloatField()),
+            ],
+            options={
+                'db_table': 'recipes_recipe_fts',
+                'managed': False,
+            },
+        ),
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
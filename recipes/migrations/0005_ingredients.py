@@ -0,0 +1,111 @@
+# Generated by Django 5.2.8 on 2026-10-18 19:36
+
+import re
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+BACKFILL_BATCH_SIZE = 500
+
+# recipes/ingredients.py as of this migration, frozen so a later parser change
+# can't change what the backfill did
+LINE_SPLIT = re.compile(r'\s+[-–]\s*|\s*[-–]\s+|[-–](?=\d)|\s*:\s*')
+AMOUNT = re.compile(r'^(?P<quantity>\d+(?:[.,/]\d+)?(?:\s*-\s*\d+(?:[.,/]\d+)?)?|[½¼¾⅓⅔])\s*(?P<unit>.*)$')
+
+
+def normalize_name(name):
+    return ' '.join(name.lower().split())[:100]
+
+
+def parse_line(line):
+    line = line.strip().lstrip('•*').strip()
+    if not line:
+        return None
+
+    parts = LINE_SPLIT.split(line, maxsplit=1)
+    name = normalize_name(parts[0])
+    if not name:
+        return None
+
+    quantity = unit = ''
+    if len(parts) > 1:
+        amount = parts[1].strip()
+        match = AMOUNT.match(amount)
+        if match:
+            quantity, unit = match.group('quantity').replace(' ', ''), match.group('unit').strip()
+        else:
+            unit = amount
+    return name, quantity[:20], unit[:30]
+
+
+def sync_ingredients(recipes, Ingredient, RecipeIngredient):
+    parsed = {recipe.pk: [line for line in map(parse_line, (recipe.ingredients_list or '').splitlines()) if line] for recipe in recipes}
+    names = {name for lines in parsed.values() for name, _, _ in lines}
+
+    Ingredient.objects.bulk_create([Ingredient(name=name) for name in names], ignore_conflicts=True)
+    ingredient_ids = dict(Ingredient.objects.filter(name__in=names).values_list('name', 'pk'))
+
+    RecipeIngredient.objects.filter(recipe_id__in=parsed.keys()).delete()
+    RecipeIngredient.objects.bulk_create([
+        RecipeIngredient(recipe_id=recipe_id, ingredient_id=ingredient_ids[name], quantity=quantity, unit=unit, position=position)
+        for recipe_id, lines in parsed.items()
+        for position, (name, quantity, unit) in enumerate(lines)
+    ])
+
+
+def backfill_ingredients(apps, schema_editor):
+    Recipe = apps.get_model('recipes', 'Recipe')
+    Ingredient = apps.get_model('recipes', 'Ingredient')
+    RecipeIngredient = apps.get_model('recipes', 'RecipeIngredient')
+
+    last_id = 0
+    while True:
+        batch = list(Recipe.objects.filter(pk__gt=last_id).order_by('pk').only('pk', 'ingredients_list')[:BACKFILL_BATCH_SIZE])
+        if not batch:
+            break
+        sync_ingredients(batch, Ingredient, RecipeIngredient)
+        last_id = batch[-1].pk
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0004_recipe_search'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Ingredient',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=100, unique=True)),
+            ],
+            options={
+                'ordering': ['name'],
+            },
+        ),
+        migrations.CreateModel(
+            name='RecipeIngredient',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('quantity', models.CharField(blank=True, max_length=20)),
+                ('unit', models.CharField(blank=True, max_length=30)),
+                ('position', models.PositiveSmallIntegerField(default=0)),
+                ('ingredient', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='recipe_ingredients', to='recipes.ingredient')),
+                ('recipe', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='recipe_ingredients', to='recipes.recipe')),
+            ],
+            options={
+                'ordering': ['recipe', 'position'],
+            },
+        ),
+        migrations.AddField(
+            model_name='recipe',
+            name='ingredients',
+            field=models.ManyToManyField(related_name='recipes', through='recipes.RecipeIngredient', to='recipes.ingredient'),
+        ),
+        migrations.AddIndex(
+            model_name='recipeingredient',
+            index=models.Index(fields=['ingredient', 'recipe'], name='recipes_ing_ingredient_recipe'),
+        ),
+        migrations.RunPython(backfill_ingredients, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,46 @@
+# Generated by Django 5.2.8 on 2026-10-18 20:00
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Sum
+
+
+def backfill_rankings(apps, schema_editor):
+    Recipe = apps.get_model('recipes', 'Recipe')
+    RecipeRanking = apps.get_model('recipes', 'RecipeRanking')
+
+    # scores only, trending is filled by the first `manage.py refresh_rankings`
+    totals = Recipe.objects.aggregate(ratings=Sum('rating_sum'), reviews=Sum('rating_count'))
+    mean = totals['ratings'] / totals['reviews'] if totals['reviews'] else settings.RANKING_PRIOR_MEAN
+    weight = settings.RANKING_PRIOR_WEIGHT
+    RecipeRanking.objects.bulk_create(
+        (
+            RecipeRanking(recipe_id=pk, score=(mean * weight + rating_sum) / (weight + rating_count))
+            for pk, rating_sum, rating_count in Recipe.objects.values_list('pk', 'rating_sum', 'rating_count').iterator()
+        ),
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0007_hot_path_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RecipeRanking',
+            fields=[
+                ('recipe', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='ranking', serialize=False, to='recipes.recipe')),
+                ('score', models.FloatField(default=0, help_text='Bayesian average rating')),
+                ('trending', models.FloatField(default=0, help_text='log2 of the time-decayed review weight, 0 without reviews')),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['-score', '-recipe'], name='recipes_ranking_top'), models.Index(fields=['-trending', '-recipe'], name='recipes_ranking_trending')],
+            },
+        ),
+        migrations.RunPython(backfill_rankings, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,20 @@
+# Generated by Django 5.2.8 on 2026-10-18 20:04
+
+import django.db.models.functions.text
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0008_recipe_rankings'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='recipe',
+            index=models.Index(django.db.models.functions.text.Lower('title'), name='recipes_recipe_title_lower'),
+        ),
+    ]
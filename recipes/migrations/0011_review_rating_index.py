@@ -0,0 +1,19 @@
+# Generated by Django 5.2.8 on 2026-10-18 20:37
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0010_similar_recipes'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='review',
+            index=models.Index(fields=['recipe', 'rating'], name='recipes_review_recipe_rating'),
+        ),
+    ]
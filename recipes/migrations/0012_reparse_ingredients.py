@@ -0,0 +1,96 @@
+# Generated by Django 5.2.8 on 2026-10-18 22:10
+
+import re
+
+from django.db import migrations
+
+BATCH_SIZE = 500
+
+# recipes/ingredients.py as of this migration: the name no longer keeps an
+# amount written before it ("2 cups flour") or after it without a separator ("Rice 150gm")
+LINE_SPLIT = re.compile(r'\s+[-–]\s*|\s*[-–]\s+|[-–](?=\d)|\s*:\s*')
+QUANTITY = r'(?P<quantity>\d+(?:[.,/]\d+)?(?:\s*-\s*\d+(?:[.,/]\d+)?)?|[½¼¾⅓⅔])'
+AMOUNT = re.compile(rf'^{QUANTITY}\s*(?P<unit>.*)$')
+UNITS = (
+    r'(?:g|gms?|grams?|kgs?|kilos?|kilograms?|mg|ml|l|litres?|liters?|oz|ounces?|lbs?|pounds?|'
+    r'cups?|tbsps?|tablespoons?|tsps?|teaspoons?|pinch(?:es)?|dash(?:es)?|cloves?|bunch(?:es)?|'
+    r'pieces?|pcs|cans?|slices?|sticks?|sprigs?|handfuls?|inch(?:es)?|cm)'
+)
+LEADING_AMOUNT = re.compile(rf'^{QUANTITY}\s*(?:(?P<unit>{UNITS})\.?\s+(?:of\s+)?)?(?P<name>[^\d\s].*)$', re.IGNORECASE)
+TRAILING_AMOUNT = re.compile(rf'^(?P<name>.*?[^\d\s])\s+{QUANTITY}\s*(?P<unit>[^\d\s].*)?$')
+
+
+def normalize_name(name):
+    return ' '.join(name.lower().split())[:100]
+
+
+def parse_line(line):
+    line = line.strip().lstrip('•*').strip()
+    if not line:
+        return None
+
+    match = LEADING_AMOUNT.match(line)
+    if match:
+        name, quantity, unit = match.group('name'), match.group('quantity'), match.group('unit') or ''
+    else:
+        parts = LINE_SPLIT.split(line, maxsplit=1)
+        match = None if len(parts) > 1 else TRAILING_AMOUNT.match(line)
+        if match:
+            name, quantity, unit = match.group('name'), match.group('quantity'), match.group('unit') or ''
+        else:
+            name, quantity, unit = parts[0], '', ''
+            if len(parts) > 1:
+                amount = parts[1].strip()
+                match = AMOUNT.match(amount)
+                if match:
+                    quantity, unit = match.group('quantity'), match.group('unit')
+                else:
+                    unit = amount
+
+    name = normalize_name(name)
+    if not name:
+        return None
+    return name, quantity.replace(' ', '')[:20], unit.strip()[:30]
+
+
+def sync_ingredients(recipes, Ingredient, RecipeIngredient):
+    parsed = {recipe.pk: [line for line in map(parse_line, (recipe.ingredients_list or '').splitlines()) if line] for recipe in recipes}
+    names = {name for lines in parsed.values() for name, _, _ in lines}
+
+    Ingredient.objects.bulk_create([Ingredient(name=name) for name in names], ignore_conflicts=True)
+    ingredient_ids = dict(Ingredient.objects.filter(name__in=names).values_list('name', 'pk'))
+
+    RecipeIngredient.objects.filter(recipe_id__in=parsed.keys()).delete()
+    RecipeIngredient.objects.bulk_create([
+        RecipeIngredient(recipe_id=recipe_id, ingredient_id=ingredient_ids[name], quantity=quantity, unit=unit, position=position)
+        for recipe_id, lines in parsed.items()
+        for position, (name, quantity, unit) in enumerate(lines)
+    ])
+
+
+def reparse_ingredients(apps, schema_editor):
+    Recipe = apps.get_model('recipes', 'Recipe')
+    Ingredient = apps.get_model('recipes', 'Ingredient')
+    RecipeIngredient = apps.get_model('recipes', 'RecipeIngredient')
+
+    last_id = 0
+    while True:
+        batch = list(Recipe.objects.filter(pk__gt=last_id).order_by('pk').only('pk', 'ingredients_list')[:BATCH_SIZE])
+        if not batch:
+            break
+        sync_ingredients(batch, Ingredient, RecipeIngredient)
+        last_id = batch[-1].pk
+
+    # names like "2 cups flour" that no recipe lists any more
+    Ingredient.objects.filter(recipe_ingredients__isnull=True).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0011_review_rating_index'),
+    ]
+
+    operations = [
+        migrations.RunPython(reparse_ingredients, migrations.RunPython.noop),
+    ]
@@ -1,12 +1,36 @@
+from django.contrib.postgres.search import SearchVectorField
 from django.db import models
+from django.db.models import Count, F, Value, FloatField, Lookup
+from django.db.models.functions import Cast, Coalesce, Lower, NullIf, Round
 from django.conf import settings
 from django.core.validators import MinValueValidator, MaxValueValidator
 
 
+class RecipeQuerySet(models.QuerySet):
+    def feed(self):
+        # everything a recipe card renders comes from this one query
+        return self.select_related('author').defer('ingredients_list', 'process').order_by('-created_at', '-id')
+
+    def with_ingredient(self, name):
+        from recipes.ingredients import normalize_name
+
+        matches = RecipeIngredient.objects.filter(ingredient__name = normalize_name(name))
+        return self.filter(pk__in = matches.values('recipe_id'))
+
+    def with_all_ingredients(self, names):
+        from recipes.ingredients import normalize_name
+
+        names = {normalize_name(name) for name in names}
+        matches = RecipeIngredient.objects.filter(ingredient__name__in = names).values('recipe_id').annotate(
+            matched = Count('ingredient_id', distinct = True)
+        ).filter(matched = len(names))
+        return self.filter(pk__in = matches.values('recipe_id'))
+
 
 class Recipe(models.Model):
     title = models.CharField(max_length = 100)
     image = models.ImageField(upload_to = 'recipe_images')
+    image_variants = models.JSONField(default = dict, blank = True, editable = False)
     small_description = models.TextField(max_length = 500)
 
     estimated_prep_time = models.CharField(max_length = 30, help_text = 'e.g. 30 Minutes or 1 Hour 30 Minutes')
@@ -17,20 +41,62 @@ class Recipe(models.Model):
     created_at = models.DateTimeField(auto_now_add = True)
     updated_at = models.DateTimeField(auto_now = True)
 
+    # kept in sync by recipes.signals on every review write, never edited by hand
+    rating_sum = models.PositiveIntegerField(default = 0, editable = False)
+    rating_count = models.PositiveIntegerField(default = 0, editable = False)
+    rating_avg = models.FloatField(default = 0, editable = False)
+
+    # parsed from ingredients_list on every save, see recipes.ingredients
+    ingredients = models.ManyToManyField('Ingredient', through = 'RecipeIngredient', related_name = 'recipes')
+
+    # filled by recipes.search on PostgreSQL, unused on other databases
+    search_vector = SearchVectorField(null = True, editable = False)
+
+    objects = RecipeQuerySet.as_manager()
+
     def average_rating(self):
-        reviews = self.reviews.all()
-        if reviews.exists():
-            return round((sum(r.rating for r in reviews) / reviews.count()), 1)
-        return 0
+        return self.rating_avg if self.rating_count else 0
     
     def total_reviews(self):
-        return self.reviews.count()
+        return self.rating_count
+
+    @classmethod
+    def apply_rating_change(cls, recipe_id, rating_delta, count_delta):
+        # single UPDATE, every right hand side reads the row's old values
+        new_sum = F('rating_sum') + rating_delta
+        new_count = F('rating_count') + count_delta
+        return cls.objects.filter(pk = recipe_id).update(
+            rating_sum = new_sum,
+            rating_count = new_count,
+            rating_avg = Coalesce(
+                Round(Cast(new_sum, FloatField()) / NullIf(new_count, 0), 1),
+                Value(0.0),
+            ),
+        )
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance.remember_ingredients()
+        return instance
+
+    def remember_ingredients(self):
+        # the text the parsed RecipeIngredient rows came from, None when deferred
+        self._saved_ingredients = self.__dict__.get('ingredients_list')
 
     def __str__(self):
         return f"{self.title} - {self.author.username}" 
     
     class Meta:
         ordering = ['-created_at']
+        indexes = [
+            # home feed and its cursor pages
+            models.Index(fields = ['-created_at', '-id'], name = 'recipes_recipe_feed'),
+            # profile listings
+            models.Index(fields = ['author', '-created_at', '-id'], name = 'recipes_recipe_author_feed'),
+            # title prefix lookups while the autocomplete index is cold
+            models.Index(Lower('title'), name = 'recipes_recipe_title_lower'),
+        ]
 
 
 
@@ -44,12 +110,128 @@ class Review(models.Model):
     created_at = models.DateTimeField(auto_now_add = True)
     updated_at = models.DateTimeField(auto_now = True)
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance.remember_rating()
+        return instance
+
+    def remember_rating(self):
+        # what the row looks like in the db, so a save only applies the difference
+        self._saved_rating = (self.__dict__.get('recipe_id'), self.__dict__.get('rating'))
+
     def __str__(self):
         return f"{self.reviewer.username} - {self.recipe.title} : {self.rating}"
     
     class Meta:
         unique_together = ['recipe', 'reviewer']
         ordering = ['-created_at']
+        indexes = [
+            # newest reviews of a recipe, the (recipe, reviewer) lookup uses the unique index
+            models.Index(fields = ['recipe', '-created_at', '-id'], name = 'recipes_review_recipe_recent'),
+            # the rating histogram, counted from the index alone
+            models.Index(fields = ['recipe', 'rating'], name = 'recipes_review_recipe_rating'),
+        ]
+
+
+class RecipeRanking(models.Model):
+    # one row per recipe, maintained by recipes.rankings, read by ?sort=top / ?sort=trending
+    recipe = models.OneToOneField(Recipe, on_delete = models.CASCADE, primary_key = True, related_name = 'ranking')
+    score = models.FloatField(default = 0, help_text = 'Bayesian average rating')
+    trending = models.FloatField(default = 0, help_text = 'log2 of the time-decayed review weight, 0 without reviews')
+    updated_at = models.DateTimeField(auto_now = True)
+
+    def __str__(self):
+        return f"{self.recipe_id}: {self.score:.2f} / {self.trending:.2f}"
+
+    class Meta:
+        indexes = [
+            models.Index(fields = ['-score', '-recipe'], name = 'recipes_ranking_top'),
+            models.Index(fields = ['-trending', '-recipe'], name = 'recipes_ranking_trending'),
+        ]
+
+
+
+class SimilarRecipe(models.Model):
+    # a recipe's nearest neighbours by ingredients, written by recipes.similarity, read by the detail page
+    recipe = models.ForeignKey(Recipe, on_delete = models.CASCADE, related_name = 'similar_recipes')
+    similar = models.ForeignKey(Recipe, on_delete = models.CASCADE, related_name = '+')
+    score = models.FloatField(help_text = 'Cosine similarity of the TF-IDF ingredient vectors')
+
+    def __str__(self):
+        return f"{self.recipe_id} -> {self.similar_id}: {self.score:.2f}"
+
+    class Meta:
+        indexes = [
+            models.Index(fields = ['recipe', '-score'], name = 'recipes_similar_recipe_score'),
+        ]
+
+
+
+class Ingredient(models.Model):
+    name = models.CharField(max_length = 100, unique = True)
+
+    def __str__(self):
+        return self.name
+
+    class Meta:
+        ordering = ['name']
+
+
+
+class RecipeIngredient(models.Model):
+    recipe = models.ForeignKey(Recipe, on_delete = models.CASCADE, related_name = 'recipe_ingredients')
+    ingredient = models.ForeignKey(Ingredient, on_delete = models.CASCADE, related_name = 'recipe_ingredients')
+    quantity = models.CharField(max_length = 20, blank = True)
+    unit = models.CharField(max_length = 30, blank = True)
+    position = models.PositiveSmallIntegerField(default = 0)
 
+    def __str__(self):
+        return f"{self.ingredient.name} - {self.quantity}{self.unit}"
+
+    class Meta:
+        ordering = ['recipe', 'position']
+        indexes = [
+            # "recipes containing X" starts from the ingredient side
+            models.Index(fields = ['ingredient', 'recipe'], name = 'recipes_ing_ingredient_recipe'),
+        ]
 
 
+
+class FullTextField(models.TextField):
+    pass
+
+
+@FullTextField.register_lookup
+class Match(Lookup):
+    lookup_name = 'match'
+
+    def as_sql(self, compiler, connection):
+        lhs, lhs_params = self.process_lhs(compiler, connection)
+        rhs, rhs_params = self.process_rhs(compiler, connection)
+        return f'{lhs} MATCH {rhs}', lhs_params + rhs_params
+
+
+class RecipeSearchIndex(models.Model):
+    # the SQLite FTS5 table from migration 0004, the hidden columns named after
+    # the table and "rank" are what MATCH and bm25 ordering work on
+    recipe = models.OneToOneField(Recipe, on_delete = models.DO_NOTHING, primary_key = True, db_column = 'rowid', db_constraint = False, related_name = 'search_index')
+    title = models.TextField()
+    ingredients_list = models.TextField()
+    small_description = models.TextField()
+    document = FullTextField(db_column = 'recipes_recipe_fts')
+    rank = models.FloatField()
+
+    class Meta:
+        managed = False
+        db_table = 'recipes_recipe_fts'
+
+
+class ImportCheckpoint(models.Model):
+    # import_recipes progress, written in the same transaction as each batch
+    name = models.CharField(max_length = 500, unique = True)
+    state = models.JSONField(default = dict)
+    updated_at = models.DateTimeField(auto_now = True)
+
+    def __str__(self):
+        return self.name
@@ -0,0 +1,184 @@
+import base64
+import binascii
+import hashlib
+import json
+from datetime import datetime
+from functools import reduce
+
+from django.core.cache import cache
+from django.core.exceptions import FieldDoesNotExist, ValidationError
+from django.db import connection
+from django.db.models import Q
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+def encode_cursor(direction, values):
+    payload = [direction] + [value.isoformat() if isinstance(value, datetime) else value for value in values]
+    return base64.urlsafe_b64encode(json.dumps(payload, separators = (',', ':')).encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor):
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        direction, *values = json.loads(base64.urlsafe_b64decode(padded.encode()))
+    except (ValueError, TypeError, binascii.Error):
+        raise InvalidCursor(cursor)
+    if direction not in ('next', 'prev'):
+        raise InvalidCursor(cursor)
+    return direction, values
+
+
+class CursorPage:
+    def __init__(self, object_list, next_cursor, previous_cursor):
+        self.object_list = object_list
+        self.next_cursor = next_cursor
+        self.previous_cursor = previous_cursor
+
+    def has_next(self):
+        return self.next_cursor is not None
+
+    def has_previous(self):
+        return self.previous_cursor is not None
+
+    def has_other_pages(self):
+        return self.has_next() or self.has_previous()
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def __bool__(self):
+        return bool(self.object_list)
+
+
+def is_unique_key(model, name):
+    # the pk, or a pk reached through one-to-one relations only (ranking__recipe_id)
+    *relations, last = name.split('__')
+    try:
+        for part in relations:
+            field = model._meta.get_field(part)
+            if not field.one_to_one:
+                return False
+            model = field.related_model
+        return last == 'pk' or model._meta.get_field(last).primary_key
+    except FieldDoesNotExist:
+        return False
+
+
+class CursorPaginator:
+    """
+    Keyset pagination over the queryset's own ordering, e.g. (-created_at, -id).
+    Every page is one indexed range query of per_page + 1 rows, no COUNT and
+    no OFFSET, so page 5,000 costs the same as page 1.
+    """
+
+    def __init__(self, queryset, per_page):
+        ordering = list(queryset.query.order_by) or list(queryset.model._meta.ordering)
+        if not any(is_unique_key(queryset.model, key.lstrip('-')) for key in ordering):
+            # the last key has to be unique or rows sharing a timestamp get skipped
+            ordering.append('-id' if ordering and ordering[-1].startswith('-') else 'id')
+        self.queryset = queryset.order_by(*ordering)
+        self.ordering = ordering
+        self.per_page = per_page
+
+    def key_values(self, row):
+        names = [key.lstrip('-') for key in self.ordering]
+        if isinstance(row, dict):
+            return [row[name] for name in names]
+        # keys may follow a relation, e.g. ranking__score, select_related keeps that free
+        return [reduce(getattr, name.split('__'), row) for name in names]
+
+    def seek(self, values, forward):
+        # (a, b, c) after (x, y, z) == a > x or (a == x and (b > y or (b == y and c > z)))
+        condition = None
+        for key, value in reversed(list(zip(self.ordering, values))):
+            name = key.lstrip('-')
+            descending = key.startswith('-') == forward
+            after = Q(**{f'{name}__lt' if descending else f'{name}__gt': value})
+            condition = after if condition is None else after | (Q(**{name: value}) & condition)
+
+        # the same bound again as a plain range on the leading key, so the planner
+        # can start an index range scan there instead of giving up on the OR
+        name = self.ordering[0].lstrip('-')
+        descending = self.ordering[0].startswith('-') == forward
+        return Q(**{f'{name}__lte' if descending else f'{name}__gte': values[0]}) & condition
+
+    def query(self, cursor):
+        direction, values = decode_cursor(cursor) if cursor else ('next', None)
+        if values is not None and len(values) != len(self.ordering):
+            raise InvalidCursor(cursor)
+
+        forward = direction == 'next'
+        queryset = self.queryset
+        if values is not None:
+            queryset = queryset.filter(self.seek(values, forward))
+        if not forward:
+            queryset = queryset.reverse()
+        return queryset[:self.per_page + 1], values, forward
+
+    def build_page(self, rows, values, forward):
+        has_more = len(rows) > self.per_page
+        rows = rows[:self.per_page]
+        if not forward:
+            rows.reverse()
+
+        next_cursor = previous_cursor = None
+        if rows:
+            if has_more or not forward:
+                next_cursor = encode_cursor('next', self.key_values(rows[-1]))
+            if values is not None and (has_more or forward):
+                previous_cursor = encode_cursor('prev', self.key_values(rows[0]))
+        return CursorPage(rows, next_cursor, previous_cursor)
+
+    def page(self, cursor = None):
+        queryset, values, forward = self.query(cursor)
+        return self.build_page(list(queryset), values, forward)
+
+    async def apage(self, cursor = None):
+        queryset, values, forward = self.query(cursor)
+        return self.build_page([row async for row in queryset], values, forward)
+
+    def get_page(self, cursor = None):
+        try:
+            return self.page(cursor)
+        except (InvalidCursor, ValidationError):
+            return self.page()
+
+    async def aget_page(self, cursor = None):
+        try:
+            return await self.apage(cursor)
+        except (InvalidCursor, ValidationError):
+            return await self.apage()
+
+
+def approximate_count(queryset, cache_key, timeout = 300):
+    """
+    A total that is good enough for "N recipes" headings. An unfiltered table on
+    PostgreSQL is read from the planner statistics, everything else is an exact
+    COUNT cached for a few minutes.
+    """
+    if connection.vendor == 'postgresql' and not queryset.query.where:
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT reltuples::bigint FROM pg_class WHERE oid = %s::regclass', [queryset.model._meta.db_table])
+            row = cursor.fetchone()
+        if row and row[0] >= 0:
+            return row[0]
+    digest = hashlib.md5(cache_key.encode()).hexdigest()
+    return cache.get_or_set(f'count:{digest}', queryset.count, timeout)
+
+
+def capped_count(queryset, limit, page = None):
+    """
+    (count, more) for "N recipes" headings that don't need an exact COUNT:
+    at most limit + 1 keys off an index, and nothing at all when the page
+    being shown is the only one. Show count, with a "+" when more is True.
+    """
+    if page is not None and not page.has_other_pages():
+        return len(page), False
+    count = len(queryset.order_by().values_list('pk', flat = True)[:limit + 1])
+    return min(count, limit), count > limit
@@ -0,0 +1,145 @@
+import math
+from collections import defaultdict
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Sum
+from django.utils import timezone
+
+from recipes.models import Recipe, RecipeRanking, Review
+
+# ?sort= on the feed -> ordering, each backed by an index on RecipeRanking
+SORTS = {
+    'top': ['-ranking__score', '-ranking__recipe_id'],
+    'trending': ['-ranking__trending', '-ranking__recipe_id'],
+}
+
+EPOCH = datetime(2000, 1, 1, tzinfo = dt_timezone.utc)
+PRIOR_KEY = 'ranking:prior_mean'
+
+
+def sort_recipes(queryset, sort):
+    # unknown values keep the queryset's own order
+    if sort not in SORTS:
+        return queryset
+    return queryset.filter(ranking__isnull = False).select_related('ranking').order_by(*SORTS[sort])
+
+
+def prior_mean(refresh = False):
+    """
+    The site-wide average rating every recipe's score starts from. Computed by
+    refresh_rankings and cached, review writes only read it.
+    """
+    mean = None if refresh else cache.get(PRIOR_KEY)
+    if mean is None:
+        totals = Recipe.objects.aggregate(ratings = Sum('rating_sum'), reviews = Sum('rating_count'))
+        mean = totals['ratings'] / totals['reviews'] if totals['reviews'] else settings.RANKING_PRIOR_MEAN
+        cache.set(PRIOR_KEY, mean, None)
+    return mean
+
+
+def bayesian_score(rating_sum, rating_count, mean):
+    # RANKING_PRIOR_WEIGHT imaginary reviews at the site average, so one 5 star review doesn't top the chart
+    weight = settings.RANKING_PRIOR_WEIGHT
+    return (mean * weight + rating_sum) / (weight + rating_count)
+
+
+def review_heat(rating, created_at):
+    """
+    log2 of what a review adds to its recipe's trending score, measured at
+    EPOCH: a review one half-life newer counts twice as much. Scores stored on
+    this scale never have to be decayed, ordering by them is ordering by the
+    decayed score at any moment.
+    """
+    half_life = settings.RANKING_TRENDING_HALF_LIFE * 3600
+    return math.log2(max(int(rating), 1) / 5) + (created_at - EPOCH).total_seconds() / half_life
+
+
+def add_heat(trending, heat):
+    # log2(2 ** trending + 2 ** heat) without overflowing, 0 means no heat yet
+    if not trending:
+        return heat
+    high, low = max(trending, heat), min(trending, heat)
+    return high + math.log2(1 + 2 ** (low - high))
+
+
+def remove_heat(trending, heat):
+    if not trending or heat >= trending:
+        return 0.0
+    remaining = 1 - 2 ** (heat - trending)
+    return trending + math.log2(remaining) if remaining > 1e-12 else 0.0
+
+
+def create_rankings(recipes):
+    # new recipes have no reviews yet, they start at the site average
+    mean = prior_mean()
+    RecipeRanking.objects.bulk_create(
+        [RecipeRanking(recipe_id = recipe.pk, score = bayesian_score(0, 0, mean)) for recipe in recipes],
+        ignore_conflicts = True,
+    )
+
+
+def apply_review_changes(changes, created_at):
+    """
+    Update the rankings of the recipes a review write touched, after their
+    stored rating totals changed. changes is [(recipe_id, rating, +1 / -1)]:
+    the review's heat is added for +1 and taken back out for -1.
+    """
+    mean = prior_mean()
+    recipe_ids = {recipe_id for recipe_id, _, _ in changes}
+    with transaction.atomic():
+        # the row lock keeps two reviews of one recipe from losing each other's heat
+        rankings = {ranking.recipe_id: ranking for ranking in RecipeRanking.objects.select_for_update().filter(recipe_id__in = recipe_ids)}
+        totals = Recipe.objects.filter(pk__in = recipe_ids).values_list('pk', 'rating_sum', 'rating_count')
+        for recipe_id, rating_sum, rating_count in totals:
+            ranking = rankings.get(recipe_id)
+            if ranking is None:
+                # gone with its recipe, or never created (bulk_create), refresh_rankings adds it
+                continue
+            ranking.score = bayesian_score(rating_sum, rating_count, mean)
+            for changed_id, rating, sign in changes:
+                if changed_id == recipe_id:
+                    heat = review_heat(rating, created_at)
+                    ranking.trending = add_heat(ranking.trending, heat) if sign > 0 else remove_heat(ranking.trending, heat)
+            # UPDATE only, never re-insert a row deleted along with its recipe
+            ranking.save(update_fields = ['score', 'trending', 'updated_at'])
+
+
+def refresh_rankings(batch_size = 1000):
+    """
+    Recompute every recipe's score and trending value from scratch: picks up
+    a new site average, recipes added with bulk_create and rounding drift.
+    Reviews older than RANKING_TRENDING_WINDOW days are left out of trending,
+    at ten half-lives they no longer change the order.
+    """
+    mean = prior_mean(refresh = True)
+    since = timezone.now() - timedelta(days = settings.RANKING_TRENDING_WINDOW)
+    refreshed = 0
+    last_id = 0
+    while True:
+        batch = list(
+            Recipe.objects.filter(pk__gt = last_id).order_by('pk').values_list('pk', 'rating_sum', 'rating_count')[:batch_size]
+        )
+        if not batch:
+            break
+        last_id = batch[-1][0]
+
+        trending = defaultdict(float)
+        recent = Review.objects.filter(recipe_id__gte = batch[0][0], recipe_id__lte = last_id, created_at__gte = since)
+        for recipe_id, rating, created_at in recent.values_list('recipe_id', 'rating', 'created_at').iterator():
+            trending[recipe_id] = add_heat(trending[recipe_id], review_heat(rating, created_at))
+
+        now = timezone.now()
+        RecipeRanking.objects.bulk_create(
+            [
+                RecipeRanking(recipe_id = pk, score = bayesian_score(rating_sum, rating_count, mean), trending = trending[pk], updated_at = now)
+                for pk, rating_sum, rating_count in batch
+            ],
+            update_conflicts = True,
+            unique_fields = ['recipe'],
+            update_fields = ['score', 'trending', 'updated_at'],
+        )
+        refreshed += len(batch)
+    return refreshed
@@ -0,0 +1,81 @@
+from django.core.exceptions import PermissionDenied
+from django.db import connection, transaction
+from django.db.models import F
+
+from recipes.models import Recipe, Review
+from recipes.rankings import apply_review_changes
+from recipes.signals import invalidateRecipePages
+
+
+def lock_recipe(recipe_id):
+    """
+    Lock a recipe's row until the end of the transaction and return its
+    (author_id, author username), None when it doesn't exist. Every write to
+    the recipe's reviews queues up behind it.
+    """
+    recipes = Recipe.objects.filter(pk = recipe_id)
+    if not connection.features.has_select_for_update:
+        # SQLite has no row locks, and a transaction that has only read can't
+        # wait for another writer: a no-op UPDATE takes the write lock up front
+        if not recipes.update(rating_sum = F('rating_sum')):
+            return None
+    return recipes.select_for_update(of = ('self',)).values_list('author_id', 'author__username').first()
+
+
+def save_review(recipe_id, reviewer, rating, text):
+    """
+    Create or update reviewer's review of a recipe with one
+    INSERT ... ON CONFLICT (recipe_id, reviewer_id) DO UPDATE, and move the
+    recipe's stored rating totals and rankings by the difference in the same
+    transaction. Returns True for a new review, False for an edit.
+
+    Raises Recipe.DoesNotExist for a missing recipe and PermissionDenied
+    when the reviewer wrote it.
+    """
+    rating = int(rating)
+    with transaction.atomic():
+        locked = lock_recipe(recipe_id)
+        if locked is None:
+            raise Recipe.DoesNotExist
+        author_id, author_username = locked
+        if author_id == reviewer.pk:
+            raise PermissionDenied
+
+        # read after the lock, in its own statement: on PostgreSQL a subquery
+        # of the locking SELECT would still see the snapshot from before the wait
+        old = Review.objects.filter(recipe_id = recipe_id, reviewer = reviewer).values_list('rating', 'created_at').first()
+        review = Review(recipe_id = recipe_id, reviewer = reviewer, rating = rating, review = text)
+        # no signals, the rating totals below are the only bookkeeping a review write needs
+        Review.objects.bulk_create(
+            [review], update_conflicts = True, unique_fields = ['recipe', 'reviewer'], update_fields = ['rating', 'review', 'updated_at'],
+        )
+
+        if old is None:
+            Recipe.apply_rating_change(recipe_id, rating, 1)
+            apply_review_changes([(recipe_id, rating, 1)], review.created_at)
+        elif old[0] != rating:
+            old_rating, created_at = old
+            Recipe.apply_rating_change(recipe_id, rating - old_rating, 0)
+            apply_review_changes([(recipe_id, old_rating, -1), (recipe_id, rating, 1)], created_at)
+        invalidateRecipePages(recipe_id, author_username)
+    return old is None
+
+
+def delete_review(recipe_id, reviewer):
+    """
+    Delete reviewer's review of a recipe behind the recipe's lock, the delete
+    signals take its rating back out of the totals. Of two deletes of one
+    review the second finds nothing, instead of taking the rating out twice.
+    Returns False when there was no review.
+
+    Raises Recipe.DoesNotExist for a missing recipe.
+    """
+    with transaction.atomic():
+        if lock_recipe(recipe_id) is None:
+            raise Recipe.DoesNotExist
+        # read after the lock, in its own statement, like save_review
+        review = Review.objects.filter(recipe_id = recipe_id, reviewer = reviewer).first()
+        if review is None:
+            return False
+        review.delete()
+    return True
@@ -0,0 +1,155 @@
+import re
+from functools import lru_cache
+
+from django.conf import settings
+from django.db import connection
+from django.db.models import F, Q
+from django.utils.module_loading import import_string
+
+from recipes.models import Recipe
+
+
+# title > ingredients > description, used by every ranking backend
+WEIGHTED_FIELDS = (
+    ('title', 'A', 10.0),
+    ('ingredients_list', 'B', 4.0),
+    ('small_description', 'C', 1.0),
+)
+
+
+def tokenize(query):
+    return re.findall(r'\w+', query.lower())
+
+
+class SimpleSearchBackend:
+    # unindexed LIKE scan, only for databases without a full-text engine
+
+    def search(self, queryset, query):
+        return queryset.filter(Q(title__icontains = query) | Q(ingredients_list__icontains = query))
+
+    def index(self, recipe_ids):
+        pass
+
+    def remove(self, recipe_ids):
+        pass
+
+    def rebuild(self):
+        pass
+
+
+class PostgresSearchBackend:
+    config = 'english'
+
+    def vector(self):
+        from django.contrib.postgres.search import SearchVector
+
+        vector = None
+        for field, weight, _ in WEIGHTED_FIELDS:
+            part = SearchVector(field, weight = weight, config = self.config)
+            vector = part if vector is None else vector + part
+        return vector
+
+    def search(self, queryset, query):
+        from django.contrib.postgres.search import SearchQuery, SearchRank
+
+        tokens = tokenize(query)
+        if not tokens:
+            return queryset.none()
+
+        # prefix match every word so "pan" still finds paneer like icontains did
+        search_query = SearchQuery(' & '.join(f'{token}:*' for token in tokens), search_type = 'raw', config = self.config)
+        return queryset.filter(search_vector = search_query).annotate(
+            rank = SearchRank('search_vector', search_query)
+        ).order_by('-rank', '-created_at', '-id')
+
+    def index(self, recipe_ids):
+        Recipe.objects.filter(pk__in = recipe_ids).update(search_vector = self.vector())
+
+    def remove(self, recipe_ids):
+        pass
+
+    def rebuild(self):
+        Recipe.objects.update(search_vector = self.vector())
+
+
+class SQLiteSearchBackend:
+    # FTS5 table created by migration 0004, rowid is the recipe id
+    table = 'recipes_recipe_fts'
+
+    def match_expression(self, query):
+        return ' '.join(f'"{token}"*' for token in tokenize(query))
+
+    def search(self, queryset, query):
+        expression = self.match_expression(query)
+        if not expression:
+            return queryset.none()
+
+        # joins the FTS table so SQLite drives the query from the MATCH,
+        # bm25 weights are stored in the table's rank config by migration 0004
+        return queryset.filter(search_index__document__match = expression).annotate(
+            rank = -F('search_index__rank')
+        ).order_by('-rank', '-created_at', '-id')
+
+    def index(self, recipe_ids):
+        recipe_ids = list(recipe_ids)
+        if not recipe_ids:
+            return
+        self.remove(recipe_ids)
+        columns = ', '.join(field for field, _, _ in WEIGHTED_FIELDS)
+        placeholders = ', '.join(['%s'] * len(recipe_ids))
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'INSERT INTO {self.table} (rowid, {columns}) '
+                f'SELECT id, {columns} FROM {Recipe._meta.db_table} WHERE id IN ({placeholders})',
+                recipe_ids,
+            )
+
+    def remove(self, recipe_ids):
+        recipe_ids = list(recipe_ids)
+        if not recipe_ids:
+            return
+        placeholders = ', '.join(['%s'] * len(recipe_ids))
+        with connection.cursor() as cursor:
+            cursor.execute(f'DELETE FROM {self.table} WHERE rowid IN ({placeholders})', recipe_ids)
+
+    def rebuild(self):
+        columns = ', '.join(field for field, _, _ in WEIGHTED_FIELDS)
+        with connection.cursor() as cursor:
+            cursor.execute(f'DELETE FROM {self.table}')
+            cursor.execute(
+                f'INSERT INTO {self.table} (rowid, {columns}) SELECT id, {columns} FROM {Recipe._meta.db_table}'
+            )
+
+
+VENDOR_BACKENDS = {
+    'postgresql': PostgresSearchBackend,
+    'sqlite': SQLiteSearchBackend,
+}
+
+
+@lru_cache(maxsize = None)
+def load_backend(vendor):
+    path = getattr(settings, 'RECIPE_SEARCH_BACKEND', None)
+    if path:
+        return import_string(path)()
+    return VENDOR_BACKENDS.get(vendor, SimpleSearchBackend)()
+
+
+def get_backend():
+    return load_backend(connection.vendor)
+
+
+def search_recipes(queryset, query):
+    return get_backend().search(queryset, query)
+
+
+def index_recipes(recipe_ids):
+    get_backend().index(recipe_ids)
+
+
+def remove_recipes(recipe_ids):
+    get_backend().remove(recipe_ids)
+
+
+def rebuild_index():
+    get_backend().rebuild()
@@ -0,0 +1,184 @@
+from django.conf import settings
+from django.db import transaction
+from django.db.models.signals import pre_save, post_save, pre_delete, post_delete
+from django.dispatch import receiver
+
+from accounts.models import User
+from recipes.autocomplete import index as autocomplete_index
+from recipes.cache import bump_version
+from recipes.images import delete_derivatives
+from recipes.ingredients import sync_ingredients
+from recipes.models import Recipe, Review, SimilarRecipe
+from recipes.rankings import apply_review_changes, create_rankings
+from recipes.search import WEIGHTED_FIELDS, index_recipes, remove_recipes
+from recipes.tasks import needs_derivatives, queue_derivatives, queue_similar_recipes
+
+
+@receiver(pre_save, sender = Review)
+def loadSavedRating(sender, instance, raw, **kwargs):
+    if raw or instance._state.adding:
+        return
+    recipe_id, rating = getattr(instance, '_saved_rating', (None, None))
+    if recipe_id is None or rating is None:
+        # deferred or never loaded, read it once so the delta stays correct
+        saved = Review.objects.filter(pk = instance.pk).values_list('recipe_id', 'rating').first()
+        instance._saved_rating = saved or (None, None)
+
+
+@receiver(post_save, sender = Review)
+def updateRatingOnSave(sender, instance, created, raw, **kwargs):
+    if raw:
+        return
+    rating = int(instance.rating)
+    old_recipe_id, old_rating = (None, None) if created else instance._saved_rating
+
+    if old_recipe_id is None:
+        Recipe.apply_rating_change(instance.recipe_id, rating, 1)
+        changes = [(instance.recipe_id, rating, 1)]
+    elif old_recipe_id != instance.recipe_id:
+        Recipe.apply_rating_change(old_recipe_id, -int(old_rating), -1)
+        Recipe.apply_rating_change(instance.recipe_id, rating, 1)
+        changes = [(old_recipe_id, int(old_rating), -1), (instance.recipe_id, rating, 1)]
+    elif int(old_rating) != rating:
+        Recipe.apply_rating_change(instance.recipe_id, rating - int(old_rating), 0)
+        changes = [(instance.recipe_id, int(old_rating), -1), (instance.recipe_id, rating, 1)]
+    else:
+        changes = []
+
+    if changes:
+        apply_review_changes(changes, instance.created_at)
+    instance.remember_rating()
+
+
+def goesWithItsRecipe(review, origin):
+    # deleted along with its recipe: the totals, ranking and pages go with the recipe
+    return review.recipe_id in getattr(origin, '_deleted_recipe_ids', ())
+
+
+@receiver(pre_delete, sender = Recipe)
+def markDeletedRecipe(sender, instance, origin = None, **kwargs):
+    # a recipe or user delete sends every pre_delete before the first post_delete,
+    # the same origin object is passed to the reviews' receivers
+    if origin is not None:
+        origin.__dict__.setdefault('_deleted_recipe_ids', set()).add(instance.pk)
+
+
+@receiver(post_delete, sender = Review)
+def updateRatingOnDelete(sender, instance, origin = None, **kwargs):
+    if goesWithItsRecipe(instance, origin):
+        return
+    recipe_id, rating = getattr(instance, '_saved_rating', (None, None))
+    if recipe_id is None or rating is None:
+        recipe_id, rating = instance.recipe_id, instance.rating
+    Recipe.apply_rating_change(recipe_id, -int(rating), -1)
+    apply_review_changes([(recipe_id, int(rating), -1)], instance.created_at)
+
+
+@receiver(post_save, sender = Recipe)
+def rankNewRecipe(sender, instance, created, raw, **kwargs):
+    if created and not raw:
+        create_rankings([instance])
+
+
+@receiver(post_save, sender = Recipe)
+def indexRecipe(sender, instance, update_fields, **kwargs):
+    searched = {field for field, _, _ in WEIGHTED_FIELDS}
+    if update_fields is not None and searched.isdisjoint(update_fields):
+        return
+    index_recipes([instance.pk])
+
+
+@receiver(post_delete, sender = Recipe)
+def unindexRecipe(sender, instance, **kwargs):
+    remove_recipes([instance.pk])
+
+
+@receiver(post_save, sender = Recipe)
+def updateAutocomplete(sender, instance, update_fields, raw, **kwargs):
+    if raw or (update_fields is not None and {'title', 'ingredients_list'}.isdisjoint(update_fields)):
+        return
+    # after commit, a rolled back save must not leave a suggestion behind
+    pk, title, ingredients_list = instance.pk, instance.title, instance.ingredients_list
+    transaction.on_commit(lambda: autocomplete_index.add_recipe(pk, title, ingredients_list))
+
+
+@receiver(post_delete, sender = Recipe)
+def removeFromAutocomplete(sender, instance, **kwargs):
+    pk = instance.pk
+    transaction.on_commit(lambda: autocomplete_index.remove_recipe(pk))
+
+
+@receiver(post_save, sender = Recipe)
+def syncRecipeIngredients(sender, instance, created, update_fields, raw, **kwargs):
+    if raw or (update_fields is not None and 'ingredients_list' not in update_fields):
+        return
+    # a full save that kept the text: the parsed rows and the neighbours still hold
+    if not created and instance.ingredients_list == getattr(instance, '_saved_ingredients', None):
+        return
+    sync_ingredients([instance])
+    queue_similar_recipes(instance)
+    instance.remember_ingredients()
+
+
+def invalidateRecipePages(recipe_id, author_username):
+    bump_version('recipe', recipe_id)
+    bump_version('feed', 'all')
+    bump_version('profile', author_username)
+
+
+@receiver(post_save, sender = Recipe)
+@receiver(post_delete, sender = Recipe)
+def invalidateRecipe(sender, instance, **kwargs):
+    invalidateRecipePages(instance.pk, instance.author.username)
+
+
+@receiver(pre_delete, sender = Recipe)
+def findListingRecipes(sender, instance, **kwargs):
+    # their SimilarRecipe rows pointing here go with the cascade, read them first
+    instance._listed_by = list(SimilarRecipe.objects.filter(similar_id = instance.pk).values_list('recipe_id', flat = True))
+
+
+@receiver(post_delete, sender = Recipe)
+def invalidateListingRecipes(sender, instance, **kwargs):
+    for recipe_id in getattr(instance, '_listed_by', ()):
+        bump_version('similar', recipe_id)
+
+
+@receiver(post_save, sender = Review)
+@receiver(post_delete, sender = Review)
+def invalidateReview(sender, instance, origin = None, **kwargs):
+    if goesWithItsRecipe(instance, origin):
+        return
+    author_username = User.objects.filter(recipes = instance.recipe_id).values_list('username', flat = True).first()
+    invalidateRecipePages(instance.recipe_id, author_username)
+
+
+@receiver(post_save, sender = settings.AUTH_USER_MODEL)
+@receiver(post_delete, sender = settings.AUTH_USER_MODEL)
+def invalidateUser(sender, instance, update_fields = None, **kwargs):
+    # login only touches last_login, nothing any page shows
+    if update_fields is not None and set(update_fields) <= {'last_login'}:
+        return
+    bump_version('user', instance.pk)
+    bump_version('profile', instance.username)
+    bump_version('feed', 'all')
+    bump_version('users', 'all')
+
+
+@receiver(post_save, sender = Recipe)
+def refreshRecipeImage(sender, instance, raw, **kwargs):
+    if not raw and needs_derivatives(instance):
+        queue_derivatives(instance)
+
+
+@receiver(post_delete, sender = Recipe)
+def deleteRecipeImage(sender, instance, **kwargs):
+    delete_derivatives(instance.image.storage, instance.image_variants)
+
+
+@receiver(post_save, sender = settings.AUTH_USER_MODEL)
+def refreshProfilePic(sender, instance, raw, update_fields = None, **kwargs):
+    if raw or (update_fields is not None and 'profile_pic' not in update_fields):
+        return
+    if needs_derivatives(instance):
+        queue_derivatives(instance)
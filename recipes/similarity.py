@@ -0,0 +1,237 @@
+import threading
+import time
+from itertools import chain
+
+import numpy as np
+from django.conf import settings
+from django.db import connection, transaction
+from scipy import sparse
+
+from recipes.cache import bump_version
+from recipes.models import Recipe, RecipeIngredient, SimilarRecipe
+
+
+def normalise(matrix):
+    norms = np.sqrt(matrix.multiply(matrix).sum(axis = 1)).A1
+    norms[norms == 0] = 1
+    return (sparse.diags((1 / norms).astype(np.float32)) @ matrix).tocsr()
+
+
+def presence(rows, columns, shape):
+    matrix = sparse.csr_matrix((np.ones(len(columns), dtype = np.float32), (rows, columns)), shape = shape)
+    matrix.data[:] = 1  # the same ingredient twice in one list still counts once
+    return matrix
+
+
+def build_matrix():
+    # ingredient_matrix(), with the ingredient id of each column and its idf weight
+    recipe_ids = np.fromiter(Recipe.objects.order_by('pk').values_list('pk', flat = True).iterator(chunk_size = 10000), dtype = np.int64)
+    pairs = RecipeIngredient.objects.values_list('recipe_id', 'ingredient_id').iterator(chunk_size = 10000)
+    pairs = np.fromiter(chain.from_iterable(pairs), dtype = np.int64).reshape(-1, 2)
+
+    # ingredients of recipes created after the id list was read have no row to go to
+    rows = np.searchsorted(recipe_ids, pairs[:, 0])
+    known = rows < len(recipe_ids)
+    known[known] = recipe_ids[rows[known]] == pairs[known, 0]
+    ingredient_ids, columns = np.unique(pairs[known, 1], return_inverse = True)
+    matrix = presence(rows[known], columns, (len(recipe_ids), len(ingredient_ids)))
+
+    # smoothed idf, an ingredient in every recipe keeps a weight of 1
+    document_frequency = np.bincount(matrix.indices, minlength = len(ingredient_ids))
+    idf = (np.log((1 + len(recipe_ids)) / (1 + document_frequency)) + 1).astype(np.float32)
+    return recipe_ids, ingredient_ids, idf, normalise(matrix.multiply(idf).tocsr())
+
+
+def ingredient_matrix():
+    """
+    (recipe ids, matrix) with one L2-normalised TF-IDF row per recipe and one
+    column per ingredient, built from the parsed RecipeIngredient rows. A
+    recipe lists an ingredient once, so the term frequency is just presence.
+    """
+    recipe_ids, _, _, matrix = build_matrix()
+    return recipe_ids, matrix
+
+
+class CachedMatrix:
+    """
+    The jobs worker's copy of the TF-IDF matrix, so an edit re-reads the rows
+    of the recipes it scores instead of every recipe's ingredients. The idf
+    weights are the ones of the last build: an ingredient the cache hasn't
+    seen is weighted as in one recipe, and the whole matrix is rebuilt every
+    SIMILAR_RECIPES_MATRIX_TIMEOUT seconds.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.built_at = None
+
+    def clear(self):
+        with self.lock:
+            self.built_at = None
+
+    def replace(self, built):
+        with self.lock:
+            self.recipe_ids, ingredient_ids, self.idf, self.matrix = built
+            self.columns = dict(zip(ingredient_ids.tolist(), range(len(ingredient_ids))))
+            self.built_at = time.monotonic()
+
+    def load(self):
+        if self.built_at is None or time.monotonic() - self.built_at > settings.SIMILAR_RECIPES_MATRIX_TIMEOUT:
+            self.replace(build_matrix())
+
+    def snapshot(self):
+        with self.lock:
+            return self.recipe_ids, self.matrix
+
+    def reload(self, ids):
+        """
+        Re-read the ingredients of the given recipes into their rows: new
+        recipes get one, deleted ones an empty row no recipe is similar to.
+        Returns the ids that still exist.
+        """
+        ids = sorted(set(ids))
+        existing = set(Recipe.objects.filter(pk__in = ids).values_list('pk', flat = True))
+        pairs = list(RecipeIngredient.objects.filter(recipe_id__in = existing).values_list('recipe_id', 'ingredient_id'))
+        with self.lock:
+            added = np.asarray(sorted(existing - set(self.recipe_ids[positions(self.recipe_ids, existing)].tolist())), dtype = np.int64)
+            if len(added):
+                recipe_ids = np.concatenate([self.recipe_ids, added])
+                order = np.argsort(recipe_ids, kind = 'stable')
+                self.matrix.resize((len(recipe_ids), self.matrix.shape[1]))
+                self.recipe_ids, self.matrix = recipe_ids[order], self.matrix[order]
+
+            unseen = sorted({ingredient_id for _, ingredient_id in pairs} - self.columns.keys())
+            if unseen:
+                self.columns.update(zip(unseen, range(len(self.columns), len(self.columns) + len(unseen))))
+                self.idf = np.concatenate([self.idf, np.full(len(unseen), np.log((1 + len(self.recipe_ids)) / 2) + 1, dtype = np.float32)])
+                self.matrix.resize((self.matrix.shape[0], len(self.columns)))
+
+            rows = positions(self.recipe_ids, ids)
+            block_rows = np.searchsorted(self.recipe_ids[rows], [recipe_id for recipe_id, _ in pairs]).astype(np.int64)
+            columns = np.asarray([self.columns[ingredient_id] for _, ingredient_id in pairs], dtype = np.int64)
+            block = normalise(presence(block_rows, columns, (len(rows), self.matrix.shape[1])).multiply(self.idf).tocsr())
+
+            # drop the old rows and put the new ones in their place
+            keep = np.ones(self.matrix.shape[0], dtype = np.float32)
+            keep[rows] = 0
+            scatter = sparse.csr_matrix(
+                (np.ones(len(rows), dtype = np.float32), (rows, np.arange(len(rows)))), shape = (self.matrix.shape[0], len(rows)),
+            )
+            self.matrix = (sparse.diags(keep) @ self.matrix + scatter @ block).tocsr()
+        return existing
+
+
+matrix_cache = CachedMatrix()
+
+
+def positions(recipe_ids, ids):
+    # matrix rows of the given recipe ids, leaving out recipes the matrix doesn't have
+    ids = np.asarray(sorted(ids), dtype = np.int64)
+    rows = np.searchsorted(recipe_ids, ids)
+    found = rows < len(recipe_ids)
+    found[found] = recipe_ids[rows[found]] == ids[found]
+    return rows[found]
+
+
+def transpose(block, tile = 256):
+    # numpy's own copy of a tall block's transpose misses the cache on every
+    # element, copying it a few hundred rows at a time is about 10x faster
+    transposed = np.empty(block.shape[::-1], dtype = block.dtype)
+    for start in range(0, block.shape[0], tile):
+        transposed[:, start:start + tile] = block[start:start + tile].T
+    return transposed
+
+
+def nearest(matrix, rows, count):
+    """
+    The count most similar recipes of each of the given rows, as
+    [(row, neighbour row, score)]. Scores the rows against every recipe at
+    once, a len(rows) x recipes dense block, so the chunk size bounds memory.
+    """
+    # sparse matrix times the dense chunk: nearly every recipe shares salt or
+    # oil with every other, the result is dense and a sparse product is slower
+    scores = transpose(matrix @ matrix[rows].T.toarray())
+    scores[np.arange(len(rows)), rows] = 0
+    count = min(count, scores.shape[1] - 1)
+    if count <= 0:
+        return []
+
+    top = np.argpartition(-scores, count - 1, axis = 1)[:, :count]
+    top_scores = np.take_along_axis(scores, top, axis = 1)
+    order = np.argsort(-top_scores, axis = 1, kind = 'stable')
+    top, top_scores = np.take_along_axis(top, order, axis = 1), np.take_along_axis(top_scores, order, axis = 1)
+    return [
+        (row, neighbour, score)
+        for row, neighbours, row_scores in zip(rows, top.tolist(), top_scores.tolist())
+        for neighbour, score in zip(neighbours, row_scores)
+        # no shared ingredient, not similar at all
+        if score > 0
+    ]
+
+
+def store_neighbours(recipe_ids, rows, neighbours):
+    ids = [int(recipe_ids[row]) for row in rows]
+    values = [(int(recipe_ids[row]), int(recipe_ids[neighbour]), round(score, 4)) for row, neighbour, score in neighbours]
+    fields = [SimilarRecipe._meta.get_field(name) for name in ('recipe', 'similar', 'score')]
+    # multi-row INSERTs of plain tuples, bulk_create spends most of a refresh building model instances
+    # PostgreSQL has no parameter limit and answers len(values), 0 for a chunk without neighbours
+    batch_size = max(connection.ops.bulk_batch_size(fields, values), 1)
+    with transaction.atomic(), connection.cursor() as cursor:
+        SimilarRecipe.objects.filter(recipe_id__in = ids).delete()
+        for start in range(0, len(values), batch_size):
+            batch = values[start:start + batch_size]
+            cursor.execute(
+                f'INSERT INTO {SimilarRecipe._meta.db_table} (recipe_id, similar_id, score) VALUES '
+                + ', '.join(['(%s, %s, %s)'] * len(batch)),
+                [value for row in batch for value in row],
+            )
+
+
+def refresh_similar_recipes(chunk_size = None):
+    """
+    Recompute every recipe's SIMILAR_RECIPES_COUNT neighbours, chunk_size
+    recipes at a time. Returns how many recipes were scored.
+    """
+    chunk_size = chunk_size or settings.SIMILAR_RECIPES_CHUNK_SIZE
+    built = build_matrix()
+    recipe_ids, _, _, matrix = built
+    for start in range(0, len(recipe_ids), chunk_size):
+        rows = np.arange(start, min(start + chunk_size, len(recipe_ids)))
+        store_neighbours(recipe_ids, rows, nearest(matrix, rows, settings.SIMILAR_RECIPES_COUNT))
+    matrix_cache.replace(built)
+    bump_version('similar', 'all')
+    return len(recipe_ids)
+
+
+def update_similar_recipes(recipe_id):
+    """
+    After one recipe's ingredients changed: recompute its neighbours, those
+    of the recipes listing it and those of its new neighbours, the ones most
+    likely to list it now. Anything further out waits for the next refresh.
+    Scores against matrix_cache, rereading only the rows of those recipes.
+    """
+    matrix_cache.load()
+    if recipe_id not in matrix_cache.reload([recipe_id]):
+        # deleted since, its rows went with it
+        return
+    count = settings.SIMILAR_RECIPES_COUNT
+
+    recipe_ids, matrix = matrix_cache.snapshot()
+    own = nearest(matrix, positions(recipe_ids, [recipe_id]), count)
+    affected = set(SimilarRecipe.objects.filter(similar_id = recipe_id).values_list('recipe_id', flat = True))
+    affected.update(int(recipe_ids[neighbour]) for _, neighbour, _ in own)
+    affected = matrix_cache.reload(affected - {recipe_id}) | {recipe_id}
+
+    recipe_ids, matrix = matrix_cache.snapshot()
+    rows = positions(recipe_ids, affected)
+    neighbours = nearest(matrix, rows, count)
+    # recipes deleted since the matrix was built are still in it, empty their rows and score again
+    listed = {int(recipe_ids[neighbour]) for _, neighbour, _ in neighbours}
+    if len(matrix_cache.reload(listed)) < len(listed):
+        recipe_ids, matrix = matrix_cache.snapshot()
+        rows = positions(recipe_ids, affected)
+        neighbours = nearest(matrix, rows, count)
+
+    store_neighbours(recipe_ids, rows, neighbours)
+    for pk in recipe_ids[rows].tolist():
+        bump_version('similar', pk)
@@ -0,0 +1,75 @@
+from django.apps import apps
+from django.core.files.base import ContentFile
+
+from jobs.queue import enqueue, job
+from recipes.images import PROFILE_PIC_WIDTHS, RECIPE_IMAGE_WIDTHS, refresh_derivatives, with_auto_now
+
+# (field, variants field, widths) for every image field with derivatives
+IMAGE_FIELDS = {
+    'recipes.recipe': ('image', 'image_variants', RECIPE_IMAGE_WIDTHS),
+    'accounts.user': ('profile_pic', 'profile_pic_variants', PROFILE_PIC_WIDTHS),
+}
+
+
+def model_label(instance):
+    return instance._meta.label_lower
+
+
+def stage_upload(instance, field_name, upload):
+    """
+    Park an uploaded file in the job queue instead of pushing it to storage
+    during the request. The worker saves it onto instance.<field_name>.
+    """
+    enqueue(
+        'store_upload',
+        payload = {'model': model_label(instance), 'pk': instance.pk, 'field': field_name, 'filename': upload.name},
+        data = b''.join(upload.chunks()),
+    )
+
+
+def needs_derivatives(instance):
+    field_name, variants_field, _ = IMAGE_FIELDS[model_label(instance)]
+    fieldfile = getattr(instance, field_name)
+    return (getattr(instance, variants_field) or {}).get('source') != (fieldfile.name or None)
+
+
+def queue_derivatives(instance):
+    enqueue('refresh_image_derivatives', payload = {'model': model_label(instance), 'pk': instance.pk})
+
+
+def queue_similar_recipes(recipe):
+    enqueue('update_similar_recipes', payload = {'pk': recipe.pk})
+
+
+def load_instance(payload):
+    model = apps.get_model(payload['model'])
+    # the row may be gone by the time the worker gets here, nothing to do then
+    return model.objects.filter(pk = payload['pk']).first()
+
+
+@job('store_upload')
+def storeUpload(queued):
+    instance = load_instance(queued.payload)
+    if instance is None:
+        return
+    field_name = queued.payload['field']
+    getattr(instance, field_name).save(queued.payload['filename'], ContentFile(bytes(queued.data)), save = False)
+    # a normal save so cache invalidation and derivative signals run
+    instance.save(update_fields = with_auto_now(instance, [field_name]))
+
+
+@job('refresh_image_derivatives')
+def refreshImageDerivatives(queued):
+    instance = load_instance(queued.payload)
+    if instance is None:
+        return
+    field_name, variants_field, widths = IMAGE_FIELDS[queued.payload['model']]
+    refresh_derivatives(instance, field_name, variants_field, widths)
+
+
+@job('update_similar_recipes')
+def updateSimilarRecipes(queued):
+    # NumPy and SciPy are only loaded by the worker
+    from recipes.similarity import update_similar_recipes
+
+    update_similar_recipes(queued.payload['pk'])
@@ -0,0 +1,87 @@
+from django import template
+
+from recipes.cache import count, get_fragment, get_fragments, set_fragment, set_fragments
+
+register = template.Library()
+
+
+def recipe_objects(recipe):
+    # a card shows the recipe and its author's name, so either one changing
+    # has to produce a new key
+    return [('recipe', recipe.pk), ('user', recipe.author_id)]
+
+
+class RecipeFragmentNode(template.Node):
+    def __init__(self, name, recipe, nodelist):
+        self.name = name
+        self.recipe = recipe
+        self.nodelist = nodelist
+
+    def render(self, context):
+        recipe = self.recipe.resolve(context)
+        batch = context.render_context.get((RecipeFragmentsNode, self.name))
+        if batch is not None and recipe.pk in batch['fragments']:
+            # looked up by the enclosing cachedrecipes, stored by it after the loop
+            key, content = batch['fragments'][recipe.pk]
+            if content is None:
+                content = self.nodelist.render(context)
+                batch['fragments'][recipe.pk] = (key, content)
+                batch['rendered'][key] = content
+            return content
+
+        key, content = get_fragment(self.name, recipe_objects(recipe))
+        count('fragment', content is not None)
+        if content is None:
+            content = self.nodelist.render(context)
+            set_fragment(key, content)
+        return content
+
+
+class RecipeFragmentsNode(template.Node):
+    def __init__(self, name, recipes, nodelist):
+        self.name = name
+        self.recipes = recipes
+        self.nodelist = nodelist
+
+    def render(self, context):
+        recipes = list(self.recipes.resolve(context) or [])
+        fragments = get_fragments(self.name, [recipe_objects(recipe) for recipe in recipes])
+        batch = {'fragments': dict(zip((recipe.pk for recipe in recipes), fragments)), 'rendered': {}}
+
+        context.render_context[(RecipeFragmentsNode, self.name)] = batch
+        try:
+            content = self.nodelist.render(context)
+        finally:
+            del context.render_context[(RecipeFragmentsNode, self.name)]
+        if batch['rendered']:
+            set_fragments(batch['rendered'])
+        return content
+
+
+@register.tag
+def cachedrecipe(parser, token):
+    """
+    {% cachedrecipe "card" recipe %} ... {% endcachedrecipe %}
+    """
+    bits = token.split_contents()
+    if len(bits) != 3:
+        raise template.TemplateSyntaxError(f"'{bits[0]}' takes a fragment name and a recipe")
+    nodelist = parser.parse(('endcachedrecipe',))
+    parser.delete_first_token()
+    return RecipeFragmentNode(bits[1].strip('\'"'), parser.compile_filter(bits[2]), nodelist)
+
+
+@register.tag
+def cachedrecipes(parser, token):
+    """
+    {% cachedrecipes "card" recipes %} {% for recipe in recipes %}{% cachedrecipe "card" recipe %} ... {% endcachedrecipe %}{% endfor %} {% endcachedrecipes %}
+
+    Looks up every card of the list in one round trip before the loop, and
+    stores the ones it had to render in one after it.
+    """
+    bits = token.split_contents()
+    if len(bits) != 3:
+        raise template.TemplateSyntaxError(f"'{bits[0]}' takes a fragment name and a list of recipes")
+    nodelist = parser.parse(('endcachedrecipes',))
+    parser.delete_first_token()
+    return RecipeFragmentsNode(bits[1].strip('\'"'), parser.compile_filter(bits[2]), nodelist)
@@ -0,0 +1,35 @@
+from django import template
+from django.utils.html import format_html
+
+register = template.Library()
+
+
+def build_srcset(storage, names):
+    return ', '.join(f'{storage.url(name)} {width}w' for width, name in sorted(names.items(), key = lambda item: int(item[0])))
+
+
+@register.simple_tag
+def responsive_image(fieldfile, variants, sizes, alt = '', css_class = '', loading = 'lazy'):
+    """
+    {% responsive_image recipe.image recipe.image_variants "(min-width: 1024px) 33vw, 100vw" alt=recipe.title css_class="..." %}
+
+    Emits a <picture> with a WebP srcset and a JPEG fallback srcset when the
+    derivatives exist, and the original upload otherwise.
+    """
+    if not variants or not variants.get('jpeg'):
+        return format_html(
+            '<img src="{}" alt="{}" class="{}" loading="{}" decoding="async">',
+            fieldfile.url, alt, css_class, loading,
+        )
+
+    storage = fieldfile.storage
+    jpeg = variants['jpeg']
+    fallback = jpeg[max(jpeg, key = int)]
+    return format_html(
+        '<picture>'
+        '<source type="image/webp" srcset="{}" sizes="{}">'
+        '<img src="{}" srcset="{}" sizes="{}" alt="{}" class="{}" loading="{}" decoding="async">'
+        '</picture>',
+        build_srcset(storage, variants.get('webp', {})), sizes,
+        storage.url(fallback), build_srcset(storage, jpeg), sizes, alt, css_class, loading,
+    )
@@ -1,3 +1,1487 @@
-from django.test import TestCase
+import importlib
+import json
+import os
+import re
+import runpy
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from io import BytesIO, StringIO
+from pathlib import Path
+from unittest import mock
 
-# Create your tests here.
+from asgiref.sync import iscoroutinefunction
+from django.apps import apps
+from django.conf import settings
+from django.contrib.sessions.models import Session
+from django.core.management import CommandError, call_command
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import connection, transaction
+from django.db.models import Count
+from django.http import HttpResponse
+from django.template import Context, Template
+from django.test import Client, RequestFactory, TestCase, TransactionTestCase, override_settings
+from django.test.client import BOUNDARY, MULTIPART_CONTENT, encode_multipart
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from fontTools.ttLib import TTFont
+
+from accounts.models import User
+from jobs.models import Job
+from jobs.queue import claim, run_job
+from recipes import api, views
+from recipes.assets import ICON_FONT, STYLESHEET, build_assets, icon_css, used_icon_classes
+from recipes.autocomplete import database_suggestions, finish_before_fork, index as autocomplete_index
+from recipes.models import Ingredient, Recipe, RecipeIngredient, RecipeRanking, Review, SimilarRecipe
+from recipes.cache import bump_version, cache_stats, get_fragment, get_versions, reset_cache_stats, set_fragment
+from recipes.images import RECIPE_IMAGE_WIDTHS, generate_derivatives
+from recipes.ingredients import parse_ingredients, parse_line
+from recipes.pagination import CursorPaginator, capped_count
+from recipes.rankings import refresh_rankings, sort_recipes
+from recipes.search import SQLiteSearchBackend, search_recipes
+from recipes.similarity import matrix_cache, refresh_similar_recipes, update_similar_recipes
+from recipes.transfer import read_checkpoint, write_checkpoint
+from recipeshare.instrumentation import RequestMetricsMiddleware, merge_pool_stats, pool_stats, query_shape, reset_request_stats
+from recipeshare.routers import PIN_COOKIE, ReplicaRouter, read_from_replica
+
+
+def make_recipe(author, **fields):
+    values = {
+        'title': 'Matar Paneer',
+        'image': 'recipe_images/matar-paneer.jpg',
+        'small_description': 'Peas and paneer in a tomato gravy.',
+        'estimated_prep_time': '30 Minutes',
+        'ingredients_list': 'Paneer - 200gm\nPeas - 1 cup',
+        'process': 'Fry the paneer.\nAdd the peas.',
+    }
+    values.update(fields)
+    return Recipe.objects.create(author = author, **values)
+
+
+@override_settings(SECURE_SSL_REDIRECT = False)
+class HomeFeedQueryTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        for i in range(12):
+            author = User.objects.create(username = f'author{i}')
+            reviewer = User.objects.create(username = f'reviewer{i}')
+            recipe = make_recipe(author, title = f'Recipe {i}')
+            Review.objects.create(recipe = recipe, reviewer = reviewer, rating = 4, review = 'Nice')
+
+    def setUp(self):
+        cache.clear()
+
+    def test_feed_page_runs_constant_queries(self):
+        # one COUNT for the cached total and one SELECT for the 9 cards
+        with self.assertNumQueries(2):
+            response = self.client.get(reverse('home_page'))
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.context['recipes']), 9)
+        self.assertContains(response, 'author11')
+
+    def test_feed_defers_large_text_columns(self):
+        recipe = Recipe.objects.feed().first()
+
+        self.assertEqual(recipe.get_deferred_fields(), {'ingredients_list', 'process'})
+        self.assertEqual(recipe.average_rating(), 4.0)
+        self.assertEqual(recipe.total_reviews(), 1)
+
+
+@override_settings(SECURE_SSL_REDIRECT = False)
+class CursorPaginationTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        author = User.objects.create(username = 'author')
+        cls.recipes = [make_recipe(author, title = f'Recipe {i}') for i in range(12)]
+
+    def test_next_and_previous_cursors_walk_the_feed(self):
+        first = self.client.get(reverse('home_page')).context['page_obj']
+        second = self.client.get(reverse('home_page'), {'cursor': first.next_cursor}).context['page_obj']
+        back = self.client.get(reverse('home_page'), {'cursor': second.previous_cursor}).context['page_obj']
+
+        newest_first = list(reversed(self.recipes))
+        self.assertEqual(list(first), newest_first[:9])
+        self.assertEqual(list(second), newest_first[9:])
+        self.assertEqual(list(back), newest_first[:9])
+        self.assertFalse(first.has_previous())
+        self.assertFalse(second.has_next())
+        self.assertFalse(back.has_previous())
+
+    def test_garbage_cursor_falls_back_to_first_page(self):
+        response = self.client.get(reverse('home_page'), {'cursor': 'not-a-cursor'})
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.context['page_obj']), 9)
+
+    def test_profile_headings_count_without_a_full_count(self):
+        author = User.objects.get(username = 'author')
+        self.client.force_login(author)
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse('profile'), secure = True)
+
+        self.assertEqual((response.context['total_recipes'], response.context['more_recipes']), (12, False))
+        self.assertFalse([query['sql'] for query in queries if 'COUNT(*)' in query['sql']])
+        with mock.patch('accounts.views.PROFILE_COUNT_LIMIT', 10):
+            response = self.client.get(reverse('public_profile', args = [author.username]), secure = True)
+        self.assertEqual((response.context['total_recipes'], response.context['more_recipes']), (10, True))
+        self.assertContains(response, '(10+)')
+
+    def test_single_page_is_counted_from_the_page(self):
+        reader = User.objects.create(username = 'reader')
+        recipe = make_recipe(reader, title = 'Only One')
+        paginator = CursorPaginator(Recipe.objects.feed().filter(author = reader), 9)
+        page = paginator.page()
+
+        with self.assertNumQueries(0):
+            self.assertEqual(capped_count(paginator.queryset, 100, page), (1, False))
+        self.assertEqual(list(page), [recipe])
+
+
+class QueryPlanTests(TestCase):
+    """
+    Seeds enough rows for the planner to care and checks that the hot queries
+    are answered from the indexes in recipes/models.py instead of a full scan
+    followed by a sort.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        authors = User.objects.bulk_create([User(username = f'author{i}') for i in range(50)])
+        reviewers = User.objects.bulk_create([User(username = f'reviewer{i}') for i in range(20)])
+        recipes = Recipe.objects.bulk_create([
+            Recipe(
+                author = authors[i % len(authors)], title = f'Recipe {i}', image = 'recipe_images/x.jpg',
+                small_description = 'Tasty', estimated_prep_time = '10 Minutes', ingredients_list = 'Rice - 1 cup', process = 'Cook.',
+            )
+            for i in range(3000)
+        ])
+        Review.objects.bulk_create([
+            Review(recipe = recipe, reviewer = reviewer, rating = 4, review = 'Good')
+            for recipe in recipes[:500]
+            for reviewer in reviewers[:5]
+        ])
+        SimilarRecipe.objects.bulk_create([
+            SimilarRecipe(recipe = recipe, similar = recipes[(i + offset) % len(recipes)], score = 1 / offset)
+            for i, recipe in enumerate(recipes[:1000])
+            for offset in range(1, 7)
+        ])
+        cls.author = authors[0]
+        cls.recipe = recipes[0]
+        cls.reviewer = reviewers[0]
+        refresh_rankings()
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE')
+
+    def assertUsesIndex(self, queryset, index_name):
+        plan = queryset.explain()
+        self.assertIn(index_name, plan)
+        if connection.vendor == 'sqlite':
+            self.assertNotIn('TEMP B-TREE', plan)
+            self.assertNotRegex(plan, r'SCAN recipes_(recipe|review)\b(?! USING)')
+        elif connection.vendor == 'postgresql':
+            self.assertNotIn('Seq Scan', plan)
+            self.assertNotRegex(plan, r'\bSort\b')
+
+    def test_feed_page_walks_the_feed_index(self):
+        self.assertUsesIndex(Recipe.objects.feed()[:10], 'recipes_recipe_feed')
+
+    def test_feed_cursor_page_walks_the_feed_index(self):
+        paginator = CursorPaginator(Recipe.objects.feed(), 9)
+        cursor_values = paginator.key_values(self.recipe)
+        queryset = paginator.queryset.filter(paginator.seek(cursor_values, forward = True))[:10]
+
+        self.assertUsesIndex(queryset, 'recipes_recipe_feed')
+
+    def test_leaderboards_walk_the_ranking_indexes(self):
+        for sort, index_name in (('top', 'recipes_ranking_top'), ('trending', 'recipes_ranking_trending')):
+            paginator = CursorPaginator(sort_recipes(Recipe.objects.feed(), sort), 9)
+            cursor_values = paginator.key_values(paginator.page().object_list[-1])
+
+            self.assertUsesIndex(paginator.queryset[:10], index_name)
+            self.assertUsesIndex(paginator.queryset.filter(paginator.seek(cursor_values, forward = True))[:10], index_name)
+
+    def test_profile_listing_walks_the_author_index(self):
+        self.assertUsesIndex(Recipe.objects.feed().filter(author = self.author)[:10], 'recipes_recipe_author_feed')
+
+    def test_recipe_reviews_walk_the_recent_review_index(self):
+        self.assertUsesIndex(self.recipe.reviews.all()[:10], 'recipes_review_recipe_recent')
+
+    def test_similar_recipes_walk_the_score_index(self):
+        similar = SimilarRecipe.objects.filter(recipe = self.recipe).select_related('similar').order_by('-score')[:6]
+        self.assertUsesIndex(similar, 'recipes_similar_recipe_score')
+
+    def test_review_stream_walks_the_recent_review_index(self):
+        paginator = views.reviewStream(self.recipe.pk, self.reviewer)
+        cursor_values = paginator.key_values(paginator.page().object_list[-1])
+
+        self.assertUsesIndex(paginator.queryset[:10], 'recipes_review_recipe_recent')
+        self.assertUsesIndex(paginator.queryset.filter(paginator.seek(cursor_values, forward = True))[:10], 'recipes_review_recipe_recent')
+
+    def test_rating_histogram_reads_the_rating_index(self):
+        histogram = Review.objects.filter(recipe = self.recipe).values('rating').annotate(count = Count('id')).order_by()
+        self.assertUsesIndex(histogram, 'recipes_review_recipe_rating')
+
+    def test_own_review_lookup_uses_the_unique_index(self):
+        plan = Review.objects.filter(recipe = self.recipe, reviewer = self.reviewer).explain()
+
+        if connection.vendor == 'sqlite':
+            self.assertRegex(plan, r'SEARCH recipes_review USING (COVERING )?INDEX \S+ \(recipe_id=\? AND reviewer_id=\?\)')
+        elif connection.vendor == 'postgresql':
+            self.assertIn('Index Scan', plan)
+
+
+@override_settings(SECURE_SSL_REDIRECT = False, RANKING_PRIOR_WEIGHT = 5, RANKING_TRENDING_HALF_LIFE = 72)
+class RankingTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create(username = 'author')
+        cls.reviewers = [User.objects.create(username = f'reviewer{i}') for i in range(3)]
+        cls.loved, cls.liked, cls.meh, cls.new = [make_recipe(cls.author, title = title) for title in ('Loved', 'Liked', 'Meh', 'New')]
+
+    def setUp(self):
+        cache.clear()
+        # pins the site average at RANKING_PRIOR_MEAN while there are no reviews
+        refresh_rankings()
+
+    def review(self, recipe, reviewer, rating):
+        return Review.objects.create(recipe = recipe, reviewer = reviewer, rating = rating, review = 'Noted')
+
+    def titles(self, sort, **params):
+        response = self.client.get(reverse('home_page'), {'sort': sort, **params})
+        return [recipe.title for recipe in response.context['recipes']], response
+
+    def trending(self):
+        return dict(RecipeRanking.objects.values_list('recipe_id', 'trending'))
+
+    def test_top_rated_weighs_ratings_by_how_many_there_are(self):
+        for reviewer in self.reviewers:
+            self.review(self.loved, reviewer, 5)
+        self.review(self.liked, self.reviewers[0], 5)
+        self.review(self.meh, self.reviewers[0], 2)
+
+        titles, response = self.titles('top')
+
+        # three 5 star reviews beat one, a recipe without reviews sits at the site average
+        self.assertEqual(titles, ['Loved', 'Liked', 'New', 'Meh'])
+        self.assertEqual(response.context['sort'], 'top')
+        self.assertEqual(self.titles('nonsense')[0], ['New', 'Meh', 'Liked', 'Loved'])
+
+    def test_trending_decays_old_reviews(self):
+        old = [self.review(self.loved, reviewer, 5) for reviewer in self.reviewers]
+        Review.objects.filter(pk__in = [review.pk for review in old]).update(created_at = timezone.now() - timedelta(days = 10))
+        self.review(self.liked, self.reviewers[0], 5)
+        refresh_rankings()
+
+        # three reviews from 10 days (3.3 half-lives) ago weigh less than one from today
+        self.assertEqual(self.titles('trending')[0][:2], ['Liked', 'Loved'])
+
+    def test_review_writes_keep_trending_in_step_with_a_full_refresh(self):
+        review = self.review(self.loved, self.reviewers[0], 5)
+        self.review(self.loved, self.reviewers[1], 3)
+        self.review(self.liked, self.reviewers[2], 4)
+        review.rating = 2
+        review.save()
+        Review.objects.filter(recipe = self.liked).delete()
+
+        incremental = self.trending()
+        refresh_rankings()
+
+        self.assertEqual(incremental[self.liked.pk], 0)
+        for recipe_id, trending in self.trending().items():
+            self.assertAlmostEqual(incremental[recipe_id], trending, places = 6)
+
+    def test_sorted_feed_pages_with_cursors(self):
+        self.review(self.loved, self.reviewers[0], 5)
+        everything = self.titles('top')[0]
+
+        paginator = CursorPaginator(sort_recipes(Recipe.objects.feed(), 'top'), 2)
+        first = paginator.page()
+        with self.assertNumQueries(1):
+            second = paginator.page(first.next_cursor)
+
+        self.assertEqual([recipe.title for recipe in list(first) + list(second)], everything)
+        self.assertEqual(self.client.get(reverse('api_recipes'), {'sort': 'top', 'fields': 'title'}).json()['results'][0], {'title': 'Loved'})
+
+
+@override_settings(SECURE_SSL_REDIRECT = False, AUTOCOMPLETE_BACKGROUND_BUILD = False)
+class AutocompleteTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create(username = 'author')
+        cls.matar = make_recipe(cls.author, title = 'Matar Paneer', ingredients_list = 'Paneer - 200gm\nPeas - 1 cup')
+        cls.tikka = make_recipe(cls.author, title = 'Paneer Tikka', ingredients_list = 'Paneer - 250gm\nPaprika - 1 tsp')
+        cls.dal = make_recipe(cls.author, title = 'Dal Tadka', ingredients_list = 'Toor dal - 1 cup')
+
+    def setUp(self):
+        cache.clear()
+        autocomplete_index.__init__()
+
+    def suggest(self, query, **params):
+        return self.client.get(reverse('api_autocomplete'), {'q': query, **params}).json()
+
+    def test_first_request_builds_the_index_and_matches_word_prefixes(self):
+        result = self.suggest('  PAN ')
+
+        self.assertEqual(result['source'], 'index')
+        # "matar paneer" matches on its second word, keys sort "paneer" < "paneer tikka"
+        self.assertEqual([recipe['title'] for recipe in result['recipes']], ['Matar Paneer', 'Paneer Tikka'])
+        self.assertEqual(result['ingredients'], ['paneer'])
+        self.assertEqual(self.suggest('pa', limit = 1)['ingredients'], ['paneer'])
+        self.assertEqual(self.suggest('')['recipes'], [])
+
+    def test_recipe_writes_update_the_index_after_commit(self):
+        autocomplete_index.build()
+        with self.captureOnCommitCallbacks(execute = True):
+            pulao = make_recipe(self.author, title = 'Peas Pulao', ingredients_list = 'Basmati rice - 1 cup')
+            self.tikka.title = 'Chilli Paneer'
+            self.tikka.save()
+            self.dal.delete()
+
+        with self.assertNumQueries(0):
+            result = autocomplete_index.suggest('p', 10)
+        self.assertEqual([recipe['id'] for recipe in result['recipes']], [self.matar.pk, self.tikka.pk, pulao.pk])
+        self.assertEqual(autocomplete_index.suggest('dal', 10)['recipes'], [])
+        self.assertEqual(autocomplete_index.suggest('bas', 10)['ingredients'], ['basmati rice'])
+        # our own writes keep the index current, no rebuild needed
+        self.assertEqual(autocomplete_index.version, get_versions(('autocomplete', 'all'))[0])
+
+    def test_cold_index_falls_back_to_the_title_index(self):
+        recipes, ingredients = database_suggestions('Paneer', 5)
+
+        self.assertEqual([row['title'] for row in recipes], ['Paneer Tikka'])
+        self.assertEqual(list(ingredients), ['paneer'])
+        plan = recipes.explain()
+        self.assertIn('recipes_recipe_title_lower', plan)
+
+    def test_writes_from_another_process_trigger_a_rebuild(self):
+        autocomplete_index.build()
+        # another worker created a recipe: the row exists, this index never saw it
+        Recipe.objects.bulk_create([Recipe(author = self.author, title = 'Palak Paneer', image = 'x.jpg', small_description = 'x', estimated_prep_time = '1', ingredients_list = 'x', process = 'x')])
+        bump_version('autocomplete', 'all')
+        self.assertEqual(self.suggest('palak')['recipes'], [])
+
+        with self.settings(AUTOCOMPLETE_CHECK_INTERVAL = 0, AUTOCOMPLETE_REBUILD_INTERVAL = 0):
+            self.assertEqual([recipe['title'] for recipe in self.suggest('palak')['recipes']], ['Palak Paneer'])
+
+    def test_fork_waits_for_a_build_in_progress(self):
+        finished = threading.Event()
+        autocomplete_index.thread = threading.Thread(target = lambda: (time.sleep(0.2), finished.set()))
+        autocomplete_index.thread.start()
+
+        finish_before_fork()
+        self.assertTrue(finished.is_set())
+
+
+@override_settings(SECURE_SSL_REDIRECT = False)
+class ReviewStreamTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create(username = 'author')
+        cls.recipe = make_recipe(cls.author)
+        cls.reviewers = User.objects.bulk_create([User(username = f'reviewer{i}') for i in range(25)])
+        # one by one, the recipe's rating totals are kept by the review signals
+        for i, reviewer in enumerate(cls.reviewers):
+            Review.objects.create(recipe = cls.recipe, reviewer = reviewer, rating = [5, 5, 4, 3, 1][i % 5], review = f'Review {i}')
+
+    def setUp(self):
+        cache.clear()
+
+    def test_detail_page_shows_the_first_page_and_the_full_histogram(self):
+        response = self.client.get(reverse('recipe_detail', args = [self.recipe.pk]))
+
+        self.assertEqual(len(response.context['reviews'].object_list), views.REVIEWS_PER_PAGE)
+        self.assertEqual(response.context['total_reviews'], 25)
+        self.assertEqual(
+            [(row['stars'], row['count'], row['percent']) for row in response.context['rating_histogram']],
+            [(5, 10, 40), (4, 5, 20), (3, 5, 20), (2, 0, 0), (1, 5, 20)],
+        )
+        self.assertContains(response, 'data-load-more')
+
+    def test_load_more_walks_every_review_once(self):
+        page = self.client.get(reverse('recipe_detail', args = [self.recipe.pk])).context['reviews']
+        seen = [review.pk for review in page.object_list]
+        while page.has_next():
+            with self.assertNumQueries(1):
+                response = self.client.get(reverse('recipe_reviews', args = [self.recipe.pk]), {'cursor': page.next_cursor})
+            page = response.context['reviews']
+            seen += [review.pk for review in page.object_list]
+
+        self.assertEqual(sorted(seen), sorted(Review.objects.values_list('pk', flat = True)))
+        self.assertNotContains(response, 'data-load-more')
+
+    def test_own_review_is_pinned_above_the_stream(self):
+        reviewer = self.reviewers[0]
+        self.client.force_login(reviewer)
+        response = self.client.get(reverse('recipe_detail', args = [self.recipe.pk]))
+
+        self.assertEqual(response.context['own_review'].reviewer_id, reviewer.pk)
+        self.assertContains(response, 'Your review')
+        self.assertNotIn(reviewer.pk, [review.reviewer_id for review in response.context['reviews'].object_list])
+        self.assertNotContains(response, 'Leave a Review')
+
+
+@override_settings(SECURE_SSL_REDIRECT = False)
+class ReviewUpsertTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create(username = 'author')
+        cls.reviewer = User.objects.create(username = 'reviewer')
+        cls.recipe = make_recipe(cls.author)
+
+    def post(self, rating, review = ''):
+        return self.client.post(reverse('add_review', args = [self.recipe.pk]), {'rating': rating, 'review': review})
+
+    def totals(self):
+        recipe = Recipe.objects.get(pk = self.recipe.pk)
+        return recipe.rating_sum, recipe.rating_count, recipe.rating_avg
+
+    def test_second_submit_edits_the_review(self):
+        self.client.force_login(self.reviewer)
+        self.post(2, 'Bland')
+        created_at = Review.objects.get().created_at
+
+        with CaptureQueriesContext(connection) as queries:
+            response = self.post(5, 'Better the next day')
+
+        # the only write to the review table is the upsert
+        writes = [query['sql'] for query in queries if query['sql'].startswith(('INSERT INTO "recipes_review"', 'UPDATE "recipes_review"'))]
+        self.assertEqual(len(writes), 1)
+        self.assertIn('ON CONFLICT', writes[0])
+
+        review = Review.objects.get()
+        self.assertEqual((review.rating, review.review, review.created_at), (5, 'Better the next day', created_at))
+        self.assertEqual(self.totals(), (5, 1, 5.0))
+        trending = RecipeRanking.objects.get(recipe = self.recipe).trending
+        refresh_rankings()
+        self.assertAlmostEqual(RecipeRanking.objects.get(recipe = self.recipe).trending, trending)
+        self.assertContains(self.client.get(response.url), 'Updated Review Successfully!')
+
+    def test_authors_and_missing_ratings_are_turned_away(self):
+        self.client.force_login(self.author)
+        self.post(5)
+        self.client.force_login(self.reviewer)
+        self.post('')
+        self.post(9)
+
+        self.assertFalse(Review.objects.exists())
+        self.assertEqual(self.totals(), (0, 0, 0.0))
+        self.assertEqual(self.client.post(reverse('add_review', args = [999]), {'rating': 3}).status_code, 404)
+
+    def test_api_put_creates_then_updates(self):
+        url = reverse('api_recipe_reviews', args = [self.recipe.pk])
+        self.client.force_login(self.reviewer)
+
+        created = self.client.put(url, {'rating': 3}, content_type = 'application/json')
+        updated = self.client.put(url, {'rating': 4, 'review': 'Grew on me'}, content_type = 'application/json')
+
+        self.assertEqual((created.status_code, updated.status_code), (201, 200))
+        self.assertEqual(updated.json()['review'], 'Grew on me')
+        self.assertEqual(self.totals(), (4, 1, 4.0))
+
+    def test_repeated_deletes_take_the_rating_out_once(self):
+        self.client.force_login(self.reviewer)
+        self.post(4)
+        Review.objects.create(recipe = self.recipe, reviewer = User.objects.create(username = 'second'), rating = 2)
+        url = reverse('delete_review', args = [self.recipe.pk])
+
+        self.client.post(url)
+        again = self.client.post(url)
+        api = self.client.delete(reverse('api_recipe_reviews', args = [self.recipe.pk]))
+
+        self.assertContains(self.client.get(again.url), 'Review not found!')
+        self.assertEqual(api.status_code, 404)
+        self.assertEqual(self.totals(), (2, 1, 2.0))
+        self.assertEqual(self.client.post(reverse('delete_review', args = [999])).status_code, 404)
+
+
+@override_settings(SECURE_SSL_REDIRECT = False)
+class RatingSignalTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        author = User.objects.create(username = 'author')
+        cls.reviewers = [User.objects.create(username = f'reviewer{i}') for i in range(3)]
+        cls.recipe = make_recipe(author, title = 'Matar Paneer')
+        cls.other = make_recipe(author, title = 'Palak Paneer')
+
+    def totals(self, recipe):
+        recipe = Recipe.objects.get(pk = recipe.pk)
+        return recipe.rating_sum, recipe.rating_count, recipe.rating_avg
+
+    def test_orm_saves_apply_the_difference(self):
+        review = Review.objects.create(recipe = self.recipe, reviewer = self.reviewers[0], rating = 4)
+        Review.objects.create(recipe = self.recipe, reviewer = self.reviewers[1], rating = 1)
+        self.assertEqual(self.totals(self.recipe), (5, 2, 2.5))
+
+        review.rating = 5
+        review.save()
+        self.assertEqual(self.totals(self.recipe), (6, 2, 3.0))
+
+        # the rating deferred, the old value is read before the save
+        review = Review.objects.only('id', 'recipe').get(pk = review.pk)
+        review.rating = 2
+        review.save()
+        self.assertEqual(self.totals(self.recipe), (3, 2, 1.5))
+
+        review.review = 'Same rating, new words'
+        review.save()
+        self.assertEqual(self.totals(self.recipe), (3, 2, 1.5))
+
+    def test_admin_edit(self):
+        review = Review.objects.create(recipe = self.recipe, reviewer = self.reviewers[0], rating = 4, review = 'Good')
+        self.client.force_login(User.objects.create_superuser(username = 'admin', password = 'x'))
+
+        response = self.client.post(reverse('admin:recipes_review_change', args = [review.pk]), {
+            'review': 'Even better reheated', 'rating': 5, 'recipe': self.recipe.pk, 'reviewer': self.reviewers[0].pk,
+        })
+
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(self.totals(self.recipe), (5, 1, 5.0))
+
+    def test_review_moved_to_another_recipe(self):
+        review = Review.objects.create(recipe = self.recipe, reviewer = self.reviewers[0], rating = 4)
+        Review.objects.create(recipe = self.other, reviewer = self.reviewers[1], rating = 2)
+
+        review.recipe = self.other
+        review.rating = 3
+        review.save()
+
+        self.assertEqual(self.totals(self.recipe), (0, 0, 0.0))
+        self.assertEqual(self.totals(self.other), (5, 2, 2.5))
+
+    def test_deletes(self):
+        review = Review.objects.create(recipe = self.recipe, reviewer = self.reviewers[0], rating = 4)
+        for reviewer, rating in zip(self.reviewers[1:], (2, 5)):
+            Review.objects.create(recipe = self.recipe, reviewer = reviewer, rating = rating)
+
+        review.delete()
+        self.assertEqual(self.totals(self.recipe), (7, 2, 3.5))
+        Review.objects.filter(recipe = self.recipe).delete()
+        self.assertEqual(self.totals(self.recipe), (0, 0, 0.0))
+
+    def test_recipe_delete_skips_its_reviews_bookkeeping(self):
+        for reviewer in self.reviewers:
+            Review.objects.create(recipe = self.recipe, reviewer = reviewer, rating = 4)
+        with CaptureQueriesContext(connection) as three_reviews:
+            self.recipe.delete()
+
+        for reviewer in self.reviewers[:1]:
+            Review.objects.create(recipe = self.other, reviewer = reviewer, rating = 4)
+        with CaptureQueriesContext(connection) as one_review:
+            self.other.delete()
+
+        self.assertEqual(len(three_reviews), len(one_review))
+        self.assertFalse(RecipeRanking.objects.exists())
+
+    def test_user_delete_keeps_the_totals_of_other_authors_recipes(self):
+        Review.objects.create(recipe = self.recipe, reviewer = self.reviewers[0], rating = 4)
+        Review.objects.create(recipe = self.recipe, reviewer = self.reviewers[1], rating = 2)
+        reviewed = make_recipe(self.reviewers[0], title = 'Chole')
+        Review.objects.create(recipe = reviewed, reviewer = self.reviewers[1], rating = 5)
+
+        self.reviewers[0].delete()
+
+        self.assertEqual(self.totals(self.recipe), (2, 1, 2.0))
+        self.assertFalse(Recipe.objects.filter(pk = reviewed.pk).exists())
+
+    def test_recompute_ratings_repairs_drift(self):
+        for reviewer, rating in zip(self.reviewers, (3, 4, 4)):
+            Review.objects.create(recipe = self.recipe, reviewer = reviewer, rating = rating)
+        Recipe.objects.filter(pk = self.recipe.pk).update(rating_sum = 99, rating_count = 1, rating_avg = 99)
+
+        out = StringIO()
+        call_command('recompute_ratings', dry_run = True, stdout = out)
+        self.assertIn('Checked 2 recipes, 1 would be fixed.', out.getvalue())
+        self.assertEqual(self.totals(self.recipe), (99, 1, 99.0))
+
+        call_command('recompute_ratings', batch_size = 1, stdout = out)
+        self.assertIn('Checked 2 recipes, 1 fixed.', out.getvalue())
+        self.assertEqual(self.totals(self.recipe), (11, 3, 3.7))
+        self.assertEqual(self.totals(self.other), (0, 0, 0.0))
+
+
+@override_settings(SECURE_SSL_REDIRECT = False)
+class ConcurrentReviewTests(TransactionTestCase):
+    def test_parallel_submits_leave_one_review_and_consistent_totals(self):
+        author = User.objects.create(username = 'author')
+        reviewers = [User.objects.create(username = f'reviewer{i}') for i in range(3)]
+        recipe = make_recipe(author)
+        # every reviewer double submits, the same reviewer's requests race each other
+        submits = [(reviewer, rating) for reviewer in reviewers for rating in (2, 4)]
+        barrier = threading.Barrier(len(submits))
+
+        def submit(reviewer, rating):
+            client = Client()
+            client.force_login(reviewer)
+            barrier.wait()
+            try:
+                return client.post(reverse('add_review', args = [recipe.pk]), {'rating': rating}).status_code
+            finally:
+                connection.close()
+
+        with ThreadPoolExecutor(len(submits)) as pool:
+            statuses = list(pool.map(lambda args: submit(*args), submits))
+
+        self.assertEqual(statuses, [302] * len(submits))
+        reviews = Review.objects.filter(recipe = recipe)
+        self.assertEqual(reviews.count(), len(reviewers))
+        recipe.refresh_from_db()
+        self.assertEqual((recipe.rating_sum, recipe.rating_count), (sum(review.rating for review in reviews), len(reviewers)))
+
+    def test_parallel_deletes_take_the_rating_out_once(self):
+        author = User.objects.create(username = 'author')
+        reviewers = [User.objects.create(username = f'reviewer{i}') for i in range(2)]
+        recipe = make_recipe(author)
+        for reviewer, rating in zip(reviewers, (4, 2)):
+            Review.objects.create(recipe = recipe, reviewer = reviewer, rating = rating)
+        barrier = threading.Barrier(4)
+
+        def delete(path):
+            client = Client()
+            client.force_login(reviewers[0])
+            barrier.wait()
+            try:
+                if path == 'api':
+                    return client.delete(reverse('api_recipe_reviews', args = [recipe.pk])).status_code
+                return client.post(reverse('delete_review', args = [recipe.pk])).status_code
+            finally:
+                connection.close()
+
+        with ThreadPoolExecutor(4) as pool:
+            statuses = sorted(pool.map(delete, ['view', 'view', 'api', 'api']))
+
+        self.assertIn(statuses, ([204, 302, 302, 404], [302, 302, 404, 404]))
+        recipe.refresh_from_db()
+        self.assertEqual((recipe.rating_sum, recipe.rating_count), (2, 1))
+
+
+class SearchTests(TestCase):
+    """Runs against the backend of the test database: FTS5 on SQLite, tsvector on PostgreSQL."""
+
+    @classmethod
+    def setUpTestData(cls):
+        author = User.objects.create(username = 'author')
+        cls.described = make_recipe(author, title = 'Aloo Gobi', ingredients_list = 'Potato - 2\nCauliflower - 1', small_description = 'Goes well with paneer.')
+        cls.listed = make_recipe(author, title = 'Palak Curry', ingredients_list = 'Paneer - 200gm\nSpinach - 1 bunch', small_description = 'Green.')
+        cls.titled = make_recipe(author, title = 'Paneer Tikka', ingredients_list = 'Yogurt - 1 cup\nSpice mix - 2 tbsp', small_description = 'Grilled.')
+
+    def search(self, query):
+        return list(search_recipes(Recipe.objects.all(), query))
+
+    def clear_index(self):
+        if connection.vendor == 'postgresql':
+            Recipe.objects.update(search_vector = None)
+        else:
+            with connection.cursor() as cursor:
+                cursor.execute(f'DELETE FROM {SQLiteSearchBackend.table}')
+
+    def test_title_outranks_ingredients_outranks_description(self):
+        self.assertEqual(self.search('paneer'), [self.titled, self.listed, self.described])
+
+    def test_every_word_matches_as_a_prefix(self):
+        self.assertEqual(self.search('pan'), [self.titled, self.listed, self.described])
+        self.assertEqual(self.search('pan spin'), [self.listed])
+        self.assertEqual(self.search('?!'), [])
+
+    def test_edits_and_deletes_reach_the_index(self):
+        self.listed.title = 'Saag Curry'
+        self.listed.ingredients_list = 'Mustard greens - 1 bunch'
+        self.listed.save()
+        self.described.delete()
+
+        self.assertEqual(self.search('saag'), [self.listed])
+        self.assertEqual(self.search('paneer'), [self.titled])
+        if connection.vendor == 'sqlite':
+            with connection.cursor() as cursor:
+                cursor.execute(f'SELECT rowid FROM {SQLiteSearchBackend.table} ORDER BY rowid')
+                self.assertEqual([row[0] for row in cursor.fetchall()], [self.listed.pk, self.titled.pk])
+
+    def test_rebuild_command_restores_the_index(self):
+        self.clear_index()
+        self.assertEqual(self.search('paneer'), [])
+
+        out = StringIO()
+        call_command('rebuild_search_index', stdout = out)
+
+        self.assertEqual(self.search('paneer'), [self.titled, self.listed, self.described])
+        self.assertIn('Rebuilt search index', out.getvalue())
+
+
+class IngredientTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        author = User.objects.create(username = 'author')
+        cls.matar = make_recipe(author, title = 'Matar Paneer', ingredients_list = '200gm Paneer\n1 cup peas\nSalt to taste')
+        cls.pulao = make_recipe(author, title = 'Peas Pulao', ingredients_list = 'Rice 150gm\nPeas - 1 cup')
+        cls.kheer = make_recipe(author, title = 'Kheer', ingredients_list = 'Rice: 100 g\nMilk - 1 litre')
+
+    def test_amounts_are_taken_out_of_the_name(self):
+        self.assertEqual(parse_line('Rice - 150gm'), ('rice', '150', 'gm'))
+        self.assertEqual(parse_line('Paneer: 500 g'), ('paneer', '500', 'g'))
+        self.assertEqual(parse_line('Onions - 2 medium'), ('onions', '2', 'medium'))
+        self.assertEqual(parse_line('2 cups flour'), ('flour', '2', 'cups'))
+        self.assertEqual(parse_line('1/2 tsp of Salt'), ('salt', '1/2', 'tsp'))
+        self.assertEqual(parse_line('3-4 green chillies'), ('green chillies', '3-4', ''))
+        self.assertEqual(parse_line('Rice 150gm'), ('rice', '150', 'gm'))
+        self.assertEqual(parse_line('Eggs 2'), ('eggs', '2', ''))
+        self.assertEqual(parse_line('Salt - to taste'), ('salt', '', 'to taste'))
+        self.assertEqual(parse_line('Vitamin B12'), ('vitamin b12', '', ''))
+        self.assertEqual(parse_ingredients('• Peas – 1 cup\n\n  \n*'), [('peas', '1', 'cup')])
+
+    def test_recipes_by_ingredient(self):
+        self.assertEqual(set(Recipe.objects.with_ingredient(' PEAS ')), {self.matar, self.pulao})
+        self.assertEqual(set(Recipe.objects.with_ingredient('rice')), {self.pulao, self.kheer})
+        self.assertEqual(list(Recipe.objects.with_all_ingredients(['Rice', 'peas'])), [self.pulao])
+        self.assertEqual(list(Recipe.objects.with_all_ingredients(['rice', 'saffron'])), [])
+
+    def test_migration_reparses_names_that_kept_their_amount(self):
+        # what the first parser stored for "200gm Paneer"
+        stale = Ingredient.objects.create(name = '200gm paneer')
+        RecipeIngredient.objects.filter(recipe = self.matar, ingredient__name = 'paneer').update(ingredient = stale, quantity = '', unit = '')
+
+        importlib.import_module('recipes.migrations.0012_reparse_ingredients').reparse_ingredients(apps, None)
+
+        self.assertEqual(
+            list(self.matar.recipe_ingredients.values_list('ingredient__name', 'quantity', 'unit')),
+            [('paneer', '200', 'gm'), ('peas', '1', 'cup'), ('salt to taste', '', '')],
+        )
+        self.assertFalse(Ingredient.objects.filter(name = '200gm paneer').exists())
+
+
+@override_settings(SECURE_SSL_REDIRECT = False, SIMILAR_RECIPES_COUNT = 2)
+class SimilarRecipeTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create(username = 'author')
+        cls.matar = make_recipe(cls.author, title = 'Matar Paneer', ingredients_list = 'Paneer - 200gm\nPeas - 1 cup\nSalt - 1 tsp')
+        cls.palak = make_recipe(cls.author, title = 'Palak Paneer', ingredients_list = 'Paneer - 200gm\nSpinach - 1 bunch\nSalt - 1 tsp')
+        cls.pulao = make_recipe(cls.author, title = 'Peas Pulao', ingredients_list = 'Rice - 1 cup\nPeas - 1 cup\nSalt - 1 tsp')
+        cls.halwa = make_recipe(cls.author, title = 'Sooji Halwa', ingredients_list = 'Semolina - 1 cup\nSugar - 1 cup')
+
+    def setUp(self):
+        # rows of another test's recipes, the test database reuses their ids
+        matrix_cache.clear()
+
+    def similar(self, recipe):
+        return list(SimilarRecipe.objects.filter(recipe = recipe).order_by('-score').values_list('similar__title', flat = True))
+
+    def test_refresh_ranks_by_shared_ingredients_weighted_by_rarity(self):
+        self.assertEqual(refresh_similar_recipes(chunk_size = 3), 4)
+
+        # paneer and peas are in two recipes each, salt in three: it counts least
+        self.assertEqual(self.similar(self.matar), ['Palak Paneer', 'Peas Pulao'])
+        self.assertEqual(self.similar(self.palak), ['Matar Paneer', 'Peas Pulao'])
+        # nothing in common with anything, no neighbours rather than random ones
+        self.assertEqual(self.similar(self.halwa), [])
+
+    def test_edited_ingredients_update_the_recipe_and_its_neighbours(self):
+        refresh_similar_recipes()
+        self.halwa.ingredients_list = 'Semolina - 1 cup\nSpinach - 1 bunch\nPaneer - 100gm'
+        self.halwa.save()
+
+        queued = Job.objects.filter(name = 'update_similar_recipes', payload__pk = self.halwa.pk).latest('pk')
+        # claimed the way a worker would, run_job only finishes a job it owns
+        Job.objects.exclude(pk = queued.pk).update(run_after = timezone.now() + timedelta(days = 1))
+        self.assertEqual(claim().pk, queued.pk)
+
+        self.assertTrue(run_job(Job.objects.get(pk = queued.pk)))
+        self.assertEqual(Job.objects.get(pk = queued.pk).status, Job.DONE)
+
+        self.assertEqual(self.similar(self.halwa), ['Palak Paneer', 'Matar Paneer'])
+        self.assertEqual(self.similar(self.palak), ['Sooji Halwa', 'Matar Paneer'])
+
+    def test_updates_score_against_the_cached_matrix(self):
+        refresh_similar_recipes()
+        kheer = make_recipe(self.author, title = 'Kheer', ingredients_list = 'Rice - 1 cup\nSugar - 1 cup\nCardamom - 2')
+        self.pulao.delete()
+
+        with mock.patch('recipes.similarity.build_matrix') as build_matrix:
+            update_similar_recipes(kheer.pk)
+            update_similar_recipes(self.matar.pk)
+
+        build_matrix.assert_not_called()
+        # a new recipe and a new ingredient, scored without a rebuild
+        self.assertEqual(self.similar(kheer), ['Sooji Halwa'])
+        self.assertEqual(self.similar(self.halwa), ['Kheer'])
+        # the deleted recipe is still in the cached matrix but never comes back as a neighbour
+        self.assertEqual(self.similar(self.matar), ['Palak Paneer'])
+
+    def test_saving_unchanged_ingredients_skips_the_sync(self):
+        recipe = Recipe.objects.get(pk = self.matar.pk)
+        rows = list(recipe.recipe_ingredients.values_list('pk', flat = True))
+        jobs = Job.objects.filter(name = 'update_similar_recipes', payload__pk = recipe.pk)
+        queued = jobs.count()
+
+        recipe.title = 'Matar Paneer Masala'
+        recipe.save()
+        self.assertEqual(list(recipe.recipe_ingredients.values_list('pk', flat = True)), rows)
+        self.assertEqual(jobs.count(), queued)
+
+        recipe.ingredients_list += '\nCream - 2 tbsp'
+        recipe.save()
+        self.assertEqual(recipe.recipe_ingredients.count(), 4)
+        self.assertEqual(jobs.count(), queued + 1)
+
+    def test_detail_page_shows_the_precomputed_panel(self):
+        refresh_similar_recipes()
+        response = self.client.get(reverse('recipe_detail', args = [self.matar.pk]))
+
+        self.assertEqual([recipe.title for recipe in response.context['similar_recipes']], ['Palak Paneer', 'Peas Pulao'])
+        self.assertContains(response, 'You May Also Like')
+        # a refresh must not leave cached pages or ETags with the old panel
+        etag = response['ETag']
+        refresh_similar_recipes()
+        self.assertNotEqual(self.client.get(reverse('recipe_detail', args = [self.matar.pk]))['ETag'], etag)
+
+    def test_deleting_a_neighbour_refreshes_the_pages_listing_it(self):
+        refresh_similar_recipes()
+        url = reverse('recipe_detail', args = [self.matar.pk])
+        etag = self.client.get(url)['ETag']
+
+        self.palak.delete()
+        response = self.client.get(url, HTTP_IF_NONE_MATCH = etag)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([recipe.title for recipe in response.context['similar_recipes']], ['Peas Pulao'])
+
+
+@override_settings(SECURE_SSL_REDIRECT = False)
+class StaticAssetTests(TestCase):
+    def test_committed_build_matches_the_templates(self):
+        static_dir = Path(settings.STATICFILES_DIRS[0])
+        with tempfile.TemporaryDirectory() as directory:
+            build_assets(directory)
+            for path in (STYLESHEET, Path(f'{ICON_FONT}.woff2'), Path(f'{ICON_FONT}.woff')):
+                # a template gained a class or an icon since the last `manage.py build_assets`
+                self.assertEqual((Path(directory) / path).read_bytes(), (static_dir / path).read_bytes(), path)
+
+    def test_icons_in_the_templates_are_in_the_font_subset(self):
+        _, codepoints = icon_css(used_icon_classes())
+        font = TTFont(Path(settings.STATICFILES_DIRS[0]) / f'{ICON_FONT}.woff2')
+
+        self.assertIn(0xf005, codepoints)  # fa-star
+        self.assertLessEqual(set(codepoints), set(font.getBestCmap()))
+
+    def test_pages_load_no_third_party_scripts_or_stylesheets(self):
+        response = self.client.get(reverse('home_page'))
+
+        self.assertContains(response, 'css/app.css')
+        self.assertNotRegex(response.content.decode(), r'<(script|link)[^>]+(src|href)="https?://')
+
+
+class StartupTests(TestCase):
+    def gunicorn_config(self, **environ):
+        with mock.patch.dict(os.environ, environ):
+            return runpy.run_path(str(settings.BASE_DIR / 'gunicorn.conf.py'))
+
+    def test_app_imports_without_the_storage_and_image_libraries(self):
+        env = {**os.environ, 'DJANGO_SETTINGS_MODULE': 'recipeshare.settings', 'AUTOCOMPLETE_WARM_ON_START': 'False'}
+        result = subprocess.run(
+            [sys.executable, '-c', 'import sys, recipeshare.asgi; print(sorted({"cloudinary", "PIL", "numpy"} & set(sys.modules)))'],
+            cwd = settings.BASE_DIR, env = env, capture_output = True, text = True, check = True,
+        )
+        self.assertEqual(result.stdout.strip(), '[]')
+
+    def test_gunicorn_config_reads_the_environment(self):
+        config = self.gunicorn_config(GUNICORN_WORKER_CLASS = 'gthread', WEB_CONCURRENCY = '3', GUNICORN_THREADS = '8', GUNICORN_PRELOAD = 'False')
+        self.assertEqual((config['worker_class'], config['wsgi_app']), ('gthread', 'recipeshare.wsgi:application'))
+        self.assertEqual((config['workers'], config['threads'], config['preload_app']), (3, 8, False))
+
+        with mock.patch.dict(os.environ):
+            for name in ('GUNICORN_WORKER_CLASS', 'WEB_CONCURRENCY', 'GUNICORN_PRELOAD', 'GUNICORN_MAX_REQUESTS', 'GUNICORN_MAX_REQUESTS_JITTER'):
+                os.environ.pop(name, None)
+            config = self.gunicorn_config()
+        self.assertEqual((config['worker_class'], config['wsgi_app']), ('uvicorn_worker.UvicornWorker', 'recipeshare.asgi:application'))
+        self.assertEqual(config['workers'], max(2, config['available_cpus']()))
+        self.assertEqual((config['threads'], config['preload_app']), (1, True))
+        self.assertEqual((config['max_requests'], config['max_requests_jitter']), (1000, 100))
+
+    def test_gunicorn_worker_counts(self):
+        default_workers = self.gunicorn_config()['default_workers']
+
+        self.assertEqual([default_workers('sync', cpus) for cpus in (1, 4)], [3, 9])
+        self.assertEqual([default_workers('asgi', cpus) for cpus in (1, 4)], [2, 4])
+        with self.assertRaises(ValueError):
+            self.gunicorn_config(GUNICORN_WORKER_CLASS = 'eventlet')
+
+
+@override_settings(SECURE_SSL_REDIRECT = False)
+class RequestMetricsTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.staff = User.objects.create(username = 'staffer', is_staff = True)
+        make_recipe(User.objects.create(username = 'author'))
+
+    def setUp(self):
+        cache.clear()
+        reset_request_stats()
+
+    def test_server_timing_only_for_staff(self):
+        anonymous = self.client.get(reverse('home_page'))
+        self.client.force_login(self.staff)
+        staff = self.client.get(reverse('home_page'))
+
+        self.assertNotIn('Server-Timing', anonymous)
+        self.assertRegex(staff['Server-Timing'], r'^db;dur=[\d.]+;desc="\d+ queries", tpl;dur=[\d.]+, total;dur=[\d.]+$')
+
+    async def test_queries_are_counted_under_asgi(self):
+        await self.async_client.aforce_login(self.staff)
+        response = await self.async_client.get(reverse('home_page'))
+
+        queries = int(re.search(r'desc="(\d+) queries"', response['Server-Timing']).group(1))
+        self.assertGreater(queries, 0)
+
+    def test_repeated_queries_are_flagged(self):
+        def view(request):
+            for pk in range(6):
+                list(Recipe.objects.filter(pk = pk))
+            return HttpResponse('ok')
+
+        middleware = RequestMetricsMiddleware(view)
+        with self.assertLogs('recipeshare.requests', 'WARNING') as logs:
+            middleware(RequestFactory().get('/'))
+
+        self.assertIn('"n_plus_one"', logs.output[0])
+        self.assertIn('"times": 6', logs.output[0])
+        self.assertEqual(query_shape('WHERE id IN (%s, %s, %s)'), query_shape('WHERE id IN (%s)'))
+
+    def test_stats_endpoint_is_staff_only(self):
+        self.client.get(reverse('home_page'))
+        self.assertEqual(self.client.get(reverse('request_stats')).status_code, 302)
+
+        self.client.force_login(self.staff)
+        report = self.client.get(reverse('request_stats')).json()
+
+        self.assertEqual(report['views']['home_page']['requests'], 1)
+        self.assertGreater(report['views']['home_page']['avg_queries'], 0)
+
+
+class ConnectionPoolTests(TestCase):
+    def production_databases(self, **environ):
+        env = {
+            **os.environ,
+            'ENVIRONMENT': 'production',
+            'DATABASE_URL': 'postgres://app@db.example.com/recipeshare',
+            'DATABASE_REPLICA_URLS': 'postgres://app@replica.example.com/recipeshare',
+            **environ,
+        }
+        result = subprocess.run(
+            [sys.executable, '-c', 'import json; from recipeshare import settings; print(json.dumps(settings.DATABASES, default = str))'],
+            cwd = settings.BASE_DIR, env = env, capture_output = True, text = True, check = True,
+        )
+        return json.loads(result.stdout)
+
+    def test_persistent_connections_without_the_pool(self):
+        for database in self.production_databases().values():
+            self.assertEqual((database['CONN_MAX_AGE'], database['CONN_HEALTH_CHECKS']), (600, True))
+            self.assertNotIn('pool', database.get('OPTIONS', {}))
+
+    def test_pool_replaces_persistent_connections(self):
+        databases = self.production_databases(DATABASE_POOL = 'True', DATABASE_POOL_MAX_SIZE = '4', DATABASE_POOL_TIMEOUT = '2.5')
+
+        self.assertEqual(set(databases), {'default', 'replica_0'})
+        for database in databases.values():
+            self.assertEqual((database['CONN_MAX_AGE'], database['CONN_HEALTH_CHECKS']), (0, True))
+            self.assertEqual(database['OPTIONS']['pool'], {'min_size': 2, 'max_size': 4, 'timeout': 2.5, 'max_idle': 300.0, 'max_lifetime': 3600.0})
+
+    def test_pool_stats_are_summed_over_workers(self):
+        worker = {'pool_min': 2, 'pool_max': 8, 'pool_size': 3, 'requests_num': 10, 'requests_wait_ms': 40}
+        idle = {'pool_min': 2, 'pool_max': 8, 'pool_size': 2}
+
+        merged = merge_pool_stats([{'default': worker}, {'default': idle}])
+
+        self.assertEqual(merged['default'], {
+            'workers': 2, 'pool_min': 4, 'pool_max': 16, 'pool_size': 5, 'requests_num': 10, 'requests_wait_ms': 40, 'avg_wait_ms': 4.0,
+        })
+        # SQLite has no pool to report
+        self.assertEqual(pool_stats(), {})
+
+
+@override_settings(SECURE_SSL_REDIRECT = False)
+class CacheTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create(username = 'author')
+        cls.recipe = make_recipe(cls.author)
+
+    def setUp(self):
+        cache.clear()
+
+    def render_card(self, recipe):
+        template = Template('{% load recipe_cache %}{% cachedrecipe "card" recipe %}{{ recipe.title }} by {{ recipe.author.username }}{% endcachedrecipe %}')
+        return template.render(Context({'recipe': recipe}))
+
+    def test_version_bump_moves_the_key_away_from_cached_entries(self):
+        objects, other = [('recipe', self.recipe.pk)], [('recipe', self.recipe.pk + 1)]
+        key, content = get_fragment('card', objects)
+        self.assertIsNone(content)
+        set_fragment(key, 'cached')
+        set_fragment(get_fragment('card', other)[0], 'other')
+        self.assertEqual(get_fragment('card', objects), (key, 'cached'))
+
+        bump_version('recipe', self.recipe.pk)
+
+        new_key, content = get_fragment('card', objects)
+        self.assertNotEqual(new_key, key)
+        self.assertIsNone(content)
+        # other recipes keep their entries
+        self.assertEqual(get_fragment('card', other)[1], 'other')
+
+    def test_cachedrecipe_tag_renders_until_the_recipe_or_author_changes(self):
+        self.assertEqual(self.render_card(self.recipe), 'Matar Paneer by author')
+        self.recipe.title = 'Unsaved'
+        self.assertEqual(self.render_card(self.recipe), 'Matar Paneer by author')
+
+        self.recipe.title = 'Paneer Matar'
+        self.recipe.save()
+        self.assertEqual(self.render_card(self.recipe), 'Paneer Matar by author')
+
+        self.author.username = 'chef'
+        self.author.save()
+        self.assertEqual(self.render_card(Recipe.objects.get(pk = self.recipe.pk)), 'Paneer Matar by chef')
+
+    def test_cachedrecipes_batches_the_cards_of_a_page(self):
+        recipes = [self.recipe] + [make_recipe(User.objects.create(username = f'cook{i}'), title = f'Dal {i}') for i in range(4)]
+        template = Template(
+            '{% load recipe_cache %}{% cachedrecipes "card" recipes %}{% for recipe in recipes %}'
+            '{% cachedrecipe "card" recipe %}{{ recipe.title }};{% endcachedrecipe %}{% endfor %}{% endcachedrecipes %}'
+        )
+
+        def render():
+            # every call on the cache client is one round trip to a shared cache
+            with mock.patch('recipes.cache.cache', mock.Mock(wraps = cache)) as client:
+                content = template.render(Context({'recipes': recipes}))
+            return content, [name for name, _, _ in client.mock_calls]
+
+        expected = 'Matar Paneer;Dal 0;Dal 1;Dal 2;Dal 3;'
+        reset_cache_stats()
+        # the first renders also create the versions and counters
+        self.assertEqual(render()[0], expected)
+        self.assertEqual(render()[0], expected)
+        self.assertEqual(render(), (expected, ['get_many', 'get_many', 'incr']))
+
+        recipes[2].title = 'Dal Tadka'
+        recipes[2].save()
+        # the one changed card rendered again and stored along with any others in one set_many
+        self.assertEqual(render(), ('Matar Paneer;Dal 0;Dal Tadka;Dal 2;Dal 3;', ['get_many', 'get_many', 'incr', 'incr', 'set_many']))
+        self.assertEqual(cache_stats()['fragment'], {'hits': 14, 'misses': 6, 'hit_rate': 0.7})
+
+    def test_hit_and_miss_counters(self):
+        reset_cache_stats()
+        self.render_card(self.recipe)
+        self.render_card(self.recipe)
+        self.client.get(reverse('home_page'))
+        self.client.get(reverse('home_page'))
+        self.client.get(reverse('home_page'))
+
+        stats = cache_stats()
+        self.assertEqual(stats['page'], {'hits': 2, 'misses': 1, 'hit_rate': 0.667})
+        # the two renders, then the feed's card once: the page hits don't render it again
+        self.assertEqual(stats['fragment'], {'hits': 1, 'misses': 2, 'hit_rate': 0.333})
+
+        out = StringIO()
+        call_command('cache_stats', reset = True, stdout = out)
+        self.assertEqual(json.loads(out.getvalue())['page']['hits'], 2)
+        self.assertEqual(cache_stats()['page'], {'hits': 0, 'misses': 0, 'hit_rate': 0})
+
+
+class ImageDerivativeTests(TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        media = override_settings(MEDIA_ROOT = directory.name)
+        media.enable()
+        self.addCleanup(media.disable)
+        self.recipe = make_recipe(User.objects.create(username = 'author'), image = self.upload('recipe_images/dal.png', 1200, 800))
+
+    def upload(self, name, width, height):
+        from PIL import Image
+
+        buffer = BytesIO()
+        # transparent, the JPEG copies have to flatten it
+        Image.new('RGBA', (width, height), (200, 120, 40, 128)).save(buffer, 'PNG')
+        return default_storage.save(name, ContentFile(buffer.getvalue()))
+
+    def open_image(self, name):
+        from PIL import Image
+
+        with default_storage.open(name) as image_file:
+            image = Image.open(image_file)
+            image.load()
+        return image
+
+    def test_derivatives_are_resized_copies_in_both_formats(self):
+        variants = generate_derivatives(self.recipe.image, RECIPE_IMAGE_WIDTHS)
+
+        self.assertEqual((variants['source'], variants['width']), ('recipe_images/dal.png', 1200))
+        for extension, pil_format in (('webp', 'WEBP'), ('jpeg', 'JPEG')):
+            self.assertEqual(variants[extension], {str(width): f'recipe_images/dal_w{width}.{extension}' for width in RECIPE_IMAGE_WIDTHS})
+            for width, name in variants[extension].items():
+                image = self.open_image(name)
+                self.assertEqual((image.format, image.size), (pil_format, (int(width), round(int(width) * 2 / 3))))
+        self.assertEqual(self.open_image(variants['jpeg']['320']).mode, 'RGB')
+
+        # never upscaled: a small image gets one copy at its own width
+        small = Recipe(image = self.upload('recipe_images/small.png', 200, 100))
+        self.assertEqual(list(generate_derivatives(small.image, RECIPE_IMAGE_WIDTHS)['webp']), ['200'])
+
+    def test_responsive_image_tag_lists_every_width(self):
+        template = Template('{% load recipe_images %}{% responsive_image recipe.image recipe.image_variants "100vw" alt=recipe.title %}')
+        self.assertHTMLEqual(
+            template.render(Context({'recipe': self.recipe})),
+            '<img src="/media/recipe_images/dal.png" alt="Matar Paneer" class="" loading="lazy" decoding="async">',
+        )
+
+        self.recipe.image_variants = generate_derivatives(self.recipe.image, RECIPE_IMAGE_WIDTHS)
+        html = template.render(Context({'recipe': self.recipe}))
+
+        srcset = lambda extension: ', '.join(f'/media/recipe_images/dal_w{width}.{extension} {width}w' for width in RECIPE_IMAGE_WIDTHS)
+        self.assertHTMLEqual(html, (
+            '<picture>'
+            f'<source type="image/webp" srcset="{srcset("webp")}" sizes="100vw">'
+            f'<img src="/media/recipe_images/dal_w960.jpeg" srcset="{srcset("jpeg")}" sizes="100vw" '
+            'alt="Matar Paneer" class="" loading="lazy" decoding="async">'
+            '</picture>'
+        ))
+
+    def test_regenerate_command_fills_in_missing_derivatives(self):
+        self.assertEqual(self.recipe.image_variants, {})
+
+        out = StringIO()
+        call_command('regenerate_image_derivatives', stdout = out, stderr = StringIO())
+
+        self.recipe.refresh_from_db()
+        self.assertEqual(self.recipe.image_variants['source'], 'recipe_images/dal.png')
+        self.assertTrue(all(default_storage.exists(name) for name in self.recipe.image_variants['webp'].values()))
+        self.assertIn('Recipe.image: 1 with derivatives, 0 failed', out.getvalue())
+
+        # up to date, a second run leaves the files alone
+        with mock.patch('recipes.images.generate_derivatives') as generate:
+            call_command('regenerate_image_derivatives', stdout = StringIO())
+        generate.assert_not_called()
+
+
+@override_settings(SECURE_SSL_REDIRECT = False)
+class ConditionalGetTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create(username = 'author')
+        cls.reviewer = User.objects.create(username = 'reviewer')
+        cls.recipe = make_recipe(cls.author)
+
+    def setUp(self):
+        cache.clear()
+
+    def revalidate(self, url, etag):
+        return self.client.get(url, headers = {'If-None-Match': etag})
+
+    def test_unchanged_recipe_is_304_after_one_query(self):
+        url = reverse('recipe_detail', args = [self.recipe.pk])
+        first = self.client.get(url)
+
+        with self.assertNumQueries(1):
+            repeat = self.revalidate(url, first['ETag'])
+
+        self.assertEqual(repeat.status_code, 304)
+        self.assertEqual(repeat['ETag'], first['ETag'])
+        self.assertIn('Cookie', first['Vary'])
+        self.assertIn('no-cache', first['Cache-Control'])
+
+    def test_new_and_deleted_reviews_change_the_etag(self):
+        url = reverse('recipe_detail', args = [self.recipe.pk])
+        before = self.client.get(url)['ETag']
+
+        review = Review.objects.create(recipe = self.recipe, reviewer = self.reviewer, rating = 5, review = 'Great')
+        reviewed = self.revalidate(url, before)
+        review.delete()
+        deleted = self.revalidate(url, reviewed['ETag'])
+
+        self.assertEqual(reviewed.status_code, 200)
+        self.assertEqual(deleted.status_code, 200)
+        self.assertNotEqual(deleted['ETag'], reviewed['ETag'])
+
+    def test_author_profile_changes_change_the_etag(self):
+        url = reverse('recipe_detail', args = [self.recipe.pk])
+        before = self.client.get(url)['ETag']
+
+        self.author.bio = 'Home cook'
+        self.author.profile_pic = 'profile_pics/author.jpg'
+        self.author.save()
+        after = self.revalidate(url, before)
+
+        self.assertEqual(after.status_code, 200)
+        self.assertNotEqual(after['ETag'], before)
+
+    def test_logged_in_viewers_get_their_own_etag(self):
+        url = reverse('recipe_detail', args = [self.recipe.pk])
+        anonymous = self.client.get(url)['ETag']
+
+        self.client.force_login(self.reviewer)
+        logged_in = self.client.get(url)
+
+        self.assertNotEqual(logged_in['ETag'], anonymous)
+        self.assertIn('private', logged_in['Cache-Control'])
+        self.assertEqual(self.revalidate(url, anonymous).status_code, 200)
+
+    def test_public_profile_changes_with_its_recipes(self):
+        url = reverse('public_profile', args = [self.author.username])
+        before = self.client.get(url)['ETag']
+
+        # the user's pk by username, no aggregate over the author's recipes
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(self.revalidate(url, before).status_code, 304)
+        self.assertEqual(len(queries), 1)
+        self.assertNotIn('recipes_recipe', queries[0]['sql'])
+
+        recipe = make_recipe(self.author, title = 'Dal Makhani')
+        created = self.revalidate(url, before)
+        self.assertEqual(created.status_code, 200)
+
+        Review.objects.create(recipe = recipe, reviewer = self.reviewer, rating = 5)
+        reviewed = self.revalidate(url, created['ETag'])
+        self.assertEqual(reviewed.status_code, 200)
+
+        Recipe.objects.filter(pk = recipe.pk).update(rating_sum = 1)
+        call_command('recompute_ratings', stdout = StringIO())
+        self.assertEqual(self.revalidate(url, reviewed['ETag']).status_code, 200)
+        self.assertEqual(self.client.get(reverse('public_profile', args = ['nobody'])).status_code, 404)
+
+    def test_missing_recipe_is_still_404(self):
+        self.assertEqual(self.client.get(reverse('recipe_detail', args = [999])).status_code, 404)
+
+
+@override_settings(SECURE_SSL_REDIRECT = False, DATABASE_REPLICAS = ['replica_0'])
+class ReplicaRoutingTests(TransactionTestCase):
+    # TestCase wraps every test in a transaction, and the router keeps transactions on primary
+    def route(self, request, model = Recipe):
+        return read_from_replica(lambda request: ReplicaRouter().db_for_read(model))(request)
+
+    def test_reads_in_replica_views_go_to_a_replica(self):
+        request = RequestFactory().get('/')
+
+        self.assertEqual(self.route(request), 'replica_0')
+        self.assertIsNone(ReplicaRouter().db_for_read(Recipe))
+        self.assertEqual(ReplicaRouter().db_for_write(Recipe), 'default')
+
+    def test_pinned_browsers_sessions_and_transactions_stay_on_primary(self):
+        pinned = RequestFactory().get('/')
+        pinned.COOKIES[PIN_COOKIE] = '1'
+        request = RequestFactory().get('/')
+
+        self.assertIsNone(self.route(pinned))
+        self.assertIsNone(self.route(request, Session))
+        with transaction.atomic():
+            self.assertIsNone(self.route(request))
+
+    @override_settings(DATABASE_REPLICAS = [])
+    def test_no_replicas_means_no_routing(self):
+        self.assertIsNone(self.route(RequestFactory().get('/')))
+
+    def test_writes_pin_the_browser_to_primary(self):
+        author = User.objects.create(username = 'author')
+        reviewer = User.objects.create(username = 'reviewer')
+        recipe = make_recipe(author)
+        self.client.force_login(reviewer)
+
+        response = self.client.post(reverse('add_review', args = [recipe.pk]), {'rating': 5, 'review': 'Great'})
+        page = self.client.get(reverse('home_page'))
+
+        self.assertEqual(response.cookies[PIN_COOKIE]['max-age'], 15)
+        self.assertNotIn(PIN_COOKIE, page.cookies)
+
+
+@override_settings(SECURE_SSL_REDIRECT = False)
+class ApiTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create(username = 'author')
+        cls.reviewer = User.objects.create(username = 'reviewer')
+        cls.recipes = [make_recipe(cls.author, title = f'Recipe {i}') for i in range(5)]
+
+    def post_json(self, url, data):
+        return self.client.post(url, data, content_type = 'application/json')
+
+    def test_sparse_fields_and_bulk_ids_in_one_query(self):
+        wanted = [self.recipes[3].pk, self.recipes[0].pk, 999]
+        with self.assertNumQueries(1):
+            response = self.client.get(reverse('api_recipes'), {'ids': ','.join(map(str, wanted)), 'fields': 'id,title,rating_avg'})
+
+        self.assertEqual(response.json()['results'], [
+            {'id': self.recipes[3].pk, 'title': 'Recipe 3', 'rating_avg': 0.0},
+            {'id': self.recipes[0].pk, 'title': 'Recipe 0', 'rating_avg': 0.0},
+        ])
+        self.assertEqual(self.client.get(reverse('api_recipes'), {'fields': 'password'}).status_code, 400)
+
+    def test_cursor_pages_through_recipes(self):
+        first = self.client.get(reverse('api_recipes'), {'limit': 3, 'fields': 'id'}).json()
+        second = self.client.get(reverse('api_recipes'), {'limit': 3, 'fields': 'id', 'cursor': first['next']}).json()
+
+        newest_first = [recipe.pk for recipe in reversed(self.recipes)]
+        self.assertEqual([row['id'] for row in first['results'] + second['results']], newest_first)
+        self.assertIsNone(second['next'])
+
+    def test_reviews_are_created_once_and_update_the_rating(self):
+        url = reverse('api_recipe_reviews', args = [self.recipes[0].pk])
+        self.assertEqual(self.post_json(url, {'rating': 4}).status_code, 401)
+
+        self.client.force_login(self.reviewer)
+        created = self.post_json(url, {'rating': 4, 'review': 'Tasty'})
+        duplicate = self.post_json(url, {'rating': 5})
+
+        self.assertEqual(created.status_code, 201)
+        self.assertEqual(created.json()['reviewer'], 'reviewer')
+        self.assertEqual(duplicate.status_code, 409)
+        self.assertEqual(self.client.get(reverse('api_recipe', args = [self.recipes[0].pk]), {'fields': 'rating_avg'}).json(), {'rating_avg': 4.0})
+
+    def test_only_the_author_can_edit(self):
+        url = reverse('api_recipe', args = [self.recipes[0].pk])
+        self.client.force_login(self.reviewer)
+        self.assertEqual(self.client.patch(url, {'title': 'Mine now'}, content_type = 'application/json').status_code, 403)
+
+        self.client.force_login(self.author)
+        response = self.client.patch(url, {'title': 'Matar Paneer'}, content_type = 'application/json')
+
+        self.assertEqual(response.json()['title'], 'Matar Paneer')
+        self.assertEqual(self.client.delete(url).status_code, 204)
+        self.assertEqual(self.client.get(url).status_code, 404)
+
+    def test_multipart_patch_reads_the_form_fields(self):
+        url = reverse('api_recipe', args = [self.recipes[1].pk])
+        self.client.force_login(self.author)
+
+        body = encode_multipart(BOUNDARY, {'title': 'Palak Paneer', 'estimated_prep_time': '40 mins'})
+        response = self.client.patch(url, body, content_type = MULTIPART_CONTENT)
+
+        self.assertEqual(response.status_code, 200)
+        self.recipes[1].refresh_from_db()
+        self.assertEqual((self.recipes[1].title, self.recipes[1].estimated_prep_time), ('Palak Paneer', '40 mins'))
+        malformed = self.client.patch(url, b'--nope', content_type = 'multipart/form-data')
+        self.assertEqual(malformed.status_code, 400)
+
+
+@override_settings(SECURE_SSL_REDIRECT = False)
+class AsyncViewTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create(username = 'author')
+        cls.reviewer = User.objects.create(username = 'reviewer')
+        cls.recipe = make_recipe(cls.author)
+        Review.objects.create(recipe = cls.recipe, reviewer = cls.reviewer, rating = 5, review = 'Lovely')
+
+    def test_read_views_stay_async_through_their_decorators(self):
+        for view in (views.homeView, views.recipeDetailView, api.recipesApi, api.recipeApi, api.recipeReviewsApi, api.profileApi, api.ownProfileApi):
+            self.assertTrue(iscoroutinefunction(view), view.__name__)
+
+    async def test_feed_and_detail_under_asgi(self):
+        feed = await self.async_client.get(reverse('home_page'))
+        detail = await self.async_client.get(reverse('recipe_detail', args = [self.recipe.pk]))
+
+        self.assertContains(feed, 'Matar Paneer')
+        self.assertContains(detail, 'Lovely')
+        self.assertContains(detail, 'reviewer')
+        revalidated = await self.async_client.get(reverse('recipe_detail', args = [self.recipe.pk]), headers = {'If-None-Match': detail['ETag']})
+        self.assertEqual(revalidated.status_code, 304)
+
+    async def test_api_reads_and_writes_under_asgi(self):
+        url = reverse('api_recipe_reviews', args = [self.recipe.pk])
+        self.assertEqual((await self.async_client.post(url, {'rating': 4}, content_type = 'application/json')).status_code, 401)
+
+        await self.async_client.aforce_login(self.author)
+        own = await self.async_client.post(url, {'rating': 4}, content_type = 'application/json')
+        profile = await self.async_client.get(reverse('api_own_profile'), {'fields': 'username,recipe_count'})
+        reviews = await self.async_client.get(url, {'fields': 'reviewer,rating'})
+
+        self.assertEqual(own.status_code, 403)
+        self.assertEqual(profile.json(), {'username': 'author', 'recipe_count': 1})
+        self.assertEqual(reviews.json()['results'], [{'reviewer': 'reviewer', 'rating': 5}])
+
+
+class ImportExportTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create(username = 'author')
+        for i in range(5):
+            make_recipe(cls.author, title = f'Recipe {i}', ingredients_list = f'Paneer - {i}00gm\nPeas - 1 cup')
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory = directory.name
+
+    def run_command(self, *args, **options):
+        call_command(*args, stdout = StringIO(), stderr = StringIO(), **options)
+
+    def test_csv_round_trip_keeps_multiline_fields_and_parses_ingredients(self):
+        path = os.path.join(self.directory, 'recipes.csv')
+        self.run_command('export_recipes', path)
+        Recipe.objects.all().delete()
+
+        self.run_command('import_recipes', path, batch_size = 2)
+
+        self.assertEqual(sorted(Recipe.objects.values_list('title', flat = True)), [f'Recipe {i}' for i in range(5)])
+        recipe = Recipe.objects.get(title = 'Recipe 3')
+        self.assertEqual(recipe.ingredients_list, 'Paneer - 300gm\nPeas - 1 cup')
+        self.assertEqual(recipe.recipe_ingredients.count(), 2)
+
+    def test_resume_skips_records_already_imported(self):
+        path = os.path.join(self.directory, 'recipes.jsonl')
+        self.run_command('export_recipes', path)
+        with open(path, 'a') as export:
+            export.write('{"title": "Ghost", "author": "nobody", "ingredients_list": "x", "process": "y"}\n')
+        Recipe.objects.all().delete()
+        # an earlier run stopped after the first two records
+        write_checkpoint(os.path.abspath(path), {'records': 2, 'imported': 2, 'skipped': 0})
+
+        self.run_command('import_recipes', path, resume = True)
+
+        self.assertEqual(sorted(Recipe.objects.values_list('title', flat = True)), ['Recipe 2', 'Recipe 3', 'Recipe 4'])
+        self.assertEqual(read_checkpoint(os.path.abspath(path)), {'records': 6, 'imported': 5, 'skipped': 1, 'complete': True})
+        with self.assertRaises(CommandError):
+            self.run_command('import_recipes', path)
+        self.run_command('import_recipes', path, restart = True)
+        self.assertEqual(Recipe.objects.filter(title = 'Recipe 0').count(), 1)
+
+    def test_failed_batch_leaves_no_progress_behind(self):
+        path = os.path.join(self.directory, 'recipes.jsonl')
+        self.run_command('export_recipes', path)
+        Recipe.objects.all().delete()
+
+        with mock.patch('recipes.management.commands.import_recipes.create_rankings', side_effect = [None, RuntimeError('disk full')]):
+            with self.assertRaises(RuntimeError):
+                self.run_command('import_recipes', path, batch_size = 2)
+
+        # the second batch rolled back together with its checkpoint
+        self.assertEqual(sorted(Recipe.objects.values_list('title', flat = True)), ['Recipe 0', 'Recipe 1'])
+        self.assertEqual(read_checkpoint(os.path.abspath(path)), {'records': 2, 'imported': 2, 'skipped': 0})
+        self.run_command('import_recipes', path, batch_size = 2, resume = True)
+        self.assertEqual(sorted(Recipe.objects.values_list('title', flat = True)), [f'Recipe {i}' for i in range(5)])
+
+    def test_creation_dates_are_kept_and_authors_looked_up_per_batch(self):
+        Recipe.objects.filter(title = 'Recipe 1').update(created_at = timezone.now() - timedelta(days = 400))
+        dates = dict(Recipe.objects.values_list('title', 'created_at'))
+        path = os.path.join(self.directory, 'recipes.jsonl')
+        self.run_command('export_recipes', path)
+        with open(path, 'a') as export:
+            export.write('{"title": "Dated", "author": "author", "ingredients_list": "x", "process": "y", "created_at": "2020-01-02 03:04:05"}\n')
+            export.write('{"title": "Undated", "author": "author", "ingredients_list": "x", "process": "y", "created_at": "last week"}\n')
+        Recipe.objects.all().delete()
+        User.objects.bulk_create([User(username = f'reader{i}') for i in range(20)])
+
+        with CaptureQueriesContext(connection) as queries:
+            self.run_command('import_recipes', path, batch_size = 2)
+
+        imported = dict(Recipe.objects.values_list('title', 'created_at'))
+        self.assertEqual({title: imported[title] for title in dates}, dates)
+        self.assertEqual(imported['Dated'], timezone.make_aware(datetime(2020, 1, 2, 3, 4, 5)))
+        self.assertNotIn('Undated', imported)
+        user_queries = [query['sql'] for query in queries if 'FROM "accounts_user"' in query['sql']]
+        # three batches, then the authors whose profile pages changed
+        self.assertEqual(len(user_queries), 4)
+        self.assertTrue(all(' IN (' in sql for sql in user_queries))
@@ -0,0 +1,72 @@
+import csv
+import json
+import os
+import sys
+
+from recipes.models import ImportCheckpoint
+
+# columns of an export and of an import file, author is the username
+FIELDS = ['id', 'title', 'author', 'small_description', 'estimated_prep_time', 'ingredients_list', 'process', 'image', 'created_at']
+REQUIRED = ['title', 'author', 'ingredients_list', 'process']
+
+FORMATS = ('jsonl', 'csv')
+
+
+def guess_format(path, default = 'jsonl'):
+    extension = os.path.splitext(path)[1].lstrip('.').lower()
+    return extension if extension in FORMATS else default
+
+
+def open_text(path, mode):
+    if path == '-':
+        return sys.stdin if mode == 'r' else sys.stdout
+    # newline = '' so csv keeps the line breaks inside quoted ingredients lists
+    return open(path, mode, encoding = 'utf-8', newline = '')
+
+
+def read_records(stream, format):
+    """
+    Yield one dict per record, lazily, so a file of any size is read in
+    constant memory. Malformed JSON lines come out as ValueError instances
+    for the caller to count instead of aborting the whole import.
+    """
+    if format == 'csv':
+        yield from csv.DictReader(stream)
+        return
+    for line in stream:
+        if not line.strip():
+            continue
+        try:
+            record = json.loads(line)
+        except ValueError as error:
+            yield error
+            continue
+        yield record if isinstance(record, dict) else ValueError('not a JSON object')
+
+
+class RecordWriter:
+    def __init__(self, stream, format):
+        self.stream = stream
+        self.format = format
+        if format == 'csv':
+            self.writer = csv.writer(stream)
+            self.writer.writerow(FIELDS)
+
+    def write(self, values):
+        if self.format == 'csv':
+            self.writer.writerow(values)
+        else:
+            self.stream.write(json.dumps(dict(zip(FIELDS, values)), ensure_ascii = False, default = str) + '\n')
+
+
+def read_checkpoint(name):
+    return ImportCheckpoint.objects.filter(name = name).values_list('state', flat = True).first()
+
+
+def write_checkpoint(name, state):
+    # call it inside the batch's transaction: a crash loses the batch and its progress together
+    ImportCheckpoint.objects.update_or_create(name = name, defaults = {'state': state})
+
+
+def delete_checkpoint(name):
+    ImportCheckpoint.objects.filter(name = name).delete()
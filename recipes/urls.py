@@ -1,13 +1,21 @@
 from django.urls import path
-from recipes import views
+from recipes import api, views
 
 urlpatterns = [
     path('', views.homeView, name = 'home_page'),
     path('recipes/<int:recipe_id>/', views.recipeDetailView, name = 'recipe_detail'),
+    path('recipes/<int:recipe_id>/reviews/', views.recipeReviewsView, name = 'recipe_reviews'),
     path('recipes/<int:recipe_id>/review/', views.addReviewView, name = 'add_review'),
     path('recipes/<int:recipe_id>/review/delete/', views.deleteReviewView, name = 'delete_review'),
     
     path('recipes/create/', views.createRecipeView, name = 'create_recipe'),
     path('recipes/<int:recipe_id>/edit/', views.editRecipeView, name = 'edit_recipe'),
     path('recipes/<int:recipe_id>/delete/', views.deleteRecipeView, name = 'delete_recipe'),
+
+    path('api/recipes/', api.recipesApi, name = 'api_recipes'),
+    path('api/recipes/<int:recipe_id>/', api.recipeApi, name = 'api_recipe'),
+    path('api/recipes/<int:recipe_id>/reviews/', api.recipeReviewsApi, name = 'api_recipe_reviews'),
+    path('api/users/<str:username>/', api.profileApi, name = 'api_profile'),
+    path('api/profile/', api.ownProfileApi, name = 'api_own_profile'),
+    path('api/autocomplete/', api.autocompleteApi, name = 'api_autocomplete'),
 ]
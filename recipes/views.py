@@ -1,101 +1,149 @@
-from django.shortcuts import render, get_object_or_404, redirect
+from asgiref.sync import sync_to_async
+from django.shortcuts import render, get_object_or_404, aget_object_or_404, redirect
 from django.contrib.auth.decorators import login_required
-from django.db.models import Q
-from django.core.paginator import Paginator, EmptyPage, PageNotAnInteger
+from django.core.exceptions import PermissionDenied
+from django.db import transaction
+from django.db.models import Count, Max
 from django.contrib import messages
+from django.conf import settings
+from django.http import Http404
 
-from recipes.models import Recipe, Review
+from recipes.models import Recipe, Review, SimilarRecipe
+from recipes.cache import cache_page_for_anonymous, conditional_page, get_versions
 from recipes.forms import RecipeForm
-
-def homeView(request):
-    recipes = Recipe.objects.all()
+from recipes.pagination import CursorPaginator, approximate_count
+from recipes.rankings import SORTS, sort_recipes
+from recipes.reviews import delete_review, save_review
+from recipes.search import search_recipes
+from recipes.tasks import stage_upload
+from recipeshare.routers import read_from_replica
+
+@read_from_replica
+@cache_page_for_anonymous(lambda request: [('feed', 'all')])
+async def homeView(request):
+    recipes = Recipe.objects.feed()
 
     search_query = request.GET.get('search', '').strip()
+    # search results are always ordered by relevance
+    sort = '' if search_query else request.GET.get('sort', '')
     if search_query:
-        recipes = recipes.filter(
-            Q(title__icontains=search_query) | 
-            Q(ingredients_list__icontains=search_query)
-        )
-    
-    recipes = recipes.order_by('-created_at')
+        recipes = search_recipes(recipes, search_query)
     
-    paginator = Paginator(recipes, 9)
-    page_number = request.GET.get('page', 1)
-
-    try:
-        page_obj = paginator.get_page(page_number)
-    except PageNotAnInteger:
-        page_obj = paginator.get_page(1)
-    except EmptyPage:
-        page_obj = paginator.get_page(paginator.num_pages)
+    page_obj = await CursorPaginator(sort_recipes(recipes, sort), 9).aget_page(request.GET.get('cursor'))
 
     context = {
         'recipes': page_obj,
         'page_obj': page_obj,
-        'total_recipes': paginator.count,
+        'total_recipes': await sync_to_async(approximate_count)(recipes, f'feed:{search_query}'),
         'search_query': search_query,
+        'sort': sort if sort in SORTS else '',
     }
-    return render(request, 'recipes/home.html', context)
-
-def recipeDetailView(request, recipe_id):
-    recipe = get_object_or_404(Recipe, id = recipe_id)
-    reviews = recipe.reviews.all()
+    return await sync_to_async(render)(request, 'recipes/home.html', context)
+
+def recipeDetailObjects(request, recipe_id):
+    # the similar recipes panel is rewritten by jobs, not by edits of this recipe
+    return [('recipe', recipe_id), ('users', 'all'), ('similar', recipe_id), ('similar', 'all')]
+
+def recipeDetailState(request, recipe_id):
+    # a new or edited review moves the max, a deleted one changes the stored count.
+    # The page also shows the author's and reviewers' names and pictures: any user change moves ('users', 'all')
+    state = Recipe.objects.filter(id = recipe_id).annotate(last_review = Max('reviews__updated_at')).values_list(
+        'updated_at', 'rating_sum', 'rating_count', 'last_review'
+    ).first()
+    return state and (state, get_versions(('users', 'all'), ('similar', recipe_id), ('similar', 'all')))
+
+REVIEWS_PER_PAGE = 10
+
+def reviewStream(recipe_id, user):
+    # newest first off the (recipe, -created_at, -id) index, the reviewer joined in
+    reviews = Review.objects.filter(recipe_id = recipe_id).select_related('reviewer').only(
+        'review', 'rating', 'created_at', 'recipe_id', 'reviewer__username'
+    ).order_by('-created_at', '-id')
+    if user.is_authenticated:
+        # their own review is shown on its own, above the stream
+        reviews = reviews.exclude(reviewer = user)
+    return CursorPaginator(reviews, REVIEWS_PER_PAGE)
+
+async def ratingHistogram(recipe):
+    # one GROUP BY over the (recipe, rating) index
+    counts = {
+        row['rating']: row['count']
+        async for row in Review.objects.filter(recipe = recipe).values('rating').annotate(count = Count('id')).order_by()
+    }
+    total = sum(counts.values())
+    return [
+        {'stars': stars, 'count': counts.get(stars, 0), 'percent': round(counts.get(stars, 0) * 100 / total) if total else 0}
+        for stars in range(5, 0, -1)
+    ]
+
+@read_from_replica
+@conditional_page(recipeDetailState)
+@cache_page_for_anonymous(recipeDetailObjects)
+async def recipeDetailView(request, recipe_id):
+    recipe = await aget_object_or_404(Recipe, id = recipe_id)
+    user = await request.auser()
+    reviews = await reviewStream(recipe.pk, user).apage()
+    # the (recipe, reviewer) unique index
+    own_review = await Review.objects.filter(recipe = recipe, reviewer = user).afirst() if user.is_authenticated else None
+    # precomputed by recipes.similarity, one range of the (recipe, -score) index
+    similar_recipes = SimilarRecipe.objects.filter(recipe = recipe).select_related('similar').defer(
+        'similar__ingredients_list', 'similar__process'
+    ).order_by('-score')[:settings.SIMILAR_RECIPES_COUNT]
+    similar_recipes = [similar.similar async for similar in similar_recipes]
 
-    curr_user_reviewed = False
-    if request.user.is_authenticated:
-        curr_user_reviewed = reviews.filter(reviewer = request.user).exists()
-    
     context = {
         'recipe': recipe,
         'reviews': reviews,
-        'curr_user_reviewed': curr_user_reviewed,
+        'own_review': own_review,
+        'curr_user_reviewed': own_review is not None,
+        'rating_histogram': await ratingHistogram(recipe),
         'average_rating': recipe.average_rating(),
-        'total_reviews': reviews.count()
+        'total_reviews': recipe.total_reviews(),
+        'similar_recipes': similar_recipes,
     }
 
-    return render(request, 'recipes/recipe_detail.html', context)
+    return await sync_to_async(render)(request, 'recipes/recipe_detail.html', context)
+
+@read_from_replica
+@cache_page_for_anonymous(lambda request, recipe_id: [('recipe', recipe_id), ('users', 'all')])
+async def recipeReviewsView(request, recipe_id):
+    # "load more" on the detail page: the next page of reviews as an HTML fragment
+    user = await request.auser()
+    reviews = await reviewStream(recipe_id, user).aget_page(request.GET.get('cursor'))
+    return await sync_to_async(render)(request, 'recipes/review_page.html', {'recipe_id': recipe_id, 'reviews': reviews})
 
 @login_required
 def addReviewView(request, recipe_id):
-    recipe = get_object_or_404(Recipe, id = recipe_id)
-    
+    # create or edit, the form on the recipe page posts here either way
     if request.method == 'POST':
-        if request.user == recipe.author:
-            messages.error(request, 'You can not review your own recipe!')
-            return redirect('recipe_detail', recipe_id = recipe_id)
-    
-        if Review.objects.filter(recipe = recipe, reviewer = request.user).exists():
-            messages.error(request, "You've already reviewed for this recipe.Now you can either edit it or delete it.")
-            return redirect('recipe_detail', recipe_id = recipe_id)
-        
         rating = request.POST.get('rating')
-        review = request.POST.get('review', '').strip()
-
-        if not rating:
+        if rating not in ('1', '2', '3', '4', '5'):
             messages.error(request, 'Please select rating before submission!')
             return redirect('recipe_detail', recipe_id = recipe_id)
 
-        Review.objects.create(
-            review = review,
-            rating = rating,
-            reviewer = request.user,
-            recipe = recipe
-        )
-    
-        messages.success(request, 'Added Review Successfully!')
+        try:
+            created = save_review(recipe_id, request.user, rating, request.POST.get('review', '').strip())
+        except Recipe.DoesNotExist:
+            raise Http404
+        except PermissionDenied:
+            messages.error(request, 'You can not review your own recipe!')
+            return redirect('recipe_detail', recipe_id = recipe_id)
+
+        messages.success(request, 'Added Review Successfully!' if created else 'Updated Review Successfully!')
     
     return redirect('recipe_detail', recipe_id = recipe_id)
 
 
 @login_required
 def deleteReviewView(request, recipe_id):
-    recipe = get_object_or_404(Recipe, id = recipe_id)
-
     try:
-        review = Review.objects.get(recipe = recipe, reviewer = request.user)
-        review.delete()
+        deleted = delete_review(recipe_id, request.user)
+    except Recipe.DoesNotExist:
+        raise Http404
+
+    if deleted:
         messages.success(request, 'Review Deletd Successfully!')
-    except Review.DoesNotExist:
+    else:
         messages.error(request, 'Review not found!')
     
     return redirect('recipe_detail', recipe_id = recipe_id)
@@ -108,7 +156,12 @@ def createRecipeView(request):
         if recipe_form.is_valid():
             recipe = recipe_form.save(commit = False)
             recipe.author = request.user
-            recipe.save()
+            # the worker pushes the photo to storage, the recipe shows a placeholder until then
+            upload = recipe_form.cleaned_data['image']
+            recipe.image = ''
+            with transaction.atomic():
+                recipe.save()
+                stage_upload(recipe, 'image', upload)
 
             messages.success(request, 'Your Recipe has been successfully submitted. It will be published once it is verified.')#will add verification functionality later on when mvp is working
             return redirect('recipe_detail', recipe_id = recipe.id)
@@ -127,10 +180,20 @@ def editRecipeView(request, recipe_id):
         return redirect('recipe_detail', recipe_id = recipe_id)
     
     if request.method == 'POST':
+        current_image = recipe.image.name
         recipe_form = RecipeForm(request.POST, request.FILES, instance = recipe)
 
         if recipe_form.is_valid():
-            recipe_form.save()
+            recipe = recipe_form.save(commit = False)
+            with transaction.atomic():
+                if 'image' in recipe_form.changed_data:
+                    # keep showing the old photo until the worker has stored the new one
+                    upload = recipe_form.cleaned_data['image']
+                    recipe.image = current_image
+                    recipe.save()
+                    stage_upload(recipe, 'image', upload)
+                else:
+                    recipe.save()
             messages.success(request, 'Recipe Successfully Edited!')
             return redirect('recipe_detail', recipe_id = recipe_id)
     else:
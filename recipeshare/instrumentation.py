@@ -0,0 +1,341 @@
+import json
+import logging
+import os
+import re
+import socket
+import threading
+import time
+from collections import Counter
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.contrib.admin.views.decorators import staff_member_required
+from django.core.cache import cache
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+from django.db.backends.signals import connection_created
+from django.dispatch import receiver
+from django.http import JsonResponse
+from django.template.backends.django import DjangoTemplates, Template
+
+logger = logging.getLogger('recipeshare.requests')
+
+# upper bounds in ms, the last bucket catches everything slower
+BUCKETS = (5, 10, 25, 50, 100, 250, 500, 1000, 2500, float('inf'))
+WINDOW = 60
+WORKERS_KEY = 'perf:workers'
+# pool gauges go stale fast: a worker that hasn't flushed for a minute (idle or restarted) drops out
+POOL_STATS_TIMEOUT = 60
+
+current = ContextVar('request_metrics', default = None)
+
+
+class RequestMetrics:
+    def __init__(self):
+        self.queries = 0
+        self.db_time = 0.0
+        self.template_time = 0.0
+        self.shapes = Counter()
+
+
+# "IN (%s, %s, %s)" and "IN (%s)" are the same query shape
+IN_LIST = re.compile(r'IN \((?:%s, )*%s\)')
+
+
+def query_shape(sql):
+    return IN_LIST.sub('IN (...)', sql)
+
+
+def record_query(execute, sql, params, many, context):
+    metrics = current.get()
+    if metrics is None:
+        return execute(sql, params, many, context)
+    start = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        metrics.db_time += time.perf_counter() - start
+        metrics.queries += 1
+        metrics.shapes[query_shape(sql)] += 1
+
+
+def install_query_recorder(connection):
+    # for good, it does nothing outside a request. First in the list, so a
+    # `with connection.execute_wrapper()` around the connect still pops its own
+    if settings.REQUEST_METRICS and record_query not in connection.execute_wrappers:
+        connection.execute_wrappers.insert(0, record_query)
+
+
+@receiver(connection_created)
+def recordNewConnection(sender, connection, **kwargs):
+    # every thread has its own connections: under ASGI the ORM runs in
+    # sync_to_async's thread, which `current` follows but a wrapper on the
+    # event loop's connections never sees
+    install_query_recorder(connection)
+
+
+class TimedTemplate(Template):
+    def render(self, context = None, request = None):
+        metrics = current.get()
+        if metrics is None:
+            return super().render(context, request)
+        start = time.perf_counter()
+        try:
+            return super().render(context, request)
+        finally:
+            metrics.template_time += time.perf_counter() - start
+
+
+class TimedDjangoTemplates(DjangoTemplates):
+    """
+    The stock Django template backend, with top-level renders timed into the
+    current request's metrics. {% include %} and {% extends %} run inside the
+    top-level render, so nothing is counted twice.
+    """
+
+    def from_string(self, template_code):
+        return TimedTemplate(self.engine.from_string(template_code), self)
+
+    def get_template(self, template_name):
+        template = super().get_template(template_name)
+        return TimedTemplate(template.template, self)
+
+
+class RequestStats:
+    """
+    Per-process histograms, one set per minute, kept for the last hour. Every
+    few seconds the whole snapshot is written to the cache under this worker's
+    own key, so workers never race each other and a read merges all of them.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.windows = {}
+        self.last_flush = 0.0
+        self.worker = f'{socket.gethostname()}:{os.getpid()}'
+
+    def add(self, view, elapsed_ms, metrics, size, n_plus_one):
+        window = int(time.time()) // WINDOW * WINDOW
+        with self.lock:
+            views = self.windows.setdefault(window, {})
+            entry = views.get(view)
+            if entry is None:
+                entry = views[view] = {
+                    'count': 0, 'time_ms': 0.0, 'db_ms': 0.0, 'template_ms': 0.0,
+                    'queries': 0, 'bytes': 0, 'n_plus_one': 0, 'max_ms': 0.0,
+                    'buckets': [0] * len(BUCKETS),
+                }
+            entry['count'] += 1
+            entry['time_ms'] += elapsed_ms
+            entry['db_ms'] += metrics.db_time * 1000
+            entry['template_ms'] += metrics.template_time * 1000
+            entry['queries'] += metrics.queries
+            entry['bytes'] += size
+            entry['n_plus_one'] += bool(n_plus_one)
+            entry['max_ms'] = max(entry['max_ms'], elapsed_ms)
+            entry['buckets'][next(i for i, bound in enumerate(BUCKETS) if elapsed_ms <= bound)] += 1
+
+            if time.monotonic() - self.last_flush >= settings.REQUEST_METRICS_FLUSH_INTERVAL:
+                self.flush()
+
+    def flush(self):
+        oldest = int(time.time()) - settings.REQUEST_METRICS_RETENTION
+        self.windows = {window: views for window, views in self.windows.items() if window >= oldest}
+        self.last_flush = time.monotonic()
+        cache.set(f'perf:worker:{self.worker}', self.windows, settings.REQUEST_METRICS_RETENTION)
+        pools = pool_stats()
+        if pools:
+            cache.set(f'perf:pools:{self.worker}', pools, POOL_STATS_TIMEOUT)
+        workers = cache.get(WORKERS_KEY) or []
+        if self.worker not in workers:
+            cache.set(WORKERS_KEY, workers[-99:] + [self.worker], None)
+
+
+stats = RequestStats()
+
+
+def pool_stats():
+    # this process's psycopg pools (DATABASE_POOL): sizes right now, counters since each pool was created
+    pools = {}
+    for alias in connections:
+        connection = connections[alias]
+        if connection.vendor == 'postgresql' and connection.settings_dict['OPTIONS'].get('pool'):
+            pools[alias] = connection.pool.get_stats()
+    return pools
+
+
+def merge_pool_stats(snapshots):
+    # summed over workers: pool_size is every connection the site holds to that database
+    merged = {}
+    for pools in snapshots:
+        for alias, counters in pools.items():
+            total = merged.setdefault(alias, {'workers': 0})
+            total['workers'] += 1
+            for key, value in counters.items():
+                total[key] = total.get(key, 0) + value
+    for total in merged.values():
+        requests = total.get('requests_num', 0)
+        total['avg_wait_ms'] = round(total.get('requests_wait_ms', 0) / requests, 2) if requests else 0.0
+    return merged
+
+
+def estimate_percentile(buckets, count, pct, slowest):
+    # the upper bound of the bucket the percentile falls in, never above the slowest request seen
+    target = pct / 100 * count
+    seen = 0
+    for bound, hits in zip(BUCKETS, buckets):
+        seen += hits
+        if seen >= target:
+            return round(min(bound, slowest), 2)
+    return round(slowest, 2)
+
+
+def request_stats(minutes = 15):
+    with stats.lock:
+        if stats.windows:
+            stats.flush()
+    since = int(time.time()) - minutes * 60
+    workers = cache.get(WORKERS_KEY) or []
+    snapshots = cache.get_many([f'perf:worker:{worker}' for worker in workers])
+
+    merged = {}
+    for windows in snapshots.values():
+        for window, views in windows.items():
+            if window < since:
+                continue
+            for view, entry in views.items():
+                total = merged.setdefault(view, {key: 0 for key in entry if key != 'buckets'} | {'buckets': [0] * len(BUCKETS)})
+                for key, value in entry.items():
+                    if key == 'buckets':
+                        total['buckets'] = [a + b for a, b in zip(total['buckets'], value)]
+                    elif key == 'max_ms':
+                        total['max_ms'] = max(total['max_ms'], value)
+                    else:
+                        total[key] += value
+
+    report = {}
+    for view, total in sorted(merged.items(), key = lambda item: -item[1]['time_ms']):
+        count = total['count']
+        report[view] = {
+            'requests': count,
+            'avg_ms': round(total['time_ms'] / count, 2),
+            'p50_ms': estimate_percentile(total['buckets'], count, 50, total['max_ms']),
+            'p95_ms': estimate_percentile(total['buckets'], count, 95, total['max_ms']),
+            'p99_ms': estimate_percentile(total['buckets'], count, 99, total['max_ms']),
+            'max_ms': round(total['max_ms'], 2),
+            'avg_queries': round(total['queries'] / count, 2),
+            'avg_db_ms': round(total['db_ms'] / count, 2),
+            'avg_template_ms': round(total['template_ms'] / count, 2),
+            'avg_bytes': round(total['bytes'] / count),
+            'n_plus_one_requests': total['n_plus_one'],
+            'histogram': {('inf' if bound == float('inf') else f'le_{bound}ms'): hits for bound, hits in zip(BUCKETS, total['buckets'])},
+        }
+    pools = cache.get_many([f'perf:pools:{worker}' for worker in workers])
+    return {'minutes': minutes, 'workers': len(snapshots), 'views': report, 'database_pools': merge_pool_stats(pools.values())}
+
+
+def reset_request_stats():
+    with stats.lock:
+        stats.windows = {}
+    workers = cache.get(WORKERS_KEY) or []
+    cache.delete_many([f'perf:{kind}:{worker}' for worker in workers for kind in ('worker', 'pools')] + [WORKERS_KEY])
+
+
+class RequestMetricsMiddleware:
+    """
+    Wall time, query count, DB time, template time and response size for every
+    request. They go out as a Server-Timing header (DEBUG or staff only), one
+    JSON log line on the recipeshare.requests logger and the rolling
+    histograms behind `request_stats`. Repeated identical SQL is flagged as a
+    likely N+1.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if not settings.REQUEST_METRICS:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def wrap_queries(self):
+        # connections opened before this module was imported never sent connection_created
+        for alias in connections:
+            install_query_recorder(connections[alias])
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        metrics = RequestMetrics()
+        token = current.set(metrics)
+        start = time.perf_counter()
+        try:
+            self.wrap_queries()
+            response = self.get_response(request)
+        finally:
+            current.reset(token)
+        return self.record(request, response, metrics, start, getattr(request, 'user', None))
+
+    async def __acall__(self, request):
+        metrics = RequestMetrics()
+        token = current.set(metrics)
+        start = time.perf_counter()
+        try:
+            self.wrap_queries()
+            response = await self.get_response(request)
+        finally:
+            current.reset(token)
+        # request.user would hit the session table synchronously here
+        user = await request.auser() if hasattr(request, 'auser') else None
+        return self.record(request, response, metrics, start, user)
+
+    def record(self, request, response, metrics, start, user):
+        elapsed_ms = (time.perf_counter() - start) * 1000
+
+        match = request.resolver_match
+        view = match.view_name if match else 'unresolved'
+        size = 0 if response.streaming else len(response.content)
+        repeated = {shape: times for shape, times in metrics.shapes.items() if times >= settings.REQUEST_METRICS_N_PLUS_ONE}
+
+        stats.add(view, elapsed_ms, metrics, size, repeated)
+
+        if repeated:
+            logger.warning(json.dumps({
+                'event': 'n_plus_one',
+                'view': view,
+                'path': request.path,
+                'queries': [{'sql': shape[:300], 'times': times} for shape, times in repeated.items()],
+            }))
+        if logger.isEnabledFor(logging.INFO):
+            logger.info(json.dumps({
+                'event': 'request',
+                'view': view,
+                'method': request.method,
+                'path': request.path,
+                'status': response.status_code,
+                'duration_ms': round(elapsed_ms, 2),
+                'queries': metrics.queries,
+                'db_ms': round(metrics.db_time * 1000, 2),
+                'template_ms': round(metrics.template_time * 1000, 2),
+                'bytes': size,
+            }))
+
+        if settings.DEBUG or (user is not None and user.is_staff):
+            response['Server-Timing'] = ', '.join([
+                f'db;dur={metrics.db_time * 1000:.1f};desc="{metrics.queries} queries"',
+                f'tpl;dur={metrics.template_time * 1000:.1f}',
+                f'total;dur={elapsed_ms:.1f}',
+            ])
+        return response
+
+
+@staff_member_required
+def requestStatsView(request):
+    try:
+        minutes = max(1, min(60, int(request.GET.get('minutes', 15))))
+    except ValueError:
+        minutes = 15
+    return JsonResponse(request_stats(minutes))
@@ -0,0 +1,105 @@
+import random
+from contextvars import ContextVar
+from functools import wraps
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db import connections
+
+reading_from_replica = ContextVar('reading_from_replica', default = False)
+
+PIN_COOKIE = 'pin_primary'
+
+# sessions are written on login and read on the next request, a lagging replica would log people out
+PRIMARY_ONLY_APPS = {'sessions'}
+
+
+class ReplicaRouter:
+    """
+    Reads inside @read_from_replica views go to a random DATABASE_REPLICAS
+    alias, everything else (writes, transactions, the job worker, management
+    commands) stays on default. With no replicas configured it never routes.
+    """
+
+    def db_for_read(self, model, **hints):
+        if not settings.DATABASE_REPLICAS or not reading_from_replica.get():
+            return None
+        if model._meta.app_label in PRIMARY_ONLY_APPS or connections['default'].in_atomic_block:
+            return None
+        return random.choice(settings.DATABASE_REPLICAS)
+
+    def db_for_write(self, model, **hints):
+        return 'default'
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # every alias holds the same data
+        return True
+
+    def allow_migrate(self, db, app_label, model_name = None, **hints):
+        return db not in settings.DATABASE_REPLICAS
+
+
+def read_from_replica(view):
+    """
+    Let a read-only view query the replicas, unless this browser wrote
+    something in the last REPLICA_PIN_SECONDS and could see stale data.
+    The flag is a context variable, so it reaches the async ORM's threads too.
+    """
+    def use_replica(request):
+        return request.method in ('GET', 'HEAD') and PIN_COOKIE not in request.COOKIES
+
+    if iscoroutinefunction(view):
+        @wraps(view)
+        async def asyncWrapper(request, *args, **kwargs):
+            if not use_replica(request):
+                return await view(request, *args, **kwargs)
+            token = reading_from_replica.set(True)
+            try:
+                return await view(request, *args, **kwargs)
+            finally:
+                reading_from_replica.reset(token)
+        return asyncWrapper
+
+    @wraps(view)
+    def wrapper(request, *args, **kwargs):
+        if not use_replica(request):
+            return view(request, *args, **kwargs)
+        token = reading_from_replica.set(True)
+        try:
+            return view(request, *args, **kwargs)
+        finally:
+            reading_from_replica.reset(token)
+    return wrapper
+
+
+class PrimaryPinMiddleware:
+    """
+    After any write request, pin that browser to the primary for a few seconds
+    so it reads its own review or recipe edit even while replicas catch up.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        return self.pin(request, self.get_response(request))
+
+    async def __acall__(self, request):
+        return self.pin(request, await self.get_response(request))
+
+    def pin(self, request, response):
+        if settings.DATABASE_REPLICAS and request.method not in ('GET', 'HEAD', 'OPTIONS', 'TRACE'):
+            response.set_cookie(
+                PIN_COOKIE, '1',
+                max_age = settings.REPLICA_PIN_SECONDS,
+                secure = settings.SESSION_COOKIE_SECURE,
+                httponly = True,
+                samesite = 'Lax',
+            )
+        return response
@@ -15,9 +15,6 @@ import os
 import sys
 from dotenv import load_dotenv
 import dj_database_url
-import cloudinary
-import cloudinary.uploader
-import cloudinary.api	
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
 
@@ -35,13 +32,6 @@ ALLOWED_HOSTS = os.environ.get('ALLOWED_HOSTS', '').split(',') if os.environ.get
 
 # Application definition
 
-cloudinary.config(
-    cloud_name=os.environ.get('CLOUDINARY_CLOUD_NAME'),
-    api_key=os.environ.get('CLOUDINARY_API_KEY'),
-    api_secret=os.environ.get('CLOUDINARY_API_SECRET'),
-    secure=True
-)
-
 INSTALLED_APPS = [
     'django.contrib.admin',
     'django.contrib.auth',
@@ -49,19 +39,21 @@ INSTALLED_APPS = [
     'django.contrib.sessions',
     'django.contrib.messages',
     'django.contrib.staticfiles',
-    'cloudinary',
     'accounts',
     'recipes',
+    'jobs',
 ]
 
 MIDDLEWARE = [
+    'recipeshare.instrumentation.RequestMetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
-    'whitenoise.middleware.WhiteNoiseMiddleware',
+    'recipeshare.staticfiles.WhiteNoiseMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
+    'recipeshare.routers.PrimaryPinMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
 
@@ -69,7 +61,7 @@ ROOT_URLCONF = 'recipeshare.urls'
 
 TEMPLATES = [
     {
-        'BACKEND': 'django.template.backends.django.DjangoTemplates',
+        'BACKEND': 'recipeshare.instrumentation.TimedDjangoTemplates',
         'DIRS': [BASE_DIR / 'templates'],
         'APP_DIRS': True,
         'OPTIONS': {
@@ -102,9 +94,145 @@ else:
         'default': {
             'ENGINE': 'django.db.backends.sqlite3',
             'NAME': BASE_DIR / 'db.sqlite3',
+            # a file, not memory: connections to an in-memory database lock whole
+            # tables without waiting, which the concurrent review tests need
+            'TEST': {'NAME': BASE_DIR / 'test_db.sqlite3'},
+        }
+    }
+
+# Read replicas
+# DATABASE_REPLICA_URLS is a comma separated list of database URLs. Feed, recipe
+# and profile pages read from them, see recipeshare/routers.py. Unset, every
+# query goes to default.
+
+DATABASE_REPLICAS = []
+for index, url in enumerate(url.strip() for url in os.environ.get('DATABASE_REPLICA_URLS', '').split(',') if url.strip()):
+    alias = f'replica_{index}'
+    DATABASES[alias] = dj_database_url.parse(url, conn_max_age = 600, conn_health_checks = True)
+    DATABASES[alias]['TEST'] = {'MIRROR': 'default'}
+    DATABASE_REPLICAS.append(alias)
+
+# Connection pooling
+# DATABASE_POOL=True gives each process a psycopg 3 pool per PostgreSQL database
+# (Django's OPTIONS['pool']) instead of a persistent connection per thread. A
+# request borrows a connection and gives it back, and one process never holds
+# more than DATABASE_POOL_MAX_SIZE. With health checks on, the pool tests a
+# connection before handing it out.
+
+DATABASE_POOL = os.environ.get('DATABASE_POOL', 'False') == 'True'
+DATABASE_POOL_OPTIONS = {
+    'min_size': int(os.environ.get('DATABASE_POOL_MIN_SIZE', 2)),
+    'max_size': int(os.environ.get('DATABASE_POOL_MAX_SIZE', 8)),
+    # seconds a request waits for a free connection before PoolTimeout
+    'timeout': float(os.environ.get('DATABASE_POOL_TIMEOUT', 10)),
+    'max_idle': float(os.environ.get('DATABASE_POOL_MAX_IDLE', 300)),
+    'max_lifetime': float(os.environ.get('DATABASE_POOL_MAX_LIFETIME', 3600)),
+}
+if DATABASE_POOL:
+    for database in DATABASES.values():
+        if database['ENGINE'] == 'django.db.backends.postgresql':
+            # connections go back to the pool after every request, none persist
+            database['CONN_MAX_AGE'] = 0
+            database['CONN_HEALTH_CHECKS'] = os.environ.get('DATABASE_POOL_HEALTH_CHECKS', 'True') == 'True'
+            database.setdefault('OPTIONS', {})['pool'] = DATABASE_POOL_OPTIONS
+
+DATABASE_ROUTERS = ['recipeshare.routers.ReplicaRouter']
+REPLICA_PIN_SECONDS = int(os.environ.get('REPLICA_PIN_SECONDS', 15))
+
+# Cache
+# Redis when REDIS_URL is set (needs the redis package), a shared directory
+# when CACHE_DIR is set, otherwise per-process memory.
+
+if os.environ.get('REDIS_URL'):
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': os.environ.get('REDIS_URL'),
+        }
+    }
+elif os.environ.get('CACHE_DIR'):
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+            'LOCATION': os.environ.get('CACHE_DIR'),
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+            'LOCATION': 'recipeshare',
         }
     }
 
+# per-process memory can't be invalidated from another worker, the session and
+# user caches below are only turned on by default when every worker shares one
+SHARED_CACHE = bool(os.environ.get('REDIS_URL') or os.environ.get('CACHE_DIR'))
+
+CACHE_PAGE_TIMEOUT = int(os.environ.get('CACHE_PAGE_TIMEOUT', 600))
+CACHE_FRAGMENT_TIMEOUT = int(os.environ.get('CACHE_FRAGMENT_TIMEOUT', 3600))
+
+# Feed leaderboards (?sort=top / ?sort=trending), see recipes/rankings.py.
+# A recipe's score counts RANKING_PRIOR_WEIGHT extra reviews at the site
+# average, a review's trending weight halves every RANKING_TRENDING_HALF_LIFE
+# hours and refresh_rankings ignores reviews older than RANKING_TRENDING_WINDOW days.
+
+RANKING_PRIOR_MEAN = float(os.environ.get('RANKING_PRIOR_MEAN', 3.0))
+RANKING_PRIOR_WEIGHT = int(os.environ.get('RANKING_PRIOR_WEIGHT', 5))
+RANKING_TRENDING_HALF_LIFE = float(os.environ.get('RANKING_TRENDING_HALF_LIFE', 72))
+RANKING_TRENDING_WINDOW = int(os.environ.get('RANKING_TRENDING_WINDOW', 30))
+
+# Search box typeahead, see recipes/autocomplete.py. Each worker builds its
+# prefix index at startup and rebuilds it at most every
+# AUTOCOMPLETE_REBUILD_INTERVAL seconds after another worker changed recipes.
+
+AUTOCOMPLETE_WARM_ON_START = os.environ.get('AUTOCOMPLETE_WARM_ON_START', 'True') == 'True'
+AUTOCOMPLETE_BACKGROUND_BUILD = True
+AUTOCOMPLETE_CHECK_INTERVAL = float(os.environ.get('AUTOCOMPLETE_CHECK_INTERVAL', 1))
+AUTOCOMPLETE_REBUILD_INTERVAL = float(os.environ.get('AUTOCOMPLETE_REBUILD_INTERVAL', 30))
+
+# "You may also like" on recipe pages, see recipes/similarity.py. refresh_similar_recipes
+# scores SIMILAR_RECIPES_CHUNK_SIZE recipes at a time against all of them, each
+# chunk holding a CHUNK_SIZE x recipes float32 block in memory.
+
+SIMILAR_RECIPES_COUNT = int(os.environ.get('SIMILAR_RECIPES_COUNT', 6))
+SIMILAR_RECIPES_CHUNK_SIZE = int(os.environ.get('SIMILAR_RECIPES_CHUNK_SIZE', 256))
+# seconds the jobs worker scores edits against its cached matrix before rebuilding it
+SIMILAR_RECIPES_MATRIX_TIMEOUT = int(os.environ.get('SIMILAR_RECIPES_MATRIX_TIMEOUT', 3600))
+
+# Background jobs (python manage.py run_jobs)
+
+JOBS_RUN_INLINE = os.environ.get('JOBS_RUN_INLINE', 'False') == 'True'
+JOBS_MAX_ATTEMPTS = int(os.environ.get('JOBS_MAX_ATTEMPTS', 5))
+JOBS_RETRY_BACKOFF = int(os.environ.get('JOBS_RETRY_BACKOFF', 10))
+JOBS_VISIBILITY_TIMEOUT = int(os.environ.get('JOBS_VISIBILITY_TIMEOUT', 300))
+# seconds a finished job's row is kept before the worker deletes it
+JOBS_KEEP_DONE = int(os.environ.get('JOBS_KEEP_DONE', 7 * 24 * 3600))
+
+# Request metrics
+# Timing, query counts and N+1 warnings per request, see recipeshare/instrumentation.py
+
+REQUEST_METRICS = os.environ.get('REQUEST_METRICS', 'True') == 'True'
+REQUEST_METRICS_FLUSH_INTERVAL = int(os.environ.get('REQUEST_METRICS_FLUSH_INTERVAL', 10))
+REQUEST_METRICS_RETENTION = int(os.environ.get('REQUEST_METRICS_RETENTION', 3600))
+REQUEST_METRICS_N_PLUS_ONE = int(os.environ.get('REQUEST_METRICS_N_PLUS_ONE', 5))
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'console': {'class': 'logging.StreamHandler'},
+    },
+    'loggers': {
+        'recipeshare.requests': {
+            'handlers': ['console'],
+            # one JSON line per request in production, only N+1 warnings locally
+            'level': os.environ.get('REQUEST_METRICS_LOG_LEVEL', 'INFO' if IS_PRODUCTION else 'WARNING'),
+            'propagate': False,
+        },
+    },
+}
+
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
 
@@ -167,6 +295,15 @@ else:
 
 DEFAULT_FILE_STORAGE = 'cloudinary_storage.storage.MediaCloudinaryStorage' if IS_PRODUCTION else 'django.core.files.storage.FileSystemStorage'
 
+# read by django-cloudinary-storage, which imports the Cloudinary SDK the first
+# time a media file is saved or linked rather than at startup
+CLOUDINARY_STORAGE = {
+    'CLOUD_NAME': os.environ.get('CLOUDINARY_CLOUD_NAME'),
+    'API_KEY': os.environ.get('CLOUDINARY_API_KEY'),
+    'API_SECRET': os.environ.get('CLOUDINARY_API_SECRET'),
+    'SECURE': True,
+}
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/5.2/ref/settings/#default-auto-field
 
@@ -174,6 +311,24 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
 AUTH_USER_MODEL = 'accounts.User'
 
+# Sessions and the logged-in user
+# SESSION_BACKEND is one of db, cached_db (read from the cache, written through
+# to the database), cache or signed_cookies (nothing stored server side, so a
+# logout can't revoke a copied cookie). Expired database sessions are removed by
+# `manage.py purge_sessions`. The logged-in user is kept in the cache for
+# AUTH_USER_CACHE_TIMEOUT seconds, 0 reads it from the database every request.
+
+SESSION_ENGINES = {
+    'db': 'django.contrib.sessions.backends.db',
+    'cached_db': 'django.contrib.sessions.backends.cached_db',
+    'cache': 'django.contrib.sessions.backends.cache',
+    'signed_cookies': 'django.contrib.sessions.backends.signed_cookies',
+}
+SESSION_ENGINE = SESSION_ENGINES[os.environ.get('SESSION_BACKEND', 'cached_db' if SHARED_CACHE else 'db')]
+
+AUTHENTICATION_BACKENDS = ['accounts.backends.CachedModelBackend']
+AUTH_USER_CACHE_TIMEOUT = int(os.environ.get('AUTH_USER_CACHE_TIMEOUT', 300 if SHARED_CACHE else 0))
+
 LOGIN_URL = 'login'
 LOGIN_REDIRECT_URL = 'home_page'
 LOGOUT_REDIRECT_URL = 'home_page'
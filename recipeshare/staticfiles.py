@@ -0,0 +1,46 @@
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.http import HttpResponse
+from whitenoise.middleware import WhiteNoiseMiddleware as BaseWhiteNoiseMiddleware
+
+
+class WhiteNoiseMiddleware(BaseWhiteNoiseMiddleware):
+    """
+    WhiteNoise is sync only, and one sync middleware makes Django run every
+    async view of the request in a thread. This one also has an async path:
+    static files are read in a worker thread and sent as a plain response,
+    everything else goes straight on to the async views.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response = None, *args, **kwargs):
+        super().__init__(get_response, *args, **kwargs)
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def find_static(self, request):
+        if self.autorefresh:
+            return self.find_file(request.path_info)
+        return self.files.get(request.path_info)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        return super().__call__(request)
+
+    async def __acall__(self, request):
+        static_file = self.find_static(request)
+        if static_file is None:
+            return await self.get_response(request)
+        return await sync_to_async(self.serve_buffered, thread_sensitive = False)(static_file, request)
+
+    def serve_buffered(self, static_file, request):
+        # ASGI would otherwise drain the file iterator with a warning on every request
+        streamed = self.serve(static_file, request)
+        try:
+            response = HttpResponse(b''.join(streamed.streaming_content), status = streamed.status_code)
+        finally:
+            streamed.close()
+        for header, value in streamed.items():
+            response[header] = value
+        return response
@@ -3,7 +3,10 @@ from django.urls import path,include
 from django.conf import settings
 from django.conf.urls.static import static
 
+from recipeshare.instrumentation import requestStatsView
+
 urlpatterns = [
+    path('admin/request-stats/', requestStatsView, name = 'request_stats'),
     path('admin/', admin.site.urls),
     path('', include('accounts.urls')),
     path('', include('recipes.urls'))
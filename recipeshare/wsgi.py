@@ -14,3 +14,14 @@ from django.core.wsgi import get_wsgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'recipeshare.settings')
 
 application = get_wsgi_application()
+
+# import every view and build reverse()'s lookup now instead of on the first
+# request, once in the master when gunicorn preloads the app for its workers
+from django.urls import get_resolver  # noqa: E402
+
+get_resolver().reverse_dict
+
+# build the search box's prefix index while the worker waits for its first requests
+from recipes.autocomplete import warm  # noqa: E402
+
+warm()
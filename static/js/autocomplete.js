@@ -0,0 +1,36 @@
+// Typeahead for the search boxes: suggestions from /api/autocomplete/ in a <datalist>
+(function () {
+    var timer = null;
+    var controller = null;
+
+    function suggest(input, list) {
+        var query = input.value.trim();
+        if (!query) {
+            list.innerHTML = '';
+            return;
+        }
+        if (controller) {
+            controller.abort();
+        }
+        controller = new AbortController();
+        fetch('/api/autocomplete/?limit=8&q=' + encodeURIComponent(query), {signal: controller.signal})
+            .then(function (response) { return response.json(); })
+            .then(function (data) {
+                list.innerHTML = '';
+                data.recipes.concat(data.ingredients.map(function (name) { return {title: name}; })).forEach(function (item) {
+                    var option = document.createElement('option');
+                    option.value = item.title;
+                    list.appendChild(option);
+                });
+            })
+            .catch(function () {});
+    }
+
+    document.querySelectorAll('input[data-autocomplete]').forEach(function (input) {
+        var list = document.getElementById(input.getAttribute('list'));
+        input.addEventListener('input', function () {
+            clearTimeout(timer);
+            timer = setTimeout(function () { suggest(input, list); }, 120);
+        });
+    });
+})();
@@ -0,0 +1,15 @@
+// "Load more reviews": fetch the next page fragment and put it where the link was
+(function () {
+    document.addEventListener('click', function (event) {
+        var link = event.target.closest('a[data-load-more]');
+        if (!link) {
+            return;
+        }
+        event.preventDefault();
+        link.classList.add('opacity-50', 'pointer-events-none');
+        fetch(link.href)
+            .then(function (response) { return response.text(); })
+            .then(function (html) { link.outerHTML = html; })
+            .catch(function () { link.classList.remove('opacity-50', 'pointer-events-none'); });
+    });
+})();